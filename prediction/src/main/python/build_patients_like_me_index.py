@@ -0,0 +1,49 @@
+import argparse
+import logging
+import os
+import sys
+
+from models.neighbor_search import NEIGHBOR_BACKENDS
+from models.patients_like_me import PATIENTS_LIKE_ME_INDEX_FILE, PatientsLikeMeIndex, PatientsLikeMeModel
+from run_prediction import apply_settings_from_args
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the patients-like-me neighbor index for a trained_path folder")
+    parser.add_argument("--trained_path", required=True, help="Path to folder that contains trained model + preprocessors")
+    parser.add_argument("--patient_df_path", help="Pickled reference cohort; if omitted, the cohort is read from the database")
+    parser.add_argument("--backend", choices=NEIGHBOR_BACKENDS, help="Neighbor search backend (default: Settings.patients_like_me_backend)")
+    parser.add_argument("--refresh", action="store_true", help="Update the existing index at --output_path for new, changed and removed patients instead of rebuilding it")
+    parser.add_argument("--check", action="store_true", help="Compare the index with a full rebuild from the current cohort and exit 1 if they differ")
+    parser.add_argument("--output_path", help=f"Where to write the index (default: <trained_path>/{PATIENTS_LIKE_ME_INDEX_FILE})")
+    args = parser.parse_args()
+
+    output_path = args.output_path or os.path.join(args.trained_path, PATIENTS_LIKE_ME_INDEX_FILE)
+
+    settings = apply_settings_from_args(args)
+    if args.backend:
+        settings.patients_like_me_backend = args.backend
+    model = PatientsLikeMeModel(settings)
+
+    if args.refresh:
+        model.index = PatientsLikeMeIndex.load(output_path)
+        changes = model.refresh_index()
+        logger.info(f"Refreshed patients-like-me index: {changes}")
+    else:
+        model.index = model.build_index()
+
+    model.index.save(output_path)
+    logger.info(f"Saved patients-like-me index over {model.index.active.sum()} reference patients to {output_path}")
+
+    if args.check:
+        report = model.check_index_consistency()
+        logger.info(f"Consistency with a full rebuild: {report}")
+        if not report["consistent"]:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
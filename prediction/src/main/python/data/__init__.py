@@ -1,3 +1,17 @@
 # src/data/__init__.py
-from .data_processing import DataSplitter, DataPreprocessor
-from .lookups import LookupManager
+import importlib
+
+_exports = {
+    "DataSplitter": ".data_processing",
+    "DataPreprocessor": ".data_processing",
+    "LookupManager": ".lookups",
+    "TransformPlan": ".transform_plan",
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name in _exports:
+        return getattr(importlib.import_module(_exports[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
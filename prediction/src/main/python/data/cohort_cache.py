@@ -0,0 +1,71 @@
+import json
+import os
+import warnings
+
+import pandas as pd
+
+from typing import Any, Callable, Dict, List, Optional
+
+# Outcome columns of both outcomes (see Settings.configure_data_settings), so that OS and PFS runs share a cache file
+OUTCOME_COLUMNS = ["survivalDaysSinceMetastaticDiagnosis", "hadSurvivalEvent", "daysBetweenTreatmentStartAndProgression", "hadProgressionEvent"]
+FINGERPRINT_KEY = b"actin.cohort_fingerprint"
+
+
+class CohortCache:
+    """
+    Uncompressed Feather copy of the reference cohort, holding only `columns`. It is read memory mapped with column
+    projection. The fingerprint of the source the cache was written from is stored in the file's schema metadata,
+    and the cache is rewritten as soon as the fingerprint of the source changes.
+    """
+    def __init__(self, path: str, columns: List[str]) -> None:
+        self.path = path
+        self.columns = columns
+
+    def _schema(self):
+        import pyarrow as pa
+
+        try:
+            with pa.memory_map(self.path) as source:
+                return pa.ipc.open_file(source).schema
+        except (OSError, pa.ArrowInvalid):
+            return None
+
+    def stored_fingerprint(self) -> Optional[Dict[str, Any]]:
+        schema = self._schema()
+        if schema is None or FINGERPRINT_KEY not in (schema.metadata or {}):
+            return None
+        return json.loads(schema.metadata[FINGERPRINT_KEY])
+
+    def read(self, columns: List[str] = None) -> pd.DataFrame:
+        from pyarrow import feather
+
+        return feather.read_table(self.path, columns=columns, memory_map=True).to_pandas()
+
+    def write(self, df: pd.DataFrame, fingerprint: Dict[str, Any]) -> None:
+        import pyarrow as pa
+        from pyarrow import feather
+
+        table = pa.Table.from_pandas(df[[col for col in self.columns if col in df.columns]], preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), FINGERPRINT_KEY: json.dumps(fingerprint)})
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, self.path)
+
+    def load(self, fingerprint: Dict[str, Any], load_source: Callable[[], pd.DataFrame], columns: List[str] = None) -> pd.DataFrame:
+        """The cached cohort restricted to `columns`, after refreshing the cache from `load_source()` if it is stale."""
+        import pyarrow as pa
+
+        columns = columns or self.columns
+        fingerprint = json.loads(json.dumps(dict(fingerprint, columns=self.columns), default=str))
+        if self.stored_fingerprint() != fingerprint:
+            df = load_source()
+            try:
+                self.write(df, fingerprint)
+            except pa.ArrowException as e:
+                warnings.warn(f"Failed to cache the reference cohort at {self.path}: {e}")
+                return df[[col for col in columns if col in df.columns]]
+
+        stored_columns = self._schema().names
+        return self.read([col for col in columns if col in stored_columns])
@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+
+from typing import Any, Dict, List, Tuple
+
+from .lookups import lookup_manager
+from .sql_loader import widen_compact_dtypes
+from .transform_plan import TREATMENT_COL
+
+KNN_COLUMNS = ["whoAssessmentAtMetastaticDiagnosis"]
+BINARY_VALUES = {'0', '1', 0, 1, True, False}
+
+
+def _categorical(values: pd.Series) -> pd.Categorical:
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.array
+    return pd.Categorical(values)
+
+
+def _is_string_column(values: pd.Series) -> bool:
+    return isinstance(values.dtype, pd.CategoricalDtype) or (
+        values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) in ("string", "empty"))
+
+
+def _take(categories_as: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """The per-category values `categories_as` expanded to rows, NaN for missing rows."""
+    return np.append(categories_as.astype(np.float64), np.nan)[codes]
+
+
+def _widen(values: pd.Series) -> pd.Series:
+    return widen_compact_dtypes(values.to_frame())[values.name]
+
+
+def _numeric_column(preprocessor, name: str, values: pd.Series, impute: bool) -> Any:
+    """
+    One feature column after KNN imputation, `numerize` and `auto_cast_object_columns`: a float64 array, a bool array,
+    or a categorical when it stays a string column.
+    """
+    lookup = lookup_manager.lookup_dictionary.get(name)
+
+    if not preprocessor.fit and name in preprocessor.encoded_columns:
+        return _categorical(values)
+
+    if _is_string_column(values) and not impute:
+        categorical = _categorical(values)
+        codes = categorical.codes.astype(np.intp)
+        categories = categorical.categories
+        if lookup is not None:
+            return _take(np.array([lookup.get(value, np.nan) for value in categories], dtype=np.float64), codes)
+        try:
+            return _take(pd.to_numeric(pd.Series(categories, dtype=object), errors='raise').to_numpy(), codes)
+        except Exception:
+            if set(categories).issubset(BINARY_VALUES):
+                return _take(np.asarray(categories, dtype=float), codes)
+        return categorical
+
+    values = _widen(values)
+    if impute:
+        values = preprocessor.impute_knn(values.to_frame(), [name], k=7)[name]
+    if lookup is not None:
+        values = values.map(lookup)
+    if values.dtype == object:
+        try:
+            values = pd.to_numeric(values, errors='raise')
+        except Exception:
+            if set(values.dropna().unique()).issubset(BINARY_VALUES):
+                values = values.astype(float)
+            else:
+                return _categorical(values)
+    return values.to_numpy(dtype=bool if values.dtype == bool else np.float64)
+
+
+def _treatment_columns(preprocessor, treatment: pd.Series) -> Dict[str, np.ndarray]:
+    """`group_treatments` or `add_treatment_drugs` evaluated once per distinct treatment."""
+    categorical = _categorical(treatment)
+    codes = categorical.codes.astype(np.intp)
+    categories = list(categorical.categories) + [None]
+
+    if preprocessor.settings.experiment_type == 'treatment_vs_no':
+        flags = np.array([1 if pd.notnull(x) and str(x).strip() != '' else 0 for x in categories], dtype=np.uint8)
+        return {"treatment": flags[codes]}
+
+    components = pd.DataFrame([preprocessor.parse_treatment(x) for x in categories]).to_numpy(dtype=np.uint8)
+    columns = {name: components[codes, i] for i, name in enumerate(preprocessor.parse_treatment(None))}
+    columns["hasTreatment"] = np.minimum(components.sum(axis=1), 1).astype(np.uint8)[codes]
+    return columns
+
+
+def _label_strings(categorical: pd.Categorical) -> Tuple[List[str], np.ndarray]:
+    """`astype(str)` of the categories, plus "None" for missing rows, with the row codes into that list."""
+    strings = [str(value) for value in categorical.categories] + ["None"]
+    codes = categorical.codes.astype(np.intp)
+    return strings, np.where(codes < 0, len(strings) - 1, codes)
+
+
+def _encode(preprocessor, name: str, categorical: pd.Categorical) -> Dict[str, np.ndarray]:
+    """`encode_categorical` for one column: the label-encoded column, or the one-hot columns that replace it."""
+    encoding = preprocessor.encoded_columns.get(name)
+    observed = categorical.remove_unused_categories()
+
+    if encoding is None and len(observed.categories) + int((observed.codes < 0).any()) == 2:
+        strings, codes = _label_strings(observed)
+        classes = sorted(set(strings[code] for code in np.unique(codes)))
+        encoding = preprocessor.encoded_columns[name] = {"type": "label", "classes": classes}
+
+    if encoding is not None and encoding["type"] == "label":
+        mapping = {label: idx for idx, label in enumerate(encoding["classes"])}
+        strings, codes = _label_strings(categorical)
+        labels = np.array([mapping.get(value, 0) for value in strings])
+        return {name: labels.astype(np.min_scalar_type(labels.max()))[codes]}
+
+    ordered = observed.categories.sort_values()
+    dummies = {f"{name}_{value}": position for position, value in enumerate(observed.categories)}
+    if encoding is None:
+        encoding = preprocessor.encoded_columns[name] = {"type": "onehot", "columns": [f"{name}_{value}" for value in ordered]}
+
+    codes = observed.codes
+    return {col: (codes == dummies[col]).view(np.uint8) if col in dummies else np.zeros(len(codes), dtype=np.uint8)
+            for col in encoding["columns"]}
+
+
+def preprocess_compact(preprocessor, features: List[str], df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str], Dict[str, List[str]]]:
+    """
+    `DataPreprocessor.preprocess_data` built one column at a time into compact arrays, for `Settings.compact_preprocessing`.
+
+    String columns are handled as categoricals, so lookups, treatment parsing and encodings run once per distinct value.
+    Features are stored as float32, treatment, label and one-hot columns as uint8. Rows are selected once per column,
+    and the frame is assembled once, without consolidating the columns into a single block. Medians and the KNN imputer
+    are computed in float64, as in `preprocess_data`, so the fitted state is the same; the scaler is fit on the float32
+    columns, and the resulting matrix equals the one of `preprocess_data` up to float32 precision.
+    """
+    settings = preprocessor.settings
+    outcome_cols = [settings.duration_col, settings.event_col]
+
+    treatment = df[TREATMENT_COL]
+    keep = ~treatment.str.upper().str.contains("NIVOLUMAB", na=False).to_numpy(dtype=bool)
+    keep &= ~np.logical_and.reduce([df[col].isna().to_numpy() for col in lookup_manager.features])
+    rows = np.flatnonzero(keep)
+
+    outcomes = widen_compact_dtypes(df[outcome_cols].iloc[rows])
+    final = np.arange(len(rows))
+    if len(rows) > 1:
+        final = np.flatnonzero(outcomes[settings.duration_col].to_numpy() > 0)
+
+    treatment_mode = settings.experiment_type if settings.experiment_type in ('treatment_vs_no', 'treatment_drug') else None
+    impute = len(rows) > 1 or bool(preprocessor.imputers)
+
+    columns: Dict[str, Any] = {}
+    derived: Dict[str, np.ndarray] = {}
+    for name in features:
+        if treatment_mode is not None and name == TREATMENT_COL:
+            derived = _treatment_columns(preprocessor, treatment.iloc[rows])
+            continue
+        columns[name] = _numeric_column(preprocessor, name, df[name].iloc[rows], impute=impute and name in KNN_COLUMNS)
+    columns.update({col: outcomes[col].to_numpy() for col in outcome_cols})
+    columns.update(derived)
+
+    for name, values in columns.items():
+        if name in outcome_cols:
+            columns[name] = values[final]
+        elif isinstance(values, pd.Categorical):
+            columns[name] = values.take(final)
+        else:
+            if preprocessor.fit:
+                median_value = pd.Series(values).median()
+                preprocessor.medians[name] = median_value
+            else:
+                median_value = preprocessor.medians.get(name, 0)
+            if values.dtype == np.float64:
+                values = np.where(np.isnan(values), median_value, values).astype(np.float32)
+            columns[name] = values[final]
+
+            if preprocessor.encoded_columns.get(name, {}).get("type") == "onehot":
+                columns[name] = pd.Categorical(columns[name])
+
+    dummies: Dict[str, np.ndarray] = {}
+    for name in [name for name, values in columns.items() if isinstance(values, pd.Categorical)]:
+        encoded = _encode(preprocessor, name, columns[name])
+        if name in encoded:
+            columns[name] = encoded[name]
+        else:
+            del columns[name]
+            dummies.update(encoded)
+    columns.update(dummies)
+
+    df = pd.DataFrame(columns, index=df.index[rows[final]], copy=False)
+    updated_features = [col for col in df.columns if col not in outcome_cols]
+
+    if settings.standardize:
+        df = preprocessor.standardize(df, updated_features)
+
+    return df, updated_features, preprocessor.encoded_columns
@@ -3,17 +3,62 @@ import numpy as np
 import pymysql
 import json
 import os
+import copy
 
-from sklearn.impute import KNNImputer
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder, StandardScaler
+from sklearn.preprocessing import StandardScaler
 
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Optional
+import hashlib
 import joblib
 import warnings
+from joblib import Parallel, delayed
 
 from utils.settings import config_settings
+from .cohort_cache import OUTCOME_COLUMNS, CohortCache
+from .compact_preprocessing import preprocess_compact
+from .imputation import NeighborImputer, imputer_configs, load_imputers
 from .lookups import lookup_manager
+from .sql_loader import read_table, widen_compact_dtypes
+from .transform_plan import TransformPlan
+
+def _factorize(values: pd.Series) -> Tuple[np.ndarray, List[Any], int]:
+    """
+    Codes of `values` into its distinct values, so that per-value work runs once per distinct value. The non-missing
+    values come first, sorted as `pd.get_dummies` sorts them, and are followed by the distinct missing values (None and
+    NaN apart, as in `nunique(dropna=False)`). Also returns the number of non-missing values.
+    """
+    codes, uniques = pd.factorize(values, sort=True)
+    uniques = list(uniques)
+    n_present = len(uniques)
+
+    missing = codes < 0
+    if missing.any():
+        missing_values = list(pd.unique(values[missing]))
+        if len(missing_values) == 1:
+            codes[missing] = n_present
+        else:
+            positions = {repr(value): i for i, value in enumerate(missing_values)}
+            codes[missing] = [n_present + positions[repr(value)] for value in values[missing]]
+        uniques += missing_values
+
+    return codes, uniques, n_present
+
+def _transform_chunk(settings, state: Dict[str, Any], features: List[str], df: pd.DataFrame) -> pd.DataFrame:
+    preprocessor = DataPreprocessor(settings, fit=False, preprocessor_path=False, state=copy.deepcopy(state))
+    return preprocessor.preprocess_data(features, df=df)[0]
+
+def _concat_chunks(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenate preprocessed chunks as one frame. A one-hot column is bool in a chunk that has its value and int zeros
+    in one that has not, and bool in the unchunked frame whenever any row has the value.
+    """
+    chunks = [chunk for chunk in chunks if len(chunk)] or chunks[:1]
+    bool_cols = {col for chunk in chunks for col, dtype in chunk.dtypes.items() if dtype == bool}
+    mixed = [col for col in bool_cols if any(col in chunk.columns and chunk[col].dtype != bool for chunk in chunks)]
+    if mixed:
+        chunks = [chunk.astype({col: bool for col in mixed if col in chunk.columns}) for chunk in chunks]
+    return pd.concat(chunks)
 
 class DataSplitter:
     def __init__(self, settings=config_settings, test_size: float=0.1, random_state: int=42) -> None:
@@ -39,7 +84,7 @@ class DataSplitter:
         return X_train, X_test, y_train, y_test
 
 class DataPreprocessor:
-    def __init__(self, settings=config_settings, fit: bool = True, preprocessor_path=True) -> None:
+    def __init__(self, settings=config_settings, fit: bool = True, preprocessor_path=True, state: Dict[str, Any] = None) -> None:
         self.settings = settings
         self.db_config_path = self.settings.db_config_path
         self.db_name = self.settings.db_name
@@ -51,16 +96,24 @@ class DataPreprocessor:
         else:
             self.preprocessor_path = self.settings.save_path
 
-        if not self.fit:
+        if not self.fit and state is not None:
+            self.medians = state.get("medians") or {}
+            self.encoded_columns = state.get("encoded_columns") or {}
+            self.scaler = state.get("scaler")
+            self.imputers = load_imputers(state.get("imputers"))
+
+        elif not self.fit:
             try:
                 with open(f"{self.preprocessor_path}/preprocessing_config.json", "r") as f:
                     config = json.load(f)
                     self.medians = config.get("medians", {})
                     self.encoded_columns = config.get("encoded_columns", {})
+                    self.imputers = load_imputers(config.get("imputers"))
             except Exception as e:
                 warnings.warn(f"Failed to load preprocessing_config.json: {e}")
                 self.medians = {}
                 self.encoded_columns = {}
+                self.imputers = {}
 
             try:
                 self.scaler = joblib.load(f"{self.preprocessor_path}/standard_scaler.pkl", "r")
@@ -72,13 +125,64 @@ class DataPreprocessor:
             self.medians = {}
             self.encoded_columns = {}
             self.scaler = None 
+            self.imputers = {}
+
+        self._transform_plans = {}
 
 
     def preprocess_data(self, features = lookup_manager.features, df = None) -> Tuple[pd.DataFrame, List[str], Dict[str, List[str]]]:
         if df is None:
             df = self.load_data()
 
-        df = df[features + [self.settings.duration_col, self.settings.event_col]]
+        result = self._preprocess(features, df)
+        if self.fit and self.settings.save_models:
+            self.save_state()
+        return result
+
+    def fit_state(self, df: pd.DataFrame = None, features = lookup_manager.features) -> Dict[str, Any]:
+        """
+        Fit the preprocessing on `df` (the cohort of `load_data` by default) and return the fitted state, which
+        `DataPreprocessor(fit=False, state=...)` and `transform` apply. Nothing is written; `save_state` persists it.
+        """
+        if df is None:
+            df = self.load_data()
+
+        self.fit = True
+        self.medians, self.encoded_columns, self.scaler, self.imputers = {}, {}, None, {}
+        self._transform_plans = {}
+        self._preprocess(features, df)
+        return self.state()
+
+    def state(self) -> Dict[str, Any]:
+        return {"medians": self.medians, "encoded_columns": self.encoded_columns, "scaler": self.scaler, "imputers": self.imputers}
+
+    def transform(self, df: pd.DataFrame, features = lookup_manager.features, n_jobs: int = 1,
+                  chunk_size: Optional[int] = None) -> pd.DataFrame:
+        """
+        `df` preprocessed with the fitted state, which is left unchanged; nothing is written. With `chunk_size` or
+        `n_jobs` > 1, the rows are split into chunks that are preprocessed in a process pool of `n_jobs` workers and
+        concatenated in order. Every step applies the state row by row, and encoded columns stay categorical whatever a
+        chunk holds, so the result equals the unchunked one.
+        """
+        state = self.state()
+        if n_jobs == 1 and chunk_size is None:
+            return _transform_chunk(self.settings, state, features, df)
+
+        chunk_size = chunk_size or -(-len(df) // n_jobs)
+        starts = list(range(0, len(df), max(chunk_size, 1)))
+        # preprocess_data only drops negative durations from frames of more than one row
+        if len(starts) > 1 and len(df) - starts[-1] == 1:
+            starts.pop()
+        chunks = [df.iloc[start:end] for start, end in zip(starts, starts[1:] + [len(df)])]
+
+        results = Parallel(n_jobs=n_jobs)(delayed(_transform_chunk)(self.settings, state, features, chunk) for chunk in chunks)
+        return _concat_chunks(results)
+
+    def _preprocess(self, features, df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str], Dict[str, List[str]]]:
+        if self.settings.compact_preprocessing:
+            return preprocess_compact(self, features, df)
+
+        df = widen_compact_dtypes(df[features + [self.settings.duration_col, self.settings.event_col]])
 
         df = df[~df["firstSystemicTreatmentAfterMetastaticDiagnosis"].str.upper().str.contains("NIVOLUMAB", na=False)]
 
@@ -89,7 +193,7 @@ class DataPreprocessor:
         elif self.settings.experiment_type == 'treatment_drug':
             df = self.add_treatment_drugs(df)
 
-        if len(df) > 1:
+        if len(df) > 1 or self.imputers:
             df = self.impute_knn(df, ['whoAssessmentAtMetastaticDiagnosis'], k=7)
         df = self.numerize(df, lookup_manager.lookup_dictionary)
         
@@ -105,23 +209,73 @@ class DataPreprocessor:
        
         return df, updated_features, self.encoded_columns
 
-    def _load_data_from_db(self) -> pd.DataFrame:
-        db_connection = pymysql.connect(
+    def compile_transform(self, features = lookup_manager.features) -> TransformPlan:
+        """
+        `preprocess_data` for one patient record at a time, compiled from this preprocessor's fitted state on first use.
+        """
+        key = tuple(features)
+        if key not in self._transform_plans:
+            self._transform_plans[key] = TransformPlan(self, features)
+        return self._transform_plans[key]
+
+    def _connect(self):
+        return pymysql.connect(
             read_default_file=self.db_config_path,
             read_default_group='RAnalysis',
             db=self.db_name
         )
-    
-        df = pd.read_sql(f"SELECT * FROM {self.settings.view_name}", db_connection)
-    
-        db_connection.close()
+
+    def _load_data_from_db(self) -> pd.DataFrame:
+        db_connection = self._connect()
+        try:
+            columns = lookup_manager.features + OUTCOME_COLUMNS + ["sourceId"]
+            server_side = isinstance(db_connection, pymysql.connections.Connection)
+            df = read_table(db_connection, self.settings.view_name, columns, cursor_class=pymysql.cursors.SSCursor if server_side else None)
+        finally:
+            db_connection.close()
         return df
+
+    def _read_source(self) -> pd.DataFrame:
+        if self.settings.patient_df_path:
+            return pd.read_pickle(self.settings.patient_df_path)
+        return self._load_data_from_db()
+
+    def source_fingerprint(self) -> Dict[str, Any]:
+        """
+        Cheap check of whether the reference data changed: modification time and size of the patient frame, or the row
+        count (and maximum of `settings.reference_update_column`) of the view.
+        """
+        if self.settings.patient_df_path:
+            stat = os.stat(self.settings.patient_df_path)
+            return {"path": os.path.abspath(self.settings.patient_df_path), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+        update_column = self.settings.reference_update_column
+        query = f"SELECT COUNT(*){f', MAX({update_column})' if update_column else ''} FROM {self.settings.view_name}"
+        db_connection = self._connect()
+        try:
+            with db_connection.cursor() as cursor:
+                cursor.execute(query)
+                row = cursor.fetchone()
+        finally:
+            db_connection.close()
+
+        return {"db": self.db_name, "view": self.settings.view_name, "rows": row[0], "max_update": row[1] if update_column else None}
+
+    def cohort_cache(self) -> CohortCache:
+        if self.settings.patient_df_path:
+            path = os.path.abspath(self.settings.patient_df_path)
+            name = f"{os.path.splitext(os.path.basename(path))[0]}-{hashlib.sha256(path.encode('utf-8')).hexdigest()[:8]}"
+        else:
+            name = f"{self.db_name}.{self.settings.view_name}"
+        columns = lookup_manager.features + OUTCOME_COLUMNS + ["sourceId"]
+        return CohortCache(os.path.join(self.settings.cohort_cache_dir, f"{name}.feather"), columns)
  
     def load_data(self) -> pd.DataFrame:
-        if self.settings.patient_df_path:
-            df = pd.read_pickle(self.settings.patient_df_path)
+        if self.settings.cohort_cache_dir:
+            columns = lookup_manager.features + [self.settings.duration_col, self.settings.event_col, "sourceId"]
+            df = self.cohort_cache().load(self.source_fingerprint(), self._read_source, columns=columns)
         else:
-            df = self._load_data_from_db()
+            df = self._read_source()
         
         return df.dropna(subset=[self.settings.duration_col, self.settings.event_col]).copy()
 
@@ -130,9 +284,19 @@ class DataPreprocessor:
         :param df: DataFrame to process.
         :param k: Number of neighbors for KNN imputation.
         :return: Updated DataFrame with imputed values.
+
+        When fitting, the imputer is kept in `self.imputers` and saved with the preprocessing config. A non-fitting
+        preprocessor whose state carries an imputer for these columns reuses it, so that rows are imputed the same way
+        whichever batch they arrive in. See `NeighborImputer` for why fitting is linear in the number of rows.
         """
-        imputer = KNNImputer(n_neighbors=k)
-        df[columns] = imputer.fit_transform(df[columns])
+        key = ",".join(columns)
+        imputer = None if self.fit else self.imputers.get(key)
+
+        if imputer is None:
+            imputer = NeighborImputer(columns, n_neighbors=k).fit(df)
+            if self.fit:
+                self.imputers[key] = imputer
+        df[columns] = imputer.transform(df[columns])
     
         return df
 
@@ -168,9 +332,9 @@ class DataPreprocessor:
         return df
     
     def group_treatments(self, df: pd.DataFrame, treatment_col: str = 'firstSystemicTreatmentAfterMetastaticDiagnosis') -> pd.DataFrame:
-        df['treatment'] = df[treatment_col].apply(
-            lambda x: 1 if pd.notnull(x) and str(x).strip() != '' else 0
-        )
+        codes, treatments, _ = _factorize(df[treatment_col])
+        flags = np.array([1 if pd.notnull(x) and str(x).strip() != '' else 0 for x in treatments], dtype=np.int64)
+        df['treatment'] = flags[codes]
         df = df.drop(columns = [treatment_col])
         
         return df
@@ -209,9 +373,10 @@ class DataPreprocessor:
 
 
     def add_treatment_drugs(self, df: pd.DataFrame, treatment_col: str = "firstSystemicTreatmentAfterMetastaticDiagnosis") -> pd.DataFrame:
-        treatment_components = df[treatment_col].apply(self.parse_treatment)
+        codes, treatments, _ = _factorize(df[treatment_col])
+        components = pd.DataFrame([self.parse_treatment(treatment) for treatment in treatments])
 
-        components_df = pd.DataFrame(treatment_components.tolist(), index=df.index)         
+        components_df = pd.DataFrame(components.to_numpy()[codes], index=df.index, columns=components.columns)
         components_df["hasTreatment"] = components_df.sum(axis=1).clip(upper=1)
 
         df = df.join(components_df)
@@ -221,7 +386,16 @@ class DataPreprocessor:
         return df
     
     def auto_cast_object_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        if not self.fit:
+            # with a fitted state, encoded columns stay categorical whatever a batch holds, e.g. only missing values
+            encoded = [col for col in self.encoded_columns if col in df.columns]
+            df = df.astype({col: object for col in encoded})
+        else:
+            encoded = []
+
         for col in df.select_dtypes(include='object').columns:
+            if col in encoded:
+                continue
             try:
                 df[col] = pd.to_numeric(df[col], errors='raise')
             except Exception:
@@ -242,53 +416,58 @@ class DataPreprocessor:
         categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
         categorical_cols = [col for col in categorical_cols if col not in [self.settings.event_col, self.settings.duration_col]]
 
-          
+
+        dummies = {}
+        onehot_cols = []
         for col in categorical_cols:
+            codes, values, n_present = _factorize(df[col])
             if self.encoded_columns and col in self.encoded_columns:
                 encoding_info = self.encoded_columns[col]
                 if encoding_info["type"] == "label":
                     classes = encoding_info["classes"]
                     mapping = {label: idx for idx, label in enumerate(classes)}
-                    df[col] = df[col].astype(str).map(mapping).fillna(0).astype(int)
-                    
+                    df[col] = np.array([mapping.get(str(value), 0) for value in values], dtype=np.int64)[codes]
 
                 elif encoding_info["type"] == "onehot":
-                    expected_dummies = encoding_info["columns"]
-                    if df[col].isnull().all():
-                        dummies = pd.DataFrame({dummy_col: [0] * len(df) for dummy_col in expected_dummies}, index=df.index)
-                    else:
-                        dummies = pd.get_dummies(df[col], prefix=col, dummy_na=False)
-                        for dummy_col in expected_dummies:
-                            if dummy_col not in dummies.columns:
-                                dummies[dummy_col] = 0
-                        dummies = dummies[expected_dummies]
-
-                    df = pd.concat([df.drop(columns=[col]), dummies], axis=1)
+                    present = {f"{col}_{value}": codes == i for i, value in enumerate(values[:n_present])}
+                    for dummy_col in encoding_info["columns"]:
+                        dummies[dummy_col] = present[dummy_col] if dummy_col in present else np.zeros(len(df), dtype=np.int64)
+                    onehot_cols.append(col)
              
             else:
-                if df[col].nunique(dropna=False) == 2:
-                    le = LabelEncoder()
-                    df[col] = le.fit_transform(df[col].astype(str))
+                if len(values) == 2:
+                    strings = [str(value) for value in values]
+                    classes = sorted(set(strings))
+                    df[col] = np.array([classes.index(string) for string in strings], dtype=np.int64)[codes]
                     self.encoded_columns[col] = {
                         "type": "label",
-                        "classes": le.classes_.tolist()
+                        "classes": classes
                     }
                 else:
-                    dummies = pd.get_dummies(df[col], prefix=col, dummy_na=False)
-                    df = pd.concat([df.drop(columns=[col]), dummies], axis=1)
+                    columns = [f"{col}_{value}" for value in values[:n_present]]
+                    dummies.update({dummy_col: codes == i for i, dummy_col in enumerate(columns)})
+                    onehot_cols.append(col)
                     self.encoded_columns[col] = {
                         "type": "onehot",
-                        "columns": list(dummies.columns)
+                        "columns": columns
                     } 
-              
-        if self.fit and self.settings.save_models:
-            with open(f"{self.settings.save_path}/{self.settings.outcome}_preprocessor/preprocessing_config.json", "w") as f:
-                json.dump({
-                    "medians": self.medians,
-                    "encoded_columns": self.encoded_columns
-                }, f)
+
+        if onehot_cols:
+            df = pd.concat([df.drop(columns=onehot_cols), pd.DataFrame(dummies, index=df.index)], axis=1)
 
         return df
+
+    def save_state(self) -> None:
+        """Write the fitted state to `preprocessing_config.json` and `standard_scaler.pkl`, where `fit=False` loads it from."""
+        path = f"{self.settings.save_path}/{self.settings.outcome}_preprocessor"
+        with open(f"{path}/preprocessing_config.json", "w") as f:
+            json.dump({
+                "medians": self.medians,
+                "encoded_columns": self.encoded_columns,
+                "imputers": imputer_configs(self.imputers)
+            }, f)
+        if self.scaler is not None:
+            joblib.dump(self.scaler, f"{path}/standard_scaler.pkl")
     
     def standardize(self, df: pd.DataFrame, features: List[str]) -> pd.DataFrame:
         if self.fit:
@@ -301,9 +480,6 @@ class DataPreprocessor:
 
             self.scaler = StandardScaler()
             df[cols_to_standardize] = self.scaler.fit_transform(df[cols_to_standardize])
-
-            if self.settings.save_models:
-                joblib.dump(self.scaler, f"{self.settings.save_path}/{self.settings.outcome}_preprocessor/standard_scaler.pkl")
             return df
 
         else:
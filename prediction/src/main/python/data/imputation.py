@@ -0,0 +1,81 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from typing import Any, Dict, List, Optional
+
+
+class NeighborImputer:
+    """
+    Nearest-neighbor imputation of `columns`. It is fitted in linear time and stored as plain values, so it can be
+    persisted with the preprocessing config and applied when serving.
+
+    A row that misses all of `columns` has no coordinates to measure a distance on. `KNNImputer` then fills it with
+    the column means of its fit data, but only after computing distances to every donor; here it gets `fill_values`
+    directly. With the single column `preprocess_data` imputes, every incomplete row is such a row, and the result equals
+    `KNNImputer(n_neighbors)`. A row that misses only some of the columns gets the mean of its `n_neighbors` nearest
+    complete rows, found with a KD tree over the columns it does have.
+    """
+    def __init__(self, columns: List[str], n_neighbors: int = 7, fill_values: Optional[Dict[str, float]] = None,
+                 donors: Optional[np.ndarray] = None) -> None:
+        self.columns = list(columns)
+        self.n_neighbors = n_neighbors
+        self.fill_values = fill_values
+        self.donors = donors
+
+    def fit(self, df: pd.DataFrame) -> "NeighborImputer":
+        values = df[self.columns].to_numpy(dtype=np.float64)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            self.fill_values = dict(zip(self.columns, np.nanmean(values, axis=0).tolist()))
+        self.donors = values[~np.isnan(values).any(axis=1)] if len(self.columns) > 1 else None
+        return self
+
+    def transform(self, df: pd.DataFrame) -> np.ndarray:
+        values = df[self.columns].to_numpy(dtype=np.float64, copy=True)
+        missing = np.isnan(values)
+        if not missing.any():
+            return values
+
+        fill = np.array([self.fill_values[col] for col in self.columns], dtype=np.float64)
+        empty = missing.all(axis=1)
+        values[empty] = fill
+
+        partial = np.flatnonzero(missing.any(axis=1) & ~empty)
+        if len(partial) and (self.donors is None or len(self.donors) == 0):
+            values[partial] = np.where(missing[partial], fill, values[partial])
+        elif len(partial):
+            from sklearn.neighbors import KDTree
+
+            patterns, pattern_of_row = np.unique(missing[partial], axis=0, return_inverse=True)
+            for i, pattern in enumerate(patterns):
+                rows = partial[pattern_of_row.ravel() == i]
+                tree = KDTree(self.donors[:, ~pattern])
+                _, neighbors = tree.query(values[np.ix_(rows, ~pattern)], k=min(self.n_neighbors, len(self.donors)))
+                values[np.ix_(rows, pattern)] = self.donors[:, pattern][neighbors].mean(axis=1)
+        return values
+
+    def to_config(self) -> Dict[str, Any]:
+        return {
+            "columns": self.columns,
+            "n_neighbors": self.n_neighbors,
+            "fill_values": self.fill_values,
+            "donors": self.donors.tolist() if self.donors is not None else None,
+        }
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "NeighborImputer":
+        donors = config.get("donors")
+        return cls(config["columns"], config.get("n_neighbors", 7), config["fill_values"],
+                   np.asarray(donors, dtype=np.float64) if donors is not None else None)
+
+
+def load_imputers(imputers: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """The imputers of a preprocessing state, with stored configs turned back into `NeighborImputer`s."""
+    return {key: NeighborImputer.from_config(imputer) if isinstance(imputer, dict) else imputer
+            for key, imputer in (imputers or {}).items()}
+
+
+def imputer_configs(imputers: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    return {key: imputer.to_config() for key, imputer in imputers.items() if isinstance(imputer, NeighborImputer)}
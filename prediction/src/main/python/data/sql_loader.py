@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+from pandas.api.types import union_categoricals
+from typing import Dict, Iterator, List, Optional
+
+
+def stream_query(connection, query: str, chunk_size: int = 10000, cursor_class=None) -> Iterator[pd.DataFrame]:
+    """
+    Rows of `query` in frames of at most `chunk_size` rows. With a server-side cursor class (pymysql's `SSCursor`) the
+    result set is never held in full on the client.
+    """
+    cursor = connection.cursor(cursor_class) if cursor_class is not None else connection.cursor()
+    try:
+        cursor.execute(query)
+        columns = [description[0] for description in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    finally:
+        cursor.close()
+
+
+def table_columns(connection, table: str) -> List[str]:
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+        columns = [description[0] for description in cursor.description]
+        cursor.fetchall()
+    finally:
+        cursor.close()
+    return columns
+
+
+_KINDS = {"empty": "null", "boolean": "boolean", "string": "string", "integer": "integer", "floating": "float",
+          "mixed-integer-float": "float", "decimal": "float"}
+
+
+def _column_kind(values: pd.Series) -> str:
+    kind = _KINDS.get(pd.api.types.infer_dtype(values, skipna=True), "object")
+    return "float" if kind == "integer" and values.hasnans else kind
+
+
+def _compact_chunk(values: pd.Series, kind: str, float_dtype) -> pd.Series:
+    if kind == "string":
+        return values.astype("category")
+    if kind == "boolean":
+        return values.astype("boolean")
+    if kind == "float":
+        return values.astype(float_dtype)
+    return values
+
+
+def _combine(chunks: List[pd.Series], kinds: List[str], float_dtype) -> pd.Series:
+    present = set(kinds) - {"null"}
+
+    if present <= {"integer"} and "null" not in kinds:
+        return pd.Series(pd.to_numeric(np.concatenate([chunk.values for chunk in chunks]), downcast="integer"))
+    if present <= {"integer", "float"} and present:
+        return pd.Series(np.concatenate([chunk.to_numpy(dtype=float_dtype, na_value=np.nan) for chunk in chunks]))
+    if present == {"boolean"}:
+        return pd.Series(pd.array(np.concatenate([chunk.to_numpy(dtype=object) for chunk in chunks]), dtype="boolean"))
+    if present == {"string"}:
+        categoricals = [chunk.astype("category") if kind != "string" else chunk for chunk, kind in zip(chunks, kinds)]
+        return pd.Series(union_categoricals([categorical.values for categorical in categoricals]))
+    return pd.Series(np.concatenate([chunk.to_numpy(dtype=object) for chunk in chunks]), dtype=object)
+
+
+def read_table(connection, table: str, columns: Optional[List[str]] = None, chunk_size: int = 10000, cursor_class=None,
+               float_dtype=np.float64) -> pd.DataFrame:
+    """
+    `SELECT <columns> FROM <table>`, streamed in chunks of `chunk_size` rows and compacted as each chunk arrives.
+    Strings become categoricals, floats `float_dtype`, booleans the nullable `boolean` dtype. Integer columns
+    without NULLs are downcast to the smallest integer type; with NULLs they become `float_dtype`. Columns in `columns`
+    that the table lacks are left out. `DataPreprocessor.preprocess_data` widens these dtypes back to the ones it expects,
+    which leaves its output unchanged for float64; `float_dtype=np.float32` halves the float columns but rounds them.
+    """
+    available = table_columns(connection, table)
+    selected = available if columns is None else [col for col in columns if col in available]
+    query = f"SELECT {', '.join(f'`{col}`' for col in selected)} FROM {table}"
+
+    chunks: Dict[str, List[pd.Series]] = {col: [] for col in selected}
+    kinds: Dict[str, List[str]] = {col: [] for col in selected}
+    for frame in stream_query(connection, query, chunk_size, cursor_class):
+        for col in selected:
+            kind = _column_kind(frame[col])
+            kinds[col].append(kind)
+            chunks[col].append(_compact_chunk(frame[col], kind, float_dtype))
+
+    if not any(chunks.values()):
+        return pd.DataFrame(columns=selected)
+    # copy=False keeps the combined columns as they are instead of consolidating them into one more copy per dtype
+    return pd.DataFrame({col: _combine(chunks.pop(col), kinds[col], float_dtype) for col in selected}, copy=False)
+
+
+def widen_compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """The dtypes of a plain `pd.read_sql` for the compact columns of `read_table`: object, float64 and int64."""
+    widened = {}
+    for col, dtype in df.dtypes.items():
+        if isinstance(dtype, (pd.CategoricalDtype, pd.BooleanDtype)):
+            if isinstance(dtype, pd.BooleanDtype) and not df[col].hasnans:
+                widened[col] = df[col].astype(bool)
+            else:
+                values = df[col].astype(object)
+                widened[col] = values.where(values.notna(), None)
+        elif pd.api.types.is_float_dtype(dtype) and dtype != np.float64:
+            widened[col] = df[col].astype(np.float64)
+        elif pd.api.types.is_signed_integer_dtype(dtype) and dtype != np.int64:
+            widened[col] = df[col].astype(np.int64)
+    return df.assign(**widened) if widened else df
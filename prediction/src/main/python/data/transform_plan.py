@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from .lookups import lookup_manager
+
+TREATMENT_COL = "firstSystemicTreatmentAfterMetastaticDiagnosis"
+
+
+class _Step(NamedTuple):
+    name: str
+    position: int
+    impute: bool
+    impute_value: float
+    lookup: Optional[Dict[Any, Any]]
+    median: Any
+    labels: Optional[Dict[str, int]]
+    dummies: Optional[Dict[str, int]]
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, (float, np.floating)) and value != value)
+
+
+@lru_cache(maxsize=4096)
+def _to_numeric(value: str) -> Any:
+    try:
+        return pd.to_numeric(value)
+    except (ValueError, TypeError):
+        return value
+
+
+class TransformPlan:
+    """
+    `DataPreprocessor.preprocess_data(fit=False)` for a single patient, compiled from the fitted preprocessing state.
+
+    The medians, lookups, label and one-hot encodings, KNN imputer and scaler are resolved once into per-feature steps
+    that write straight into a numpy vector, in the column order `preprocess_data` produces without the event and
+    duration columns. `transform` returns None when the row needs the full pipeline: when `preprocess_data` would drop it
+    (NIVOLUMAB treatment, all features missing) or when it holds a string the fitted encodings do not know.
+    """
+    def __init__(self, preprocessor, features: List[str] = lookup_manager.features) -> None:
+        settings = preprocessor.settings
+        encoded_columns = preprocessor.encoded_columns
+        outcome_cols = [settings.duration_col, settings.event_col]
+
+        columns = list(features) + outcome_cols
+        self.treatment_mode = settings.experiment_type if TREATMENT_COL in columns else None
+        if self.treatment_mode == "treatment_vs_no":
+            columns.remove(TREATMENT_COL)
+            columns.append("treatment")
+        elif self.treatment_mode == "treatment_drug":
+            self.treatment_components = list(preprocessor.parse_treatment(None))
+            columns.remove(TREATMENT_COL)
+            columns += self.treatment_components + ["hasTreatment"]
+        else:
+            self.treatment_mode = None
+
+        onehot = [col for col in columns if encoded_columns.get(col, {}).get("type") == "onehot" and col not in outcome_cols]
+        for col in onehot:
+            columns.remove(col)
+            columns += encoded_columns[col]["columns"]
+
+        scaler = preprocessor.scaler if settings.standardize else None
+        if settings.standardize:
+            if scaler is None:
+                raise RuntimeError("Cannot compile a transform plan without a pre-fitted StandardScaler")
+            trained_cols = list(scaler.feature_names_in_)
+            columns += [col for col in trained_cols if col not in columns]
+
+        self.columns = [col for col in columns if col not in outcome_cols]
+        positions = {col: i for i, col in enumerate(self.columns)}
+        self.parse_treatment = preprocessor.parse_treatment
+        self._treatment_positions = [positions[col] for col in getattr(self, "treatment_components", [])]
+        self._treatment_flag = positions.get("hasTreatment" if self.treatment_mode == "treatment_drug" else "treatment")
+
+        self._steps = []
+        for name in features:
+            if self.treatment_mode is not None and name == TREATMENT_COL:
+                continue
+            imputer = preprocessor.imputers.get(name)
+            encoding = encoded_columns.get(name, {})
+            self._steps.append(_Step(
+                name=name,
+                position=positions.get(name, -1),
+                impute=imputer is not None,
+                impute_value=imputer.transform(pd.DataFrame({name: [np.nan]}))[0, 0] if imputer is not None else np.nan,
+                lookup=lookup_manager.lookup_dictionary.get(name),
+                median=float(preprocessor.medians.get(name, 0)),
+                labels={label: i for i, label in enumerate(encoding["classes"])} if encoding.get("type") == "label" else None,
+                dummies={col: positions[col] for col in encoding["columns"]} if name in onehot else None,
+            ))
+
+        self._template = np.zeros(len(self.columns))
+        if scaler is not None:
+            self._scaled = np.array([positions[col] for col in trained_cols])
+            self._mean = scaler.mean_ if scaler.with_mean else np.zeros(len(trained_cols))
+            self._scale = scaler.scale_ if scaler.with_std else np.ones(len(trained_cols))
+        else:
+            self._scaled = None
+
+    def transform(self, record: Dict[str, Any], dtype=np.float32) -> Optional[np.ndarray]:
+        treatment = record.get(TREATMENT_COL)
+        if isinstance(treatment, str) and "NIVOLUMAB" in treatment.upper():
+            return None
+        if all(_is_missing(record.get(name)) for name in lookup_manager.features):
+            return None
+
+        out = self._template.copy()
+        if self.treatment_mode == "treatment_drug":
+            components = self.parse_treatment(treatment)
+            for position, value in zip(self._treatment_positions, components.values()):
+                out[position] = value
+            out[self._treatment_flag] = min(sum(components.values()), 1)
+        elif self.treatment_mode == "treatment_vs_no":
+            out[self._treatment_flag] = 1 if pd.notnull(treatment) and str(treatment).strip() != "" else 0
+
+        for name, position, impute, impute_value, lookup, median, labels, dummies in self._steps:
+            value = record.get(name)
+
+            if dummies is not None:
+                if not _is_missing(value):
+                    dummy = dummies.get(f"{name}_{value}")
+                    if dummy is not None:
+                        out[dummy] = 1.0
+                continue
+            if labels is not None:
+                out[position] = labels.get(str(value), 0)
+                continue
+
+            if impute:
+                if isinstance(value, str):
+                    return None
+                value = impute_value if value is None or value != value else float(value)
+
+            if lookup is not None:
+                try:
+                    value = lookup.get(value, np.nan)
+                except TypeError:
+                    return None
+
+            if value is None:
+                value = np.nan
+            elif isinstance(value, str):
+                value = _to_numeric(value)
+
+            if value != value:
+                value = median
+
+            if isinstance(value, str):
+                return None
+            out[position] = value
+
+        if self._scaled is not None:
+            scaled = out[self._scaled]
+            scaled -= self._mean
+            scaled /= self._scale
+            out[self._scaled] = scaled
+
+        return out.astype(dtype, copy=False)
+
+    def transform_frame(self, record: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        """`transform` as a one-row float64 frame, or None when the row needs the full pipeline."""
+        values = self.transform(record, dtype=np.float64)
+        return None if values is None else pd.DataFrame(values[None, :], columns=self.columns)
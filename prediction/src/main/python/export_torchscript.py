@@ -0,0 +1,26 @@
+import argparse
+import logging
+import os
+
+from models.torchscript_model import TORCHSCRIPT_FILE, export_torchscript
+from predictor import load_model
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the NN survival model in a trained_path folder to TorchScript")
+    parser.add_argument("--trained_path", required=True, help="Path to folder that contains trained model + preprocessors")
+    parser.add_argument("--output_path", help=f"Where to write the TorchScript model (default: <trained_path>/{TORCHSCRIPT_FILE})")
+    args = parser.parse_args()
+
+    output_path = args.output_path or os.path.join(args.trained_path, TORCHSCRIPT_FILE)
+
+    model = load_model(args.trained_path)
+    export_torchscript(model, output_path)
+    logger.info(f"Saved TorchScript model to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,32 @@
 # src/models/__init__.py
-from .configs.hyperparameter_grids import curve_param_grids, days_param_grids
-from .configs.load_model_configurations import ExperimentConfig
-from .hyperparameter_optimization import random_parameter_search, hyperparameter_search
-from .model_trainer import ModelTrainer
-from .survival_models import (
-    BaseSurvivalModel, CoxPHModel, RandomSurvivalForestModel,
-    GradientBoostingSurvivalModel, NNSurvivalModel, DeepSurv, LogisticHazardModel,
-    DeepHitModel, PCHazardModel, MTLRModel
-)
+# Submodules are imported on first attribute access, so that importing one model family (or only the predictor) does
+# not pull in torch, pycox, sksurv and the training code for all of them.
+import importlib
+
+_exports = {
+    "curve_param_grids": ".configs.hyperparameter_grids",
+    "days_param_grids": ".configs.hyperparameter_grids",
+    "ExperimentConfig": ".configs.load_model_configurations",
+    "random_parameter_search": ".hyperparameter_optimization",
+    "hyperparameter_search": ".hyperparameter_optimization",
+    "ModelTrainer": ".model_trainer",
+    "BaseSurvivalModel": ".survival_models",
+    "CoxPHModel": ".survival_models",
+    "RandomSurvivalForestModel": ".survival_models",
+    "GradientBoostingSurvivalModel": ".survival_models",
+    "NNSurvivalModel": ".survival_models",
+    "DeepSurv": ".survival_models",
+    "LogisticHazardModel": ".survival_models",
+    "DeepHitModel": ".survival_models",
+    "PCHazardModel": ".survival_models",
+    "MTLRModel": ".survival_models",
+    "SurvivalCurveBatch": ".survival_curves",
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name in _exports:
+        return getattr(importlib.import_module(_exports[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import importlib
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+# Reading the header (medians, encodings, scaler) must not pull in torch; it is imported when the model is built.
+if TYPE_CHECKING:
+    from sklearn.preprocessing import StandardScaler
+    from .survival_models import NNSurvivalModel
+
+MODEL_BUNDLE_FILE = "model.bundle"
+BUNDLE_MAGIC = b"ACTINPMB"
+BUNDLE_VERSION = 1
+BUNDLE_ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct("<8sIIQ")
+
+
+def _align(offset: int) -> int:
+    return -(-offset // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+
+
+def _model_config(model: NNSurvivalModel) -> dict:
+    kwargs = {k: v for k, v in model.kwargs.items() if k != "model_class"}
+
+    attention = getattr(model.net, "attention", None)
+    if attention is not None:
+        kwargs.update({
+            "gate_msi_index": attention.msi_index,
+            "gate_immuno_index": attention.immuno_index,
+            "gate_ras_index": attention.ras_index,
+            "gate_panitumumab_index": attention.panitumumab_index,
+            "treatment_indices": attention.treatment_indices,
+        })
+
+    return {"class": f"{type(model).__module__}.{type(model).__name__}", "kwargs": kwargs}
+
+
+def save_model_bundle(
+    path: str,
+    model: NNSurvivalModel,
+    medians: Optional[Dict[str, float]] = None,
+    encoded_columns: Optional[Dict[str, dict]] = None,
+    scaler: Optional[StandardScaler] = None,
+    tnm_stage_medians: Optional[dict] = None,
+    imputers: Optional[Dict[str, dict]] = None,
+    shap_background: Optional[Tuple[np.ndarray, np.ndarray, List[str]]] = None
+) -> None:
+    """
+    Write everything needed for inference into one file: a JSON header followed by 64-byte aligned raw arrays
+    (net weights, duration index, baseline hazards, scaler statistics, SHAP background) that `ModelBundle` memory-maps.
+    """
+    arrays = {f"net/{name}": tensor.detach().cpu().numpy() for name, tensor in model.model.net.state_dict().items()}
+
+    if getattr(model.model, "duration_index", None) is not None:
+        arrays["duration_index"] = np.asarray(model.model.duration_index)
+    if hasattr(model.model, "baseline_hazards_"):
+        arrays["baseline_hazards/index"] = model.model.baseline_hazards_.index.values
+        arrays["baseline_hazards/values"] = model.model.baseline_hazards_.values
+        arrays["baseline_cumulative_hazards/index"] = model.model.baseline_cumulative_hazards_.index.values
+        arrays["baseline_cumulative_hazards/values"] = model.model.baseline_cumulative_hazards_.values
+
+    header = {
+        "model": _model_config(model),
+        "medians": medians,
+        "encoded_columns": encoded_columns,
+        "tnm_stage_medians": tnm_stage_medians,
+        "imputers": imputers,
+        "scaler": None,
+        "shap_background": None,
+        "arrays": {},
+    }
+
+    if scaler is not None:
+        header["scaler"] = {
+            "feature_names": list(scaler.feature_names_in_),
+            "n_samples_seen": int(np.max(scaler.n_samples_seen_)),
+            "with_mean": scaler.with_mean,
+            "with_std": scaler.with_std,
+        }
+        arrays["scaler/mean"] = scaler.mean_
+        arrays["scaler/var"] = scaler.var_
+        arrays["scaler/scale"] = scaler.scale_
+
+    if shap_background is not None:
+        data, weights, feature_names = shap_background
+        header["shap_background"] = {"feature_names": list(feature_names)}
+        arrays["shap_background/data"] = np.asarray(data, dtype=np.float64)
+        arrays["shap_background/weights"] = np.asarray(weights, dtype=np.float64)
+
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # Array offsets are relative to the data section, which starts at the first aligned boundary after the header.
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _align(offset + array.nbytes)
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _align(_PREAMBLE.size + len(header_bytes))
+
+    with open(path, "wb") as f:
+        f.write(_PREAMBLE.pack(BUNDLE_MAGIC, BUNDLE_VERSION, 0, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + header["arrays"][name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+
+
+class ModelBundle:
+    """
+    Read-only view of a file written by `save_model_bundle`. The file is mapped copy-on-write, so every array is a view
+    into the page cache: loading costs one header parse, and forked workers share the pages until they write to them.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._buffer = np.memmap(path, dtype=np.uint8, mode="c")
+
+        magic, version, _, header_length = _PREAMBLE.unpack(self._buffer[:_PREAMBLE.size].tobytes())
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"{path} is not a model bundle")
+        if version > BUNDLE_VERSION:
+            raise ValueError(f"Model bundle version {version} is newer than the supported version {BUNDLE_VERSION}")
+
+        self.header = json.loads(self._buffer[_PREAMBLE.size:_PREAMBLE.size + header_length].tobytes())
+        self._data_start = _align(_PREAMBLE.size + header_length)
+
+        self.model_config = self.header["model"]
+        self.medians = self.header["medians"]
+        self.encoded_columns = self.header["encoded_columns"]
+        self.tnm_stage_medians = self.header["tnm_stage_medians"]
+        self.imputers = self.header.get("imputers")
+
+    def has_array(self, name: str) -> bool:
+        return name in self.header["arrays"]
+
+    def array(self, name: str) -> np.ndarray:
+        spec = self.header["arrays"][name]
+        dtype = np.dtype(spec["dtype"])
+        start = self._data_start + spec["offset"]
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        return self._buffer[start:start + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+
+    def _series(self, name: str) -> pd.Series:
+        return pd.Series(self.array(f"{name}/values"), index=pd.Index(self.array(f"{name}/index"), name="duration"), copy=False)
+
+    def build_model(self) -> NNSurvivalModel:
+        import torch
+
+        module_name, class_name = self.model_config["class"].rsplit(".", 1)
+        model_class = getattr(importlib.import_module(module_name), class_name)
+        model = model_class(**self.model_config["kwargs"])
+
+        state = {
+            name[len("net/"):]: torch.from_numpy(self.array(name))
+            for name in self.header["arrays"] if name.startswith("net/")
+        }
+        model.model.net.load_state_dict(state, assign=True)
+
+        if self.has_array("duration_index"):
+            cuts = self.array("duration_index")
+            if hasattr(model.model_class, "label_transform"):
+                model.labtrans = model.model_class.label_transform(cuts)
+            model.model.duration_index = cuts
+
+        if self.has_array("baseline_hazards/values"):
+            model.model.baseline_hazards_ = self._series("baseline_hazards")
+            model.model.baseline_cumulative_hazards_ = self._series("baseline_cumulative_hazards")
+
+        model.model.net.eval()
+        return model
+
+    def build_scaler(self) -> Optional[StandardScaler]:
+        config = self.header["scaler"]
+        if config is None:
+            return None
+
+        from sklearn.preprocessing import StandardScaler
+
+        scaler = StandardScaler(with_mean=config["with_mean"], with_std=config["with_std"])
+        scaler.feature_names_in_ = np.array(config["feature_names"], dtype=object)
+        scaler.n_features_in_ = len(config["feature_names"])
+        scaler.n_samples_seen_ = config["n_samples_seen"]
+        scaler.mean_ = self.array("scaler/mean")
+        scaler.var_ = self.array("scaler/var")
+        scaler.scale_ = self.array("scaler/scale")
+        return scaler
+
+    def shap_background(self) -> Optional[Tuple[pd.DataFrame, np.ndarray]]:
+        config = self.header["shap_background"]
+        if config is None:
+            return None
+        background = pd.DataFrame(self.array("shap_background/data"), columns=config["feature_names"], copy=False)
+        return background, self.array("shap_background/weights")
@@ -9,14 +9,45 @@ from sksurv.util import Surv
 
 import torch
 import dill
+import json
 import os
+import tempfile
 
-from typing import List, Dict, Tuple, Any, Optional, Callable
+from typing import List, Dict, Tuple, Any, Optional
 from joblib import Parallel, delayed
 
+from .model_bundle import save_model_bundle
+from .survival_curves import SurvivalCurveBatch
 from .survival_models import BaseSurvivalModel, NNSurvivalModel
+from .torchscript_model import export_torchscript
+from data.data_processing import DataPreprocessor
+from data.imputation import imputer_configs
 from utils.metrics import calculate_time_dependent_c_index, calculate_brier_score, calibration_assessment, calculate_time_dependent_auc
 from utils.settings import config_settings
+from utils.shap_background import SHAP_BACKGROUND_SUFFIX, summarize_background, save_background
+from utils.thread_budget import ThreadBudget
+
+class SharedFoldData:
+    """
+    X and y of cross-validation written once as `.npy` files, which fold workers map read-only, so that each worker
+    receives only these paths and its fold indices. X is stored as one float64 matrix, which all models convert to anyway.
+    """
+    def __init__(self, X: pd.DataFrame, y: np.ndarray, directory: str) -> None:
+        self.columns = X.columns.tolist()
+        self.X_path = os.path.join(directory, "X.npy")
+        self.y_path = os.path.join(directory, "y.npy")
+        np.save(self.X_path, X.to_numpy(dtype=np.float64))
+        np.save(self.y_path, y)
+
+    def load(self) -> Tuple[pd.DataFrame, np.ndarray]:
+        X = pd.DataFrame(np.load(self.X_path, mmap_mode="r"), columns=self.columns, copy=False)
+        return X, np.load(self.y_path, mmap_mode="r")
+
+def _run_fold_on_shared_data(trainer: "ModelTrainer", model_name: str, model_template: BaseSurvivalModel,
+                             fold_indices: Tuple[np.ndarray, np.ndarray], data: SharedFoldData, budget: ThreadBudget) -> Dict[str, float]:
+    X, y = data.load()
+    with budget.limits():
+        return trainer._run_one_fold(model_name, model_template, fold_indices, X, y, None, budget)
 
 class ModelTrainer:
     def __init__(self, models: Dict[str, BaseSurvivalModel], settings = config_settings, random_state: int = 42):
@@ -50,12 +81,17 @@ class ModelTrainer:
    
         return model_class(**kwargs)
     
-    def save_model(self, model: BaseSurvivalModel, model_name: str)-> None:
+    def save_model(self, model: BaseSurvivalModel, model_name: str, X_background: Optional[pd.DataFrame] = None)-> None:
         if not os.path.exists(self.settings.save_path):
             os.makedirs(self.settings.save_path)
             
         model_file = os.path.join(self.settings.save_path, f"{self.settings.outcome}_{model_name}")
 
+        shap_background = None
+        if X_background is not None:
+            data, weights = summarize_background(X_background, self.settings.shap_background_size, self.random_state)
+            shap_background = (data, weights, X_background.columns.tolist())
+
         if isinstance(model, NNSurvivalModel):
          
             state = {'net_state': model.model.net.state_dict()}
@@ -68,9 +104,40 @@ class ModelTrainer:
             torch.save(state, model_file + ".pt")
             print(f"NN Model weights and baseline hazards for {model_name} saved to {model_file}.pt")
 
+            self.save_model_bundle(model, model_file + ".bundle", shap_background)
+            print(f"Model bundle for {model_name} saved to {model_file}.bundle")
+
+            export_torchscript(model, model_file + ".torchscript", self.settings)
+            print(f"TorchScript model for {model_name} saved to {model_file}.torchscript")
+
         else:
             with open(model_file + ".pkl", "wb") as f:
                 dill.dump(model, f)
+
+        if shap_background is not None:
+            save_background(model_file + SHAP_BACKGROUND_SUFFIX, *shap_background)
+            print(f"SHAP background with {len(shap_background[1])} samples for {model_name} saved to {model_file}{SHAP_BACKGROUND_SUFFIX}")
+
+    def save_model_bundle(self, model: NNSurvivalModel, path: str, shap_background: Optional[Tuple[np.ndarray, np.ndarray, List[str]]] = None) -> None:
+        preprocessor_dir = os.path.join(self.settings.save_path, f"{self.settings.outcome}_preprocessor")
+        preprocessor = DataPreprocessor(self.settings, fit=False) if os.path.isdir(preprocessor_dir) else None
+
+        tnm_stage_medians = None
+        tnm_stage_medians_path = os.path.join(self.settings.save_path, "tnm_stage_medians.json")
+        if os.path.exists(tnm_stage_medians_path):
+            with open(tnm_stage_medians_path, "r") as f:
+                tnm_stage_medians = json.load(f)
+
+        save_model_bundle(
+            path,
+            model,
+            medians=preprocessor.medians if preprocessor else None,
+            encoded_columns=preprocessor.encoded_columns if preprocessor else None,
+            scaler=preprocessor.scaler if preprocessor else None,
+            tnm_stage_medians=tnm_stage_medians,
+            imputers=imputer_configs(preprocessor.imputers) if preprocessor else None,
+            shap_background=shap_background
+        )
                 
     @staticmethod
     def _set_attention_indices(model: BaseSurvivalModel, feature_names: List[str]):
@@ -130,7 +197,7 @@ class ModelTrainer:
         self, 
         model: BaseSurvivalModel, 
         model_name: str, 
-        surv_funcs: Optional[List[Callable[[np.ndarray], np.ndarray]]],
+        surv_curves: Optional[SurvivalCurveBatch],
         risk_scores: np.ndarray, 
         X_val: pd.DataFrame, 
         y_val_structured: np.ndarray
@@ -140,10 +207,8 @@ class ModelTrainer:
         min_follow_up = y_val_structured['duration'].min()
         upper_bound = min(self.max_time, max_follow_up)
         
-        if surv_funcs is not None and model_name != 'AalenAdditive':
-            max_times = [fn.x[-1] for fn in surv_funcs]
-            global_max_time = min(max_times)
-            upper_bound = min(upper_bound, global_max_time)
+        if surv_curves is not None and model_name != 'AalenAdditive':
+            upper_bound = min(upper_bound, surv_curves.times[-1])
          
         if upper_bound < 30: 
             times = np.array([upper_bound])
@@ -158,14 +223,14 @@ class ModelTrainer:
     
         times = times[(times > min_follow_up) & (times < max_follow_up)].astype(int)
         
-        if surv_funcs is None:  
+        if surv_curves is None:  
             predictions = risk_scores
             auc_input = -risk_scores
         else:
             if model_name == 'AalenAdditive':
                 predictions = model.predict_survival_function(X_val, times=times)
             else:
-                predictions = np.row_stack([fn(times) for fn in surv_funcs])
+                predictions = surv_curves(times)
             auc_input = -predictions 
 
         return times, predictions, auc_input
@@ -181,9 +246,9 @@ class ModelTrainer:
         results = {}
 
         try:
-            surv_funcs = model.predict_survival_function(X_val)
+            surv_curves = model.predict_survival_function(X_val)
         except AttributeError:
-            surv_funcs = None
+            surv_curves = None
 
         if model_name == 'AalenAdditive':
             durations = y_val_structured['duration']
@@ -192,7 +257,7 @@ class ModelTrainer:
             risk_scores = model.predict(X_val)
 
         times, predictions, auc_input = self._get_survival_metrics(
-            model, model_name, surv_funcs, risk_scores, X_val, y_val_structured
+            model, model_name, surv_curves, risk_scores, X_val, y_val_structured
         )
 
         results['c_index'] = calculate_time_dependent_c_index(predictions, y_val_structured['duration'], y_val_structured['event'], times)
@@ -218,12 +283,15 @@ class ModelTrainer:
         X: pd.DataFrame,
         y: pd.DataFrame,
         encoded_columns: Dict[str, List[str]],
+        budget: Optional[ThreadBudget] = None,
     ) -> Dict[str, float]:
         
         X_tr, y_tr_struct, X_val, y_val_struct, y_val_df = self._prepare_fold_data(X, y, fold_indices)
 
         model = self._initialize_model(model_template, input_size=X.shape[1])
         ModelTrainer._set_attention_indices(model, self.feature_names)
+        if budget is not None:
+            budget.limit_model(model)
 
         if isinstance(model, NNSurvivalModel):
             val_data = (X_val.values.astype('float32'), y_val_struct)
@@ -235,6 +303,34 @@ class ModelTrainer:
         
         return metrics
     
+    def _run_folds(
+        self,
+        model_name: str,
+        model_template: BaseSurvivalModel,
+        folds: List[Tuple[np.ndarray, np.ndarray]],
+        X: pd.DataFrame,
+        y: pd.DataFrame,
+        encoded_columns: Dict[str, List[str]],
+        shared_data: Optional[SharedFoldData] = None,
+        budget: Optional[ThreadBudget] = None,
+    ) -> List[Dict[str, float]]:
+        """
+        Metrics of each fold, run by the fold workers of `budget`. Without `shared_data` the workers are threads, which
+        share the torch and BLAS limits of this process; with it they are processes that each apply the limits.
+        """
+        budget = budget or ThreadBudget.from_settings(self.settings, len(folds))
+        if shared_data is None:
+            with budget.limits():
+                return Parallel(n_jobs=budget.fold_workers, backend="threading", verbose=10)(
+                    delayed(self._run_one_fold)(model_name, model_template, fold_idx, X, y, encoded_columns, budget)
+                    for fold_idx in folds)
+
+        worker = ModelTrainer(models={}, settings=self.settings, random_state=self.random_state)
+        worker.feature_names = self.feature_names
+        return Parallel(n_jobs=budget.fold_workers, backend="loky", verbose=10)(
+            delayed(_run_fold_on_shared_data)(worker, model_name, model_template, fold_idx, shared_data, budget)
+            for fold_idx in folds)
+
     def train_and_evaluate(
         self, 
         X_train:  pd.DataFrame, y_train: pd.DataFrame, 
@@ -243,61 +339,67 @@ class ModelTrainer:
     ) -> Tuple[pd.DataFrame, Dict[str, BaseSurvivalModel]]:
         self.feature_names = X_train.columns.tolist()
         folds = self.cross_validate(X_train, y_train, encoded_columns)
+        budget = ThreadBudget.from_settings(self.settings, len(folds))
+        print(f"thread budget: {budget}")
 
-        for model_name, model_template in self.models.items():
-            print(f"training model: {model_name}")
-            model_metrics = {'cv': {'c_index': [], 'ibs': [], 'ce': [], 'auc': []}}
-
-            cv_fold_results = Parallel(n_jobs=self.settings.n_jobs , backend="threading", verbose=10)(
-                delayed(self._run_one_fold)(
-                    model_name,
-                    model_template,
-                    fold_idx,
-                    X_train,
-                    y_train,
-                    encoded_columns)
-                for fold_idx in folds)
-
-            mean_results = {
-                metric: np.mean([fold[metric] for fold in cv_fold_results])
-                for metric in cv_fold_results[0]
-            }
-            self.results[model_name] = mean_results
-            print(f"{model_name} CV Results: {mean_results}")
+        shared_dir, shared_data = None, None
+        if self.settings.cv_backend == "processes":
+            shared_dir = tempfile.TemporaryDirectory(prefix="cv_folds_")
+            shared_data = SharedFoldData(X_train, y_train, shared_dir.name)
+
+        try:
+            for model_name, model_template in self.models.items():
+                print(f"training model: {model_name}")
+                model_metrics = {'cv': {'c_index': [], 'ibs': [], 'ce': [], 'auc': []}}
+
+                cv_fold_results = self._run_folds(model_name, model_template, folds, X_train, y_train, encoded_columns, shared_data, budget)
+
+                mean_results = {
+                    metric: np.mean([fold[metric] for fold in cv_fold_results])
+                    for metric in cv_fold_results[0]
+                }
+                self.results[model_name] = mean_results
+                print(f"{model_name} CV Results: {mean_results}")
             
-            print("training final model")
-            final_model = self._initialize_model(model_template, input_size=X_train.shape[1])
-            ModelTrainer._set_attention_indices(final_model,
-                                                    self.feature_names)
+                print("training final model")
+                final_model = self._initialize_model(model_template, input_size=X_train.shape[1])
+                ModelTrainer._set_attention_indices(final_model,
+                                                        self.feature_names)
+                final_budget = budget.single_worker()
+                final_budget.limit_model(final_model)
             
-            y_train_df = pd.DataFrame({'duration': y_train[self.settings.duration_col], 'event': y_train[self.settings.event_col]}, index=X_train.index)
-            y_train_structured = Surv.from_dataframe('event', 'duration', y_train_df)
-            y_test_df = pd.DataFrame({'duration': y_test[self.settings.duration_col], 'event': y_test[self.settings.event_col]}, index=X_test.index)
-            y_test_structured = Surv.from_dataframe('event', 'duration', y_test_df)
-
-            if isinstance(final_model, NNSurvivalModel):
-                X_train_final, X_val_final, y_train_final, y_val_final = train_test_split(X_train, y_train_df, test_size=0.1, random_state=self.random_state)
+                y_train_df = pd.DataFrame({'duration': y_train[self.settings.duration_col], 'event': y_train[self.settings.event_col]}, index=X_train.index)
+                y_train_structured = Surv.from_dataframe('event', 'duration', y_train_df)
+                y_test_df = pd.DataFrame({'duration': y_test[self.settings.duration_col], 'event': y_test[self.settings.event_col]}, index=X_test.index)
+                y_test_structured = Surv.from_dataframe('event', 'duration', y_test_df)
+
+                with final_budget.limits():
+                    if isinstance(final_model, NNSurvivalModel):
+                        X_train_final, X_val_final, y_train_final, y_val_final = train_test_split(X_train, y_train_df, test_size=0.1, random_state=self.random_state)
         
-                y_train_structured_final = Surv.from_dataframe('event', 'duration', y_train_final)
-                y_val_structured_final = Surv.from_dataframe('event', 'duration', y_val_final)
-                val_data = (X_val_final.values.astype('float32'), y_val_structured_final)
+                        y_train_structured_final = Surv.from_dataframe('event', 'duration', y_train_final)
+                        y_val_structured_final = Surv.from_dataframe('event', 'duration', y_val_final)
+                        val_data = (X_val_final.values.astype('float32'), y_val_structured_final)
 
-                final_model.fit(X_train_final, y_train_structured_final, val_data=val_data)
-            else:
-                final_model.fit(X_train, y_train_structured)
+                        final_model.fit(X_train_final, y_train_structured_final, val_data=val_data)
+                    else:
+                        final_model.fit(X_train, y_train_structured)
                 
                 
-            holdout_metrics = self._evaluate_model(
-               final_model, X_test, y_train_structured, y_test_structured, model_name
-            )
+                holdout_metrics = self._evaluate_model(
+                   final_model, X_test, y_train_structured, y_test_structured, model_name
+                )
             
-            if self.settings.save_models:
-                self.save_model(final_model, model_name)
+                if self.settings.save_models:
+                    self.save_model(final_model, model_name, X_background=X_train)
                 
-            print(f"{model_name} Hold-Out Results: {holdout_metrics}")
+                print(f"{model_name} Hold-Out Results: {holdout_metrics}")
 
-            self.trained_models[model_name] = final_model
-            self.results[model_name]['holdout'] = holdout_metrics
+                self.trained_models[model_name] = final_model
+                self.results[model_name]['holdout'] = holdout_metrics
+        finally:
+            if shared_dir is not None:
+                shared_dir.cleanup()
 
         return self.results, self.trained_models
 
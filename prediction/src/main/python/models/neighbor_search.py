@@ -0,0 +1,89 @@
+import numpy as np
+
+from sklearn.neighbors import NearestNeighbors
+from typing import Optional, Tuple
+
+NEIGHBOR_BACKENDS = ["brute", "kd_tree", "ball_tree", "projected"]
+
+
+class ProjectedNeighborIndex:
+    """
+    Approximate Euclidean neighbor search for large reference cohorts. Rows are stored once as float32; when
+    `n_components` is set, they are also stored as a Gaussian random projection to `n_components` dimensions.
+    Queries scan the (projected) rows in blocks of `block_size`, so the distance matrix never exceeds
+    n_queries x block_size. The `candidate_factor * k` closest candidates are then re-ranked on the full float32 rows.
+    Without `n_components` the scan is exact.
+    """
+    def __init__(self, n_neighbors: int = 25, metric: str = "euclidean", n_components: Optional[int] = 32,
+                 candidate_factor: int = 32, block_size: int = 65536, random_state: int = 42):
+        if metric != "euclidean":
+            raise ValueError(f"ProjectedNeighborIndex only supports the euclidean metric, not {metric}")
+        self.n_neighbors = n_neighbors
+        self.metric = metric
+        self.n_components = n_components
+        self.candidate_factor = candidate_factor
+        self.block_size = block_size
+        self.random_state = random_state
+
+    def fit(self, X: np.ndarray) -> "ProjectedNeighborIndex":
+        self._X = np.ascontiguousarray(X, dtype=np.float32)
+        self._X_sq = np.einsum("ij,ij->i", self._X, self._X)
+
+        if self.n_components is not None and self.n_components < self._X.shape[1]:
+            rng = np.random.default_rng(self.random_state)
+            projection = rng.normal(size=(self._X.shape[1], self.n_components)) / np.sqrt(self.n_components)
+            self._projection = projection.astype(np.float32)
+            self._P = self._X @ self._projection
+            self._P_sq = np.einsum("ij,ij->i", self._P, self._P)
+        else:
+            self._projection = None
+        return self
+
+    @property
+    def n_samples_fit_(self) -> int:
+        return len(self._X)
+
+    def _blocked_top_k(self, Q: np.ndarray, R: np.ndarray, R_sq: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        Q_sq = np.einsum("ij,ij->i", Q, Q)[:, None]
+        best_d = np.full((len(Q), 0), np.inf, dtype=np.float32)
+        best_i = np.empty((len(Q), 0), dtype=np.int64)
+
+        for start in range(0, len(R), self.block_size):
+            stop = min(start + self.block_size, len(R))
+            d = Q_sq - 2 * (Q @ R[start:stop].T) + R_sq[None, start:stop]
+            d = np.concatenate([best_d, d], axis=1)
+            i = np.concatenate([best_i, np.broadcast_to(np.arange(start, stop), (len(Q), stop - start))], axis=1)
+
+            keep = min(k, d.shape[1])
+            top = np.argpartition(d, keep - 1, axis=1)[:, :keep]
+            best_d = np.take_along_axis(d, top, axis=1)
+            best_i = np.take_along_axis(i, top, axis=1)
+
+        return best_d, best_i
+
+    def kneighbors(self, X: np.ndarray, n_neighbors: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(n_neighbors or self.n_neighbors, len(self._X))
+        Q = np.ascontiguousarray(X, dtype=np.float32)
+
+        if self._projection is None:
+            _, candidates = self._blocked_top_k(Q, self._X, self._X_sq, k)
+        else:
+            _, candidates = self._blocked_top_k(Q @ self._projection, self._P, self._P_sq, k * self.candidate_factor)
+
+        diff = self._X[candidates] - Q[:, None, :]
+        distances = np.sqrt(np.einsum("qcj,qcj->qc", diff, diff))
+
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+
+
+def build_neighbor_index(backend: str = "brute", n_neighbors: int = 25, metric: str = "euclidean", **kwargs):
+    """
+    Unfitted neighbor index with the sklearn `fit` / `kneighbors` interface. `brute`, `kd_tree` and `ball_tree` are
+    exact sklearn searches; `projected` is `ProjectedNeighborIndex`.
+    """
+    if backend in ("brute", "kd_tree", "ball_tree"):
+        return NearestNeighbors(n_neighbors=n_neighbors, metric=metric, algorithm=backend, **kwargs)
+    if backend == "projected":
+        return ProjectedNeighborIndex(n_neighbors=n_neighbors, metric=metric, **kwargs)
+    raise ValueError(f"Unknown neighbor backend {backend}, expected one of {NEIGHBOR_BACKENDS}")
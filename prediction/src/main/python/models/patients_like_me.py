@@ -1,12 +1,109 @@
+import copy
+import hashlib
 import joblib
+import json
+import os
 
-from data.data_processing import DataSplitter, DataPreprocessor
-from sklearn.preprocessing import StandardScaler
-from sklearn.neighbors import NearestNeighbors
+import numpy as np
 import pandas as pd
+
+from data.data_processing import DataPreprocessor
+from data.lookups import lookup_manager
+from sklearn.preprocessing import StandardScaler
+from typing import Any, Dict, List, Tuple
+from utils.artifact_cache import load_artifact
 from utils.settings import Settings
 from utils.treatment_combinations import treatment_combinations
+from .neighbor_search import build_neighbor_index
+
+PATIENTS_LIKE_ME_INDEX_FILE = "patients_like_me_index.joblib"
+
+
+class PatientsLikeMeIndex:
+    """
+    Reference cohort prepared for neighbor queries: the scaled reference matrix, the scaler fitted on it, a neighbor
+    index over its active rows (see `build_neighbor_index`) and the treatment label of every row. Treatments are
+    integer-coded against `treatment_names`, ordered by how common they are in the cohort; rows without a known
+    combination get code -1.
+
+    Indexes built from the raw cohort also keep what `PatientsLikeMeModel.refresh_index` needs: the `sourceId` of every
+    row, a hash of every raw cohort row by `sourceId`, and the preprocessing state the rows were transformed with.
+    Rows of patients that changed or left the cohort are tombstoned by clearing `active`.
+    """
+    def __init__(self, scaler: StandardScaler, knn, treatments: pd.Series, feature_names: List[str], matrix: np.ndarray,
+                 source_ids: np.ndarray = None, row_hashes: pd.Series = None, preprocessing_state: Dict[str, Any] = None,
+                 fingerprint: str = None):
+        self.scaler = scaler
+        self.knn = knn
+        self.treatments = treatments.reset_index(drop=True)
+        self.feature_names = feature_names
+        self.matrix = matrix
+        self.source_ids = source_ids
+        self.row_hashes = row_hashes
+        self.preprocessing_state = preprocessing_state
+        self.fingerprint = fingerprint
+        self.active = np.ones(len(matrix), dtype=bool)
+
+        self.fit_neighbors()
+
+    def _derive(self) -> None:
+        overall_distribution = self.treatments[self.active].value_counts(normalize=True)
+        self.treatment_names = overall_distribution.index.tolist()
+        self.treatment_codes = pd.Categorical(self.treatments, categories=self.treatment_names).codes.astype(np.int64)
+        self.overall_distribution = overall_distribution.values
+        self.positions = np.flatnonzero(self.active)
+
+    def fit_neighbors(self) -> None:
+        self.knn.fit(self.matrix if self.active.all() else self.matrix[self.active])
+        self._derive()
+
+    def kneighbors(self, X: np.ndarray, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Distances to and row positions in `matrix` of the nearest active reference patients."""
+        distances, indices = self.knn.kneighbors(X, n_neighbors=n_neighbors)
+        return distances, self.positions[indices]
+
+    def append(self, matrix: np.ndarray, treatments: pd.Series, source_ids: np.ndarray) -> None:
+        self.matrix = np.concatenate([self.matrix, matrix])
+        self.treatments = pd.concat([self.treatments, treatments], ignore_index=True)
+        self.source_ids = np.concatenate([self.source_ids, source_ids])
+        self.active = np.concatenate([self.active, np.ones(len(matrix), dtype=bool)])
 
+    def compact(self) -> None:
+        """Drop tombstoned rows."""
+        self.matrix = self.matrix[self.active]
+        self.treatments = self.treatments[self.active].reset_index(drop=True)
+        self.source_ids = self.source_ids[self.active]
+        self.active = np.ones(len(self.matrix), dtype=bool)
+
+    def neighbor_distribution(self, indices: np.ndarray) -> np.ndarray:
+        """Treatment proportions among the neighbors in each row of `indices`, shape (n_rows, n_treatments)."""
+        codes = self.treatment_codes[indices]
+        n_rows, n_treatments = len(codes), len(self.treatment_names)
+
+        rows = np.broadcast_to(np.arange(n_rows)[:, None], codes.shape)
+        known = codes >= 0
+        counts = np.bincount(rows[known] * n_treatments + codes[known], minlength=n_rows * n_treatments).reshape(n_rows, n_treatments)
+
+        totals = counts.sum(axis=1, keepdims=True)
+        return np.divide(counts, totals, out=np.zeros(counts.shape), where=totals > 0)
+
+    def __getstate__(self):
+        # Pickle only the fitted parts; the treatment codes are derived again on load.
+        state = self.__dict__.copy()
+        for derived in ("treatment_names", "treatment_codes", "overall_distribution", "positions"):
+            del state[derived]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._derive()
+
+    def save(self, path: str) -> None:
+        joblib.dump(self, path)
+
+    @staticmethod
+    def load(path: str) -> "PatientsLikeMeIndex":
+        return joblib.load(path)
 
 
 class PatientsLikeMeModel:
@@ -30,15 +127,9 @@ class PatientsLikeMeModel:
         # 'hasRasMutation'
     ]
 
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, index: PatientsLikeMeIndex = None):
         self.settings = settings
-
-    def get_treatment_distribution_of_neighbors(self, treatment_df, indices):
-        neighbors_treatments = treatment_df.loc[indices]
-        overall_distribution = treatment_df.value_counts(normalize=True).rename("overallTreatmentProportion")
-        neighbors_distribution = neighbors_treatments.value_counts(normalize=True).rename("similarPatientsTreatmentProportion")
-        return pd.concat([overall_distribution, neighbors_distribution], axis=1)
-        
+        self.index = index
 
     def merge_treatment_columns(self, treatment_matrix: pd.DataFrame):
         mapping_df = pd.DataFrame.from_dict(treatment_combinations, orient="index").reset_index().rename(columns={"index": "treatment"})
@@ -50,29 +141,178 @@ class PatientsLikeMeModel:
         treatments = treatments["treatment"]
         return treatments
 
-    def find_similar_patients(self, patient_data):
+    def preprocessing_fingerprint(self) -> str:
+        """Hash of the feature lookups and settings that decide how raw cohort rows are preprocessed."""
+        config = {
+            "features": lookup_manager.features,
+            "lookups": lookup_manager.lookup_dictionary,
+            "experiment_type": self.settings.experiment_type,
+            "outcome": self.settings.outcome,
+            "standardize": self.settings.standardize,
+        }
+        return hashlib.sha256(json.dumps(config, default=str).encode("utf-8")).hexdigest()
 
-        preprocessor = DataPreprocessor(settings=self.settings, fit=True)
-        df_original = preprocessor.load_data()
-        df, _, _ = preprocessor.preprocess_data()
+    def load_reference_cohort(self) -> pd.DataFrame:
+        return DataPreprocessor(settings=self.settings, fit=True).load_data().reset_index(drop=True)
+
+    @staticmethod
+    def hash_rows(cohort: pd.DataFrame) -> pd.Series:
+        if cohort["sourceId"].duplicated().any():
+            raise ValueError("The reference cohort has duplicate sourceIds")
+        hashes = pd.util.hash_pandas_object(cohort.drop(columns=["sourceId"]), index=False)
+        return pd.Series(hashes.values, index=pd.Index(cohort["sourceId"].values, name="sourceId"))
+
+    def preprocess_rows(self, cohort: pd.DataFrame, preprocessing_state: Dict[str, Any]) -> pd.DataFrame:
+        """Preprocess raw cohort rows with fixed preprocessing state, so that each row comes out the same in any batch."""
+        state = dict(preprocessing_state, encoded_columns=copy.deepcopy(preprocessing_state["encoded_columns"]))
+        preprocessor = DataPreprocessor(settings=self.settings, fit=False, state=state)
+        df, _, _ = preprocessor.preprocess_data(df=cohort)
+        # handle_missing_values only drops non-positive durations from batches of more than one row
+        return df[df[self.settings.duration_col] > 0]
 
-        treatment_df = self.merge_treatment_columns(df[self.exclude])
+    def _make_index(self, df: pd.DataFrame, scaler: StandardScaler = None, **kwargs) -> PatientsLikeMeIndex:
+        treatments = self.merge_treatment_columns(df[self.exclude])
         df = df.drop(columns=self.exclude)
 
-        scaler = StandardScaler()
-        scaled_array = scaler.fit_transform(df)
-        df_scaled = pd.DataFrame(scaled_array, index=df.index, columns=df.columns)
+        if scaler is None:
+            scaler = StandardScaler().fit(df)
+        scaled_array = scaler.transform(df[scaler.feature_names_in_])
 
-        knn = NearestNeighbors(n_neighbors=25, metric="euclidean")
-        knn.fit(df_scaled)
+        knn = build_neighbor_index(
+            self.settings.patients_like_me_backend,
+            n_neighbors=self.settings.patients_like_me_n_neighbors,
+            metric=self.settings.patients_like_me_metric
+        )
+
+        return PatientsLikeMeIndex(scaler, knn, treatments, df.columns.tolist(), scaled_array, **kwargs)
+
+    def build_index(self, df: pd.DataFrame = None) -> PatientsLikeMeIndex:
+        """
+        Index over `df`, an already preprocessed reference cohort. Without `df` the raw cohort is loaded and preprocessed,
+        and the index can later be refreshed incrementally.
+        """
+        if df is None:
+            return self.build_index_from_cohort(self.load_reference_cohort())
+        return self._make_index(df)
+
+    def build_index_from_cohort(self, cohort: pd.DataFrame) -> PatientsLikeMeIndex:
+        preprocessor = DataPreprocessor(settings=self.settings, fit=True)
+        df, _, _ = preprocessor.preprocess_data(df=cohort)
+
+        return self._make_index(
+            df,
+            source_ids=cohort.loc[df.index, "sourceId"].values,
+            row_hashes=self.hash_rows(cohort),
+            preprocessing_state=preprocessor.state(),
+            fingerprint=self.preprocessing_fingerprint()
+        )
+
+    def refresh_index(self, cohort: pd.DataFrame = None, max_tombstone_fraction: float = 0.25) -> Dict[str, int]:
+        """
+        Bring the index up to date with the reference cohort without rebuilding it. Patients are matched on `sourceId`;
+        new and changed patients are preprocessed with the index's preprocessing state and appended, the rows of changed
+        and removed patients are tombstoned. A full rebuild is needed when the feature lookups or preprocessing settings
+        change, which raises a ValueError here.
+        """
+        index = self.load_index(cached=False)
+        if index.preprocessing_state is None:
+            raise ValueError("The patients-like-me index was built from a preprocessed frame and cannot be refreshed")
+        if index.fingerprint != self.preprocessing_fingerprint():
+            raise ValueError("Preprocessing changed since the patients-like-me index was built; rebuild it")
+
+        if cohort is None:
+            cohort = self.load_reference_cohort()
+        row_hashes = self.hash_rows(cohort)
+
+        common = row_hashes.index.intersection(index.row_hashes.index)
+        changed = common[row_hashes[common].values != index.row_hashes[common].values]
+        added = row_hashes.index.difference(index.row_hashes.index)
+        removed = index.row_hashes.index.difference(row_hashes.index)
+
+        stale = index.active & np.isin(index.source_ids, changed.union(removed))
+        index.active[stale] = False
+
+        updated_rows = cohort[cohort["sourceId"].isin(added.union(changed))]
+        if len(updated_rows):
+            df = self.preprocess_rows(updated_rows, index.preprocessing_state)
+            treatments = self.merge_treatment_columns(df[self.exclude])
+            matrix = index.scaler.transform(df[index.feature_names])
+            index.append(matrix, treatments, updated_rows.loc[df.index, "sourceId"].values)
 
-        patient_data.drop(columns=["tumorRegression"], inplace=True)
-        patient_data = patient_data.drop(columns=self.exclude)
+        index.row_hashes = row_hashes
+        if (~index.active).mean() > max_tombstone_fraction:
+            index.compact()
+        index.fit_neighbors()
 
-        scaled_patient_data = scaler.transform(patient_data)
-        scaled_patient_data_df = pd.DataFrame(scaled_patient_data, index=patient_data.index, columns=patient_data.columns)
-        distances, indices = knn.kneighbors(scaled_patient_data_df)
+        return {"added": len(added), "changed": len(changed), "removed": len(removed), "tombstoned": int(stale.sum())}
+
+    def check_index_consistency(self, cohort: pd.DataFrame = None, n_queries: int = 200, atol: float = 1e-6) -> Dict[str, Any]:
+        """
+        Compare the (refreshed) index with a full rebuild from `cohort` using the same preprocessing state and scaler:
+        the same patients must be active with the same scaled rows, and sampled queries must find neighbors at the same
+        distances.
+        """
+        index = self.load_index()
+        if cohort is None:
+            cohort = self.load_reference_cohort()
+
+        df = self.preprocess_rows(cohort, index.preprocessing_state)
+        rebuilt = self._make_index(df, scaler=index.scaler, source_ids=cohort.loc[df.index, "sourceId"].values)
+
+        current = pd.DataFrame(index.matrix[index.active], index=index.source_ids[index.active])
+        expected = pd.DataFrame(rebuilt.matrix, index=rebuilt.source_ids)
+        missing = expected.index.difference(current.index)
+        extra = current.index.difference(expected.index)
+        common = expected.index.intersection(current.index)
+        max_row_difference = float(np.abs(current.loc[common].values - expected.loc[common].values).max(initial=0.0))
+
+        queries = expected.loc[common].values[np.random.default_rng(0).permutation(len(common))[:n_queries]]
+        k = self.settings.patients_like_me_n_neighbors
+        current_distances, _ = index.kneighbors(queries, k)
+        expected_distances, _ = rebuilt.kneighbors(queries, k)
+        max_distance_difference = float(np.abs(current_distances - expected_distances).max(initial=0.0))
+
+        return {
+            "consistent": len(missing) == 0 and len(extra) == 0 and max_row_difference <= atol and max_distance_difference <= atol,
+            "missing": len(missing),
+            "extra": len(extra),
+            "max_row_difference": max_row_difference,
+            "max_distance_difference": max_distance_difference,
+        }
+
+    def load_index(self, cached: bool = True) -> PatientsLikeMeIndex:
+        """
+        The index saved in the trained_path folder if there is one, otherwise one built from the reference cohort.
+        Either way it is kept for later queries. A saved index comes from the process-wide artifact cache unless
+        `cached` is False, which callers that modify the index must pass.
+        """
+        if self.index is None:
+            index_path = os.path.join(self.settings.save_path, PATIENTS_LIKE_ME_INDEX_FILE)
+            if os.path.exists(index_path):
+                self.index = load_artifact(index_path, PatientsLikeMeIndex.load) if cached else PatientsLikeMeIndex.load(index_path)
+            else:
+                self.index = self.build_index()
+        return self.index
+
+    def find_neighbors(self, patient_data: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Distances to and positions of the nearest reference patients, one row per row of `patient_data`."""
+        index = self.load_index()
+
+        patient_data = patient_data.drop(columns=["tumorRegression", *self.exclude], errors="ignore")
+        scaled_patient_data = index.scaler.transform(patient_data)
+        return index.kneighbors(scaled_patient_data, n_neighbors=self.settings.patients_like_me_n_neighbors)
+
+    def treatment_distributions(self, patient_data: pd.DataFrame) -> pd.DataFrame:
+        """Treatment proportions among the similar patients of every row of `patient_data`, one column per treatment."""
+        index = self.load_index()
+        _, indices = self.find_neighbors(patient_data)
+        return pd.DataFrame(index.neighbor_distribution(indices), index=patient_data.index, columns=index.treatment_names)
+
+    def find_similar_patients(self, patient_data):
+        index = self.load_index()
+        similar_distribution = self.treatment_distributions(patient_data).iloc[0]
 
-        treatment_distribution = self.get_treatment_distribution_of_neighbors(treatment_df, indices[0])
-        treatment_distribution = treatment_distribution.fillna(0)
-        return treatment_distribution
+        return pd.DataFrame({
+            "overallTreatmentProportion": index.overall_distribution,
+            "similarPatientsTreatmentProportion": similar_distribution.values
+        }, index=pd.Index(index.treatment_names, name="treatment"))
@@ -0,0 +1,76 @@
+import numpy as np
+
+from typing import Iterator, Union
+
+
+class SurvivalCurve:
+    """
+    One row of a `SurvivalCurveBatch`. Exposes the `x`/`y`/call interface of the per-row scipy/sksurv functions it
+    replaces, as views into the batch.
+    """
+    def __init__(self, batch: "SurvivalCurveBatch", row: int):
+        self._batch = batch
+        self._row = row
+
+    @property
+    def x(self) -> np.ndarray:
+        return self._batch.times
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._batch.values[self._row]
+
+    def __call__(self, times: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        values = self._batch.evaluate(np.atleast_1d(times), rows=self._row)
+        return values[0] if np.ndim(times) == 0 else values
+
+
+class SurvivalCurveBatch:
+    """
+    Survival curves of many rows on one shared time grid: `times` has shape (n_times,) and `values` has shape
+    (n_rows, n_times) in float32. `step=True` evaluates the curves as right-continuous step functions (sksurv models);
+    otherwise they are linearly interpolated and extrapolated (pycox models).
+    """
+    def __init__(self, times: np.ndarray, values: np.ndarray, step: bool = False):
+        self.times = np.asarray(times, dtype=np.float64)
+        self.values = np.asarray(values, dtype=np.float32)
+        self.step = step
+
+        if self.values.ndim != 2 or self.values.shape[1] != len(self.times):
+            raise ValueError(f"Survival values of shape {self.values.shape} do not match {len(self.times)} time points")
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self) -> Iterator[SurvivalCurve]:
+        return (SurvivalCurve(self, row) for row in range(len(self)))
+
+    def __getitem__(self, index) -> Union[SurvivalCurve, "SurvivalCurveBatch"]:
+        if np.isscalar(index):
+            return SurvivalCurve(self, int(index) % len(self))
+        return SurvivalCurveBatch(self.times, self.values[index], self.step)
+
+    def __call__(self, times: Union[float, np.ndarray]) -> np.ndarray:
+        return self.evaluate(np.atleast_1d(times))
+
+    def evaluate(self, times: np.ndarray, rows=slice(None)) -> np.ndarray:
+        """Survival probabilities at `times`, shape (n_rows, len(times)), or (len(times),) for a single row."""
+        times = np.asarray(times, dtype=np.float64)
+        values = self.values[rows]
+
+        if self.step:
+            idx = np.clip(np.searchsorted(self.times, times, side="right") - 1, 0, len(self.times) - 1)
+            return values[..., idx]
+
+        if len(self.times) == 1:
+            return np.repeat(values[..., :1], len(times), axis=-1)
+
+        left = np.clip(np.searchsorted(self.times, times, side="right") - 1, 0, len(self.times) - 2)
+        weight = (times - self.times[left]) / (self.times[left + 1] - self.times[left])
+        return values[..., left] + weight * (values[..., left + 1] - values[..., left])
+
+    def at_nearest(self, times: np.ndarray) -> "SurvivalCurveBatch":
+        """Batch on the grid `times`, taking each curve's value at the nearest grid point."""
+        times = np.asarray(times, dtype=np.float64)
+        nearest = np.abs(self.times[None, :] - times[:, None]).argmin(axis=1)
+        return SurvivalCurveBatch(times, self.values[:, nearest], self.step)
@@ -0,0 +1,96 @@
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from typing import Tuple
+
+
+class CoxPHSurvivalHead(nn.Module):
+    def __init__(self, baseline_cumulative_hazards: np.ndarray):
+        super().__init__()
+        self.register_buffer("baseline_cumulative_hazards", torch.as_tensor(np.asarray(baseline_cumulative_hazards), dtype=torch.float32))
+
+    def forward(self, phi: torch.Tensor) -> torch.Tensor:
+        return torch.exp(-self.baseline_cumulative_hazards.unsqueeze(0) * torch.exp(phi))
+
+
+class LogisticHazardSurvivalHead(nn.Module):
+    def __init__(self, epsilon: float = 1e-7):
+        super().__init__()
+        self.epsilon = epsilon
+
+    def forward(self, phi: torch.Tensor) -> torch.Tensor:
+        return torch.exp(torch.cumsum(torch.log(1 - torch.sigmoid(phi) + self.epsilon), dim=1))
+
+
+class PCHazardSurvivalHead(nn.Module):
+    def __init__(self, sub: int = 1):
+        super().__init__()
+        self.sub = sub
+
+    def forward(self, phi: torch.Tensor) -> torch.Tensor:
+        hazard = F.softplus(phi).repeat_interleave(self.sub, dim=1) / self.sub
+        hazard = torch.cat([torch.zeros_like(hazard[:, :1]), hazard], dim=1)
+        return torch.exp(-torch.cumsum(hazard, dim=1))
+
+
+class PMFSurvivalHead(nn.Module):
+    def __init__(self, reverse_cumsum: bool = False):
+        super().__init__()
+        self.reverse_cumsum = reverse_cumsum
+
+    def forward(self, phi: torch.Tensor) -> torch.Tensor:
+        if self.reverse_cumsum:
+            padded = torch.cat([torch.zeros_like(phi[:, :1]), phi], dim=1)
+            phi = phi.sum(dim=1, keepdim=True) - torch.cumsum(padded, dim=1)[:, :-1]
+        pmf = torch.softmax(torch.cat([phi, torch.zeros_like(phi[:, :1])], dim=1), dim=1)[:, :-1]
+        return 1 - torch.cumsum(pmf, dim=1)
+
+
+def build_survival_head(model) -> Tuple[nn.Module, np.ndarray]:
+    """
+    Return the torch equivalent of the pycox model's `predict_surv_df` post-processing for an NNSurvivalModel,
+    together with the time grid its output columns correspond to.
+    """
+    from pycox.models import CoxPH, LogisticHazard, DeepHitSingle, PCHazard, MTLR
+    from pycox.models.utils import make_subgrid
+
+    pycox_model = model.model
+
+    if isinstance(pycox_model, CoxPH):
+        baseline_cumulative_hazards = pycox_model.baseline_cumulative_hazards_
+        return CoxPHSurvivalHead(baseline_cumulative_hazards.values), baseline_cumulative_hazards.index.values
+    if isinstance(pycox_model, LogisticHazard):
+        return LogisticHazardSurvivalHead(), np.asarray(pycox_model.duration_index)
+    if isinstance(pycox_model, PCHazard):
+        return PCHazardSurvivalHead(pycox_model.sub), np.asarray(make_subgrid(pycox_model.duration_index, pycox_model.sub))
+    if isinstance(pycox_model, MTLR):
+        return PMFSurvivalHead(reverse_cumsum=True), np.asarray(pycox_model.duration_index)
+    if isinstance(pycox_model, DeepHitSingle):
+        return PMFSurvivalHead(), np.asarray(pycox_model.duration_index)
+
+    raise ValueError(f"No survival head available for {type(pycox_model).__name__}")
+
+
+class SurvivalNet(nn.Module):
+    def __init__(self, net: nn.Module, head: nn.Module):
+        super().__init__()
+        self.net = net
+        self.head = head
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.head(self.net(x))
+
+
+class RiskNet(nn.Module):
+    """
+    Differentiable version of NNSurvivalModel.predict: -log S(t_max | x), with S clipped as in predict.
+    """
+    def __init__(self, net: nn.Module, head: nn.Module):
+        super().__init__()
+        self.survival_net = SurvivalNet(net, head)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        surv = self.survival_net(x)
+        return -torch.log(torch.clamp(surv[:, -1], 1e-10, 1.0))
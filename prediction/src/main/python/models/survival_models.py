@@ -7,14 +7,11 @@ import torchtuples as tt
 from sklearn.feature_selection import VarianceThreshold
 from sklearn.model_selection import train_test_split
 
-from sksurv.ensemble import RandomSurvivalForest, GradientBoostingSurvivalAnalysis
-from sksurv.linear_model import CoxPHSurvivalAnalysis
-
 from typing import Dict, Any, Optional, List
 from pycox.models import CoxPH, LogisticHazard, DeepHitSingle, PCHazard, MTLR
-from scipy.interpolate import interp1d
 
 from utils.settings import config_settings
+from .survival_curves import SurvivalCurveBatch
 
 torch.manual_seed(0)
 
@@ -27,7 +24,7 @@ class BaseSurvivalModel:
         
         raise NotImplementedError
 
-    def predict_survival_function(self, X: pd.DataFrame) -> np.ndarray:
+    def predict_survival_function(self, X: pd.DataFrame) -> SurvivalCurveBatch:
     
         raise NotImplementedError
         
@@ -52,6 +49,8 @@ class BaseSurvivalModel:
 class CoxPHModel(BaseSurvivalModel):
     def __init__(self, **kwargs: Dict[str, Any]):
         super().__init__()
+        from sksurv.linear_model import CoxPHSurvivalAnalysis
+
         self.kwargs = kwargs
         self.model = CoxPHSurvivalAnalysis(**self.kwargs)
         self.selected_features = None
@@ -64,8 +63,9 @@ class CoxPHModel(BaseSurvivalModel):
 
         self.model.fit(X, y)
 
-    def predict_survival_function(self, X: pd.DataFrame) -> np.ndarray:
-        return self.model.predict_survival_function(X[self.selected_features])
+    def predict_survival_function(self, X: pd.DataFrame) -> SurvivalCurveBatch:
+        surv = self.model.predict_survival_function(X[self.selected_features], return_array=True)
+        return SurvivalCurveBatch(self.model.unique_times_, surv, step=True)
 
     def predict(self, X: pd.DataFrame) -> np.ndarray:       
         return self.model.predict(X[self.selected_features])
@@ -73,14 +73,17 @@ class CoxPHModel(BaseSurvivalModel):
 class RandomSurvivalForestModel(BaseSurvivalModel):
     def __init__(self, **kwargs: Dict[str, Any]):
         super().__init__()
+        from sksurv.ensemble import RandomSurvivalForest
+
         self.kwargs = kwargs
         self.model = RandomSurvivalForest(n_jobs = config_settings.n_jobs, **self.kwargs)
 
     def fit(self, X: pd.DataFrame, y: pd.DataFrame) -> None:
         self.model.fit(X, y)
         
-    def predict_survival_function(self, X: pd.DataFrame) -> np.ndarray:
-        return self.model.predict_survival_function(X)
+    def predict_survival_function(self, X: pd.DataFrame) -> SurvivalCurveBatch:
+        surv = self.model.predict_survival_function(X, return_array=True)
+        return SurvivalCurveBatch(self.model.unique_times_, surv, step=True)
         
     def predict(self, X: pd.DataFrame) -> np.ndarray:
         return self.model.predict(X)
@@ -88,14 +91,17 @@ class RandomSurvivalForestModel(BaseSurvivalModel):
 class GradientBoostingSurvivalModel(BaseSurvivalModel):
     def __init__(self, **kwargs: Dict[str, Any]):
         super().__init__()
+        from sksurv.ensemble import GradientBoostingSurvivalAnalysis
+
         self.kwargs = kwargs
         self.model = GradientBoostingSurvivalAnalysis(**self.kwargs)
         
     def fit(self, X: pd.DataFrame, y: pd.DataFrame) -> None:
         self.model.fit(X, y)
 
-    def predict_survival_function(self, X: pd.DataFrame) -> np.ndarray:
-        return self.model.predict_survival_function(X)
+    def predict_survival_function(self, X: pd.DataFrame) -> SurvivalCurveBatch:
+        surv = self.model.predict_survival_function(X, return_array=True)
+        return SurvivalCurveBatch(self.model.unique_times_, surv, step=True)
 
     def predict(self, X: pd.DataFrame) -> np.ndarray:
         return self.model.predict(X)
@@ -109,6 +115,8 @@ class FeatureAttention(nn.Module):
         self.ras_index = ras_index
         self.panitumumab_index = panitumumab_index
         self.treatment_indices: List[int] = treatment_indices or []
+        # None follows config_settings.use_gate; export_torchscript fixes it to the exported settings
+        self.use_gate: Optional[bool] = None
         
         self.attn = nn.Sequential(
             nn.Linear(input_size, input_size),
@@ -118,9 +126,9 @@ class FeatureAttention(nn.Module):
         )
 
     def _apply_gate(self, x):
-        if config_settings.use_gate:
+        if config_settings.use_gate if self.use_gate is None else self.use_gate:
             if self.msi_index is not None and self.immuno_index is not None:
-                msi_gate = x[:, self.msi_index].unsqueeze(1)
+                msi_gate = x[:, self.msi_index].unsqueeze(1).clone()
                 x[:, self.immuno_index] *= msi_gate
             if self.ras_index is not None and self.panitumumab_index is not None:
                 ras_gate = 1 - x[:, self.ras_index]
@@ -281,14 +289,15 @@ class NNSurvivalModel(BaseSurvivalModel):
             self.model.compute_baseline_hazards()
 
 
-    def predict_survival_function(self, X: pd.DataFrame, times: np.ndarray = None) -> np.ndarray:
+    def predict_survival_function(self, X: pd.DataFrame, times: np.ndarray = None) -> SurvivalCurveBatch:
         X_tensor = X.values.astype('float32')
         surv = self.model.predict_surv_df(X_tensor)
+        curves = SurvivalCurveBatch(surv.index.values, surv.values.T)
 
         if times is not None:
-            surv = surv.reindex(times, method='nearest', fill_value='extrapolate')
+            curves = curves.at_nearest(times)
 
-        return [interp1d(surv.index.values, surv.iloc[:, i].values, bounds_error=False, fill_value='extrapolate') for i in range(surv.shape[1])]
+        return curves
 
     def predict(self, X: pd.DataFrame) -> np.ndarray:        
         X_tensor = X.values.astype('float32')
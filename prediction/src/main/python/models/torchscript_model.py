@@ -0,0 +1,101 @@
+import copy
+import json
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+
+from typing import Optional, Union
+
+from utils.settings import config_settings
+from .survival_curves import SurvivalCurveBatch
+from .survival_heads import build_survival_head
+
+TORCHSCRIPT_FILE = "model.torchscript"
+METADATA_FILE = "metadata.json"
+
+
+class ExportedSurvivalNet(nn.Module):
+    """
+    Network plus survival head, as traced by `export_torchscript`. `forward` maps features to S(t) on the exported time
+    grid. `gate` exposes the attention input gate so callers can tell which inputs the network treats as identical.
+    """
+    def __init__(self, net: nn.Module, head: nn.Module):
+        super().__init__()
+        self.net = net
+        self.head = head
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.head(self.net(x.clone()))
+
+    def gate(self, x: torch.Tensor) -> torch.Tensor:
+        attention = getattr(self.net, "attention", None)
+        if attention is None:
+            return x.clone()
+        return attention._apply_gate(x.clone())
+
+
+def export_torchscript(model, path: str, settings = config_settings) -> None:
+    """
+    Trace the network of a fitted NNSurvivalModel together with its pycox survival post-processing into a TorchScript
+    file. The attention gate is traced on or off as `settings.use_gate` says, on a copy of the network, and recorded
+    in the file's metadata.
+    """
+    head, times = build_survival_head(model)
+    net = copy.deepcopy(model.net)
+    if hasattr(net, "attention"):
+        net.attention.use_gate = settings.use_gate
+    module = ExportedSurvivalNet(net, head).eval()
+    example = torch.zeros(2, model.input_size)
+
+    with torch.no_grad():
+        traced = torch.jit.trace_module(module, {"forward": example, "gate": example})
+
+    metadata = {
+        "class": f"{type(model).__module__}.{type(model).__name__}",
+        "input_size": model.input_size,
+        "times": np.asarray(times).tolist(),
+        "use_gate": settings.use_gate,
+    }
+    torch.jit.save(traced, path, _extra_files={METADATA_FILE: json.dumps(metadata)})
+
+
+class TorchScriptSurvivalModel:
+    """
+    Inference-only stand-in for an NNSurvivalModel loaded from an `export_torchscript` artifact: numpy in, numpy out,
+    without pandas, torchtuples or an optimizer.
+    """
+    def __init__(self, path: str) -> None:
+        extra_files = {METADATA_FILE: ""}
+        self.module = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+        self.module.eval()
+
+        metadata = json.loads(extra_files[METADATA_FILE])
+        self.model_class = metadata["class"]
+        self.input_size = metadata["input_size"]
+        self.times = np.asarray(metadata["times"])
+        # files exported before the gate setting was recorded have no "use_gate"
+        self.use_gate: Optional[bool] = metadata.get("use_gate")
+        self.use_attention = hasattr(self.module.net, "attention")
+
+    @staticmethod
+    def _to_tensor(X: Union[pd.DataFrame, np.ndarray]) -> torch.Tensor:
+        X = X.values if isinstance(X, pd.DataFrame) else X
+        return torch.from_numpy(np.ascontiguousarray(X, dtype=np.float32))
+
+    def survival(self, X: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        with torch.inference_mode():
+            return self.module(self._to_tensor(X)).numpy()
+
+    def apply_gate(self, X: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        with torch.inference_mode():
+            return self.module.gate(self._to_tensor(X)).numpy()
+
+    def predict_survival_function(self, X: Union[pd.DataFrame, np.ndarray], times: np.ndarray = None) -> SurvivalCurveBatch:
+        curves = SurvivalCurveBatch(self.times, self.survival(X))
+        return curves if times is None else curves.at_nearest(times)
+
+    def predict(self, X: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        surv_at_time = np.clip(self.survival(X)[:, -1], 1e-10, 1.0)
+        return -np.log(surv_at_time)
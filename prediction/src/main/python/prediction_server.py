@@ -0,0 +1,64 @@
+import json
+import logging
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+
+    def _send_json(self, status: int, body: dict) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {})
+
+    def do_POST(self) -> None:
+        if self.path != "/predict":
+            self._send_json(404, {})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            patient_data = json.loads(self.rfile.read(length))
+        except Exception as e:
+            logger.error(f"Failed to parse request body: {e}")
+            self._send_json(400, {})
+            return
+
+        try:
+            personalized_result = self.server.service.predict(patient_data)
+        except Exception as e:
+            logger.error(f"Prediction failed: {e}")
+            self._send_json(500, {})
+            return
+
+        self._send_json(200, personalized_result)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.info(f"{self.address_string()} - {format % args}")
+
+
+def serve(service, host: str = "127.0.0.1", port: int = 8080) -> None:
+    """
+    Answer POST /predict requests (body: one ACTIN patient record) with the same JSON that run_prediction.py writes,
+    reusing the model, preprocessor and SHAP explainer that `service` loaded at startup.
+    """
+    server = HTTPServer((host, port), PredictionRequestHandler)
+    server.service = service
+    logger.info(f"Serving predictions on http://{host}:{port}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down prediction server")
+    finally:
+        server.server_close()
@@ -1,19 +1,30 @@
+from __future__ import annotations
+
+import copy
 import importlib
 import json
 import logging
 import os
 import pandas as pd
 import numpy as np
-import torch
-import shap
 import re
 
-from data.data_processing import DataPreprocessor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, List, Optional
+
 from data.lookups import lookup_manager
-from models import *
-from models.patients_like_me import PatientsLikeMeModel
+from utils.artifact_cache import load_artifact, read_json
 from utils.settings import Settings
 from utils.feature_translation import feature_short_names
+from utils.shap_background import find_background, load_background
+
+# torch, shap, sksurv and pycox take seconds to import; they are imported where first needed, so that argument errors
+# and unreadable inputs fail fast and a model only loads the libraries of its own family.
+if TYPE_CHECKING:
+    from data.data_processing import DataPreprocessor
+    from models.explainers import Explanation
+    from models.model_bundle import ModelBundle
+    from models.patients_like_me import PatientsLikeMeModel
 
 logger = logging.getLogger(__name__)
 
@@ -38,7 +49,26 @@ MALIGNANCY_ICD_CODES = {
 
 ALL_SPECIFIED_ICD_CODES = set(code for codes in MALIGNANCY_ICD_CODES.values() for code in codes)
 
+def load_model_bundle(trained_path: str) -> Optional[ModelBundle]:
+    from models.model_bundle import MODEL_BUNDLE_FILE, ModelBundle
+
+    bundle_path = os.path.join(trained_path, MODEL_BUNDLE_FILE)
+    if not os.path.exists(bundle_path):
+        return None
+    return load_artifact(bundle_path, ModelBundle)
+
 def load_model(trained_path: str) -> any:
+    from models.torchscript_model import TORCHSCRIPT_FILE, TorchScriptSurvivalModel
+
+    torchscript_path = os.path.join(trained_path, TORCHSCRIPT_FILE)
+    if os.path.exists(torchscript_path):
+        logger.info(f"Loading TorchScript model from {torchscript_path}")
+        return load_artifact(torchscript_path, TorchScriptSurvivalModel)
+
+    bundle = load_model_bundle(trained_path)
+    if bundle is not None:
+        logger.info(f"Loading model from bundle {bundle.path}")
+        return bundle.build_model()
 
     config_path = os.path.join(trained_path, "model_config.json")
     with open(config_path, "r") as f:
@@ -52,6 +82,8 @@ def load_model(trained_path: str) -> any:
     model_class = getattr(module, class_name)
     model = model_class(**kwargs)
 
+    import torch
+
     state_path = os.path.join(trained_path, "model.pt")
     state = torch.load(state_path, map_location=torch.device("cpu"), weights_only=False)
 
@@ -70,7 +102,10 @@ def load_model(trained_path: str) -> any:
     return model
 
 
-def load_patient_df(patient, tnm_stage_medians, settings: Settings) -> pd.DataFrame:
+def build_patient_record(patient, tnm_stage_medians, settings: Settings) -> dict:
+    return _build_patient_record(patient, settings, lambda stage: get_tnm_values(tnm_stage_medians, stage), get_comorbidity_dict)
+
+def _build_patient_record(patient, settings: Settings, tnm_values_for_stage: Callable[[str], dict], comorbidity_flags: Callable[[list], dict]) -> dict:
     tumor = patient.get("tumor", {})
     clinical_status = patient.get("clinicalStatus", {})
     comorbidities = patient.get("comorbidities", [])
@@ -79,8 +114,8 @@ def load_patient_df(patient, tnm_stage_medians, settings: Settings) -> pd.DataFr
     birth_year = patient.get("patient", {}).get("birthYear")
     stage = tumor.get("stage")
 
-    tnm_values = get_tnm_values(tnm_stage_medians, stage)
-    comorbidity_dict = get_comorbidity_dict(comorbidities)
+    tnm_values = tnm_values_for_stage(stage)
+    comorbidity_dict = comorbidity_flags(comorbidities)
 
     has_other_malignancy = any(
         icd.get("mainCode", "") not in ALL_SPECIFIED_ICD_CODES
@@ -123,52 +158,182 @@ def load_patient_df(patient, tnm_stage_medians, settings: Settings) -> pd.DataFr
     }
     
     features = lookup_manager.features + [settings.event_col, settings.duration_col]
-    patient_dict = {key: patient_dict.get(key, None) for key in features}
-    
-    return pd.DataFrame([patient_dict])
-
-def build_shap_explainer(model, shap_samples_path) -> shap.Explainer:
-    X_samples = pd.read_csv(shap_samples_path)
-    X_samples = X_samples.astype(np.float64).fillna(0.0)
-    logger.info(f"Loaded SHAP samples from {shap_samples_path} with shape {X_samples.shape}")
+    return {key: patient_dict.get(key, None) for key in features}
 
-    explainer = shap.Explainer(model.predict, X_samples)
-    logger.info(f"Created SHAP explainer with {X_samples.shape[0]} samples")
+def load_patient_df(patient, tnm_stage_medians, settings: Settings) -> pd.DataFrame:
+    return pd.DataFrame([build_patient_record(patient, tnm_stage_medians, settings)])
+
+class PatientRecordConverter:
+    """
+    `build_patient_record` for many patients against one set of TNM stage medians. The TNM values of every stage the
+    medians can resolve are computed once, and the comorbidity flags come from an ICD prefix index instead of
+    matching every code against every prefix list.
+    """
+    def __init__(self, tnm_stage_medians: dict, settings: Settings) -> None:
+        self.settings = settings
+        self.columns = lookup_manager.features + [settings.event_col, settings.duration_col]
+
+        stages = set()
+        for stage_type in ["clinical", "pathological"]:
+            for stage in tnm_stage_medians.get(stage_type, {}):
+                norm_stage = str(stage).strip().upper()
+                stages.add(norm_stage)
+                if norm_stage[-1:] in ("A", "B", "C"):
+                    stages.add(norm_stage[:-1])
+        self.stage_table = {stage: get_tnm_values(tnm_stage_medians, stage) for stage in stages}
+        self.unknown_stage = get_tnm_values({}, None)
+
+        self.icd_prefixes = {}
+        for feature, codes in MALIGNANCY_ICD_CODES.items():
+            for code in codes:
+                self.icd_prefixes.setdefault(len(code), {}).setdefault(code, []).append(feature)
+
+    def tnm_values(self, stage) -> dict:
+        return self.stage_table.get(str(stage).strip().upper(), self.unknown_stage)
+
+    def comorbidity_flags(self, comorbidities) -> dict:
+        flags = dict.fromkeys(MALIGNANCY_ICD_CODES, False)
+        for c in comorbidities:
+            for icd in c.get("icdCodes", []):
+                main_code = icd.get("mainCode", "")
+                for length, prefixes in self.icd_prefixes.items():
+                    for feature in prefixes.get(main_code[:length], ()):
+                        flags[feature] = True
+        return flags
+
+    def record(self, patient) -> dict:
+        return _build_patient_record(patient, self.settings, self.tnm_values, self.comorbidity_flags)
+
+    def to_frame(self, patients) -> pd.DataFrame:
+        """One row per patient, matching `load_patient_df` row by row."""
+        records = [self.record(patient) for patient in patients]
+        return pd.DataFrame({column: [record[column] for record in records] for column in self.columns}, columns=self.columns)
+
+def load_patients_df(patients, tnm_stage_medians, settings: Settings) -> pd.DataFrame:
+    return PatientRecordConverter(tnm_stage_medians, settings).to_frame(patients)
+
+def served_model_name(model) -> str:
+    """The name `ModelTrainer.save_model` saves the files of `model` under: its class, with "_attention" if it has one."""
+    # a TorchScriptSurvivalModel records the class path of the model it was exported from
+    class_path = model.model_class if isinstance(getattr(model, "model_class", None), str) else type(model).__name__
+    use_attention = getattr(model, "use_attention", None) or getattr(model, "kwargs", {}).get("use_attention", False)
+    return class_path.rsplit(".", 1)[-1] + ("_attention" if use_attention else "")
+
+def build_shap_explainer(model, shap_samples_path, trained_path: str = None) -> Callable[[pd.DataFrame], Explanation]:
+    bundle = load_model_bundle(trained_path) if trained_path else None
+    bundle_background = bundle.shap_background() if bundle is not None else None
+    background_path = None
+    if trained_path and bundle_background is None:
+        background_path = find_background(trained_path, served_model_name(model))
+
+    if bundle_background is not None:
+        X_samples, weights = bundle_background
+        logger.info(f"Loaded SHAP background from bundle {bundle.path} with {len(weights)} samples")
+    elif background_path:
+        X_samples, weights = load_artifact(background_path, load_background)
+        logger.info(f"Loaded SHAP background from {background_path} with {len(weights)} samples")
+    else:
+        X_samples = pd.read_csv(shap_samples_path)
+        X_samples = X_samples.astype(np.float64).fillna(0.0)
+        logger.info(f"Loaded SHAP samples from {shap_samples_path} with shape {X_samples.shape}")
+        import shap
+        X_samples, weights = shap.utils.sample(X_samples, 100), None
+
+    from models.explainers import build_explainer
+    explainer = build_explainer(model, X_samples, weights)
+    logger.info(f"Created {type(explainer).__name__} with {X_samples.shape[0]} background samples")
 
     return explainer
 
-def get_shap_values(explainer: shap.Explainer, X: pd.DataFrame):
+def get_shap_values(explainer: Callable[[pd.DataFrame], Explanation], X: pd.DataFrame) -> List[dict]:
 
     X = X.astype(np.float64).fillna(0.0)
 
     shap_values = explainer(X)
     logger.info(f"Computed SHAP values with shape {shap_values.shape}")
-    shap.plots.bar(shap_values[0])
 
-    result_dict = {
-        feature_short_names.get(shap_values.feature_names[j], shap_values.feature_names[j]): {
-            "featureValue": shap_values.data[0][j],
-            "shapValue": shap_values.values[0][j]
+    feature_names = [feature_short_names.get(name, name) for name in shap_values.feature_names]
+    return [
+        {
+            feature_names[j]: {
+                "featureValue": shap_values.data[i][j],
+                "shapValue": shap_values.values[i][j]
+            }
+            for j in range(len(feature_names))
         }
-        for j in range(len(shap_values.feature_names))
-    }
-    return result_dict
+        for i in range(shap_values.shape[0])
+    ]
+
+
+def load_tnm_stage_medians(trained_path: str) -> dict:
+    bundle = load_model_bundle(trained_path)
+    if bundle is not None and bundle.tnm_stage_medians is not None:
+        return bundle.tnm_stage_medians
+
+    return load_artifact(os.path.join(trained_path, "tnm_stage_medians.json"), read_json)
 
+def load_preprocessor(trained_path: str, settings: Settings) -> DataPreprocessor:
+    from data.data_processing import DataPreprocessor
 
-def convert_patient_dict_to_processed_df(patient_data: dict, trained_path, settings: Settings):
-    with open(f"{trained_path}/tnm_stage_medians.json", "r") as f:
-        tnm_stage_medians = json.load(f)
-    patient_df = load_patient_df(patient_data, tnm_stage_medians, settings)
+    bundle = load_model_bundle(trained_path)
+    scaler = bundle.build_scaler() if bundle is not None else None
+    if scaler is not None:
+        state = {"medians": bundle.medians, "encoded_columns": copy.deepcopy(bundle.encoded_columns), "scaler": scaler,
+                 "imputers": bundle.imputers}
+        return DataPreprocessor(settings, fit=False, preprocessor_path=False, state=state)
 
-    preprocessor = DataPreprocessor(settings, fit=False, preprocessor_path=False)
-    processed_df, updated_features, _ = preprocessor.preprocess_data(df=patient_df)
+    config_path = os.path.join(settings.save_path, "preprocessing_config.json")
+    scaler_path = os.path.join(settings.save_path, "standard_scaler.pkl")
+    if os.path.exists(config_path) and os.path.exists(scaler_path):
+        import joblib
+
+        config = load_artifact(config_path, read_json)
+        state = {
+            "medians": config.get("medians", {}),
+            "encoded_columns": copy.deepcopy(config.get("encoded_columns", {})),
+            "scaler": load_artifact(scaler_path, joblib.load),
+            "imputers": config.get("imputers", {}),
+        }
+        return DataPreprocessor(settings, fit=False, preprocessor_path=False, state=state)
+
+    return DataPreprocessor(settings, fit=False, preprocessor_path=False)
+
+def convert_patient_dict_to_processed_df(patient_data: dict, trained_path, settings: Settings, preprocessor: DataPreprocessor = None, tnm_stage_medians: dict = None,
+                                         record_converter: PatientRecordConverter = None):
+    if record_converter is not None:
+        record = record_converter.record(patient_data)
+    else:
+        if tnm_stage_medians is None:
+            tnm_stage_medians = load_tnm_stage_medians(trained_path)
+        record = build_patient_record(patient_data, tnm_stage_medians, settings)
+
+    if preprocessor is None:
+        preprocessor = load_preprocessor(trained_path, settings)
+    processed_df = preprocessor.compile_transform().transform_frame(record)
+    if processed_df is None:
+        processed_df, updated_features, _ = preprocessor.preprocess_data(df=pd.DataFrame([record]))
 
     return processed_df
 
-def get_patient_like_me(patient_data: dict, trained_path, settings: Settings):
-    model = PatientsLikeMeModel(settings)
-    processed_df = convert_patient_dict_to_processed_df(patient_data, trained_path, settings)
-    treatment_distribution_df = model.find_similar_patients(processed_df)
+@dataclass
+class RequestContext:
+    """One patient record, parsed and preprocessed once and shared by everything computed for the request."""
+    patient_data: dict
+    processed_df: pd.DataFrame
+
+def build_request_context(patient_data: dict, trained_path, settings: Settings, preprocessor: DataPreprocessor = None, tnm_stage_medians: dict = None,
+                          record_converter: PatientRecordConverter = None) -> RequestContext:
+    processed_df = convert_patient_dict_to_processed_df(patient_data, trained_path, settings, preprocessor, tnm_stage_medians, record_converter)
+    return RequestContext(patient_data=patient_data, processed_df=processed_df)
+
+def get_patient_like_me(patient_data: dict, trained_path, settings: Settings, model: PatientsLikeMeModel = None, preprocessor: DataPreprocessor = None, tnm_stage_medians: dict = None,
+                        context: RequestContext = None):
+    if model is None:
+        from models.patients_like_me import PatientsLikeMeModel
+        model = PatientsLikeMeModel(settings)
+    if context is None:
+        context = build_request_context(patient_data, trained_path, settings, preprocessor, tnm_stage_medians)
+    treatment_distribution_df = model.find_similar_patients(context.processed_df)
 
     def process_treatment_distribution(d: dict):
         return [{"treatment": k, "proportion": v} for k, v in d.items()]
@@ -178,39 +343,118 @@ def get_patient_like_me(patient_data: dict, trained_path, settings: Settings):
     }
 
 
-def predict_treatment_scenarios(patient_data: dict, trained_path: str, shap_samples_path: str, valid_treatment_combinations: dict, settings: Settings) -> list:
-    
-    processed_df = convert_patient_dict_to_processed_df(patient_data, trained_path, settings)
+def build_treatment_scenarios(X_base: pd.DataFrame, valid_treatment_combinations: dict) -> pd.DataFrame:
+    labels = list(valid_treatment_combinations.keys())
+    X_scenarios = X_base.iloc[[0] * len(labels)].reset_index(drop=True)
+    X_scenarios.index = labels
 
-    model = load_model(trained_path)
+    mapping_df = pd.DataFrame.from_dict(valid_treatment_combinations, orient="index").reindex(labels)
+    for col in mapping_df.columns:
+        if col in X_scenarios.columns:
+            X_scenarios[col] = mapping_df[col].fillna(X_scenarios[col]).values
 
-    X_base = processed_df.drop(columns=[c for c in [settings.event_col, settings.duration_col, "sourceId"] if c in processed_df.columns], errors="ignore")
+    treatment_cols = [c for c in X_scenarios.columns if c.startswith("systemicTreatmentPlan")]
+    X_scenarios["hasTreatment"] = (X_scenarios[treatment_cols].sum(axis=1) > 0).astype(int)
 
-    treatment_cols = [c for c in X_base.columns if c.startswith("systemicTreatmentPlan")]
+    return X_scenarios
 
-    shap_explainer = build_shap_explainer(model, shap_samples_path)
+def apply_input_gate(model, X: np.ndarray) -> np.ndarray:
+    if hasattr(model, "apply_gate"):
+        return model.apply_gate(X)
 
-    survival_prediction = []
-    for idx, (label, mapping) in enumerate(valid_treatment_combinations.items()):
-        for col, val in mapping.items():
-            if col in X_base.columns:
-                X_base[col] = val
+    attention = getattr(getattr(model, "net", None), "attention", None)
+    if attention is None:
+        return X
+
+    import torch
+
+    with torch.no_grad():
+        return attention._apply_gate(torch.tensor(X, dtype=torch.float32)).numpy()
 
-        X_base["hasTreatment"] = (X_base[treatment_cols].sum(axis=1) > 0).astype(int)
+def predict_scenario_survival(model, X_scenarios: pd.DataFrame) -> List[np.ndarray]:
+    gated = apply_input_gate(model, X_scenarios.values.astype(np.float32))
+    _, unique_idx, inverse = np.unique(gated, axis=0, return_index=True, return_inverse=True)
+    logger.info(f"Scoring {len(unique_idx)} unique rows for {len(X_scenarios)} treatment scenarios")
 
-        surv_fns = model.predict_survival_function(X_base)
+    curves = model.predict_survival_function(X_scenarios.iloc[unique_idx])
 
-        sf = surv_fns[0]
+    return list(curves.values[inverse.reshape(-1)])
 
+def predict_treatment_scenarios(patient_data: dict, trained_path: str, shap_samples_path: str, valid_treatment_combinations: dict, settings: Settings,
+                                model=None, shap_explainer: Callable[[pd.DataFrame], Explanation] = None, preprocessor: DataPreprocessor = None, tnm_stage_medians: dict = None,
+                                context: RequestContext = None) -> list:
+    
+    if context is None:
+        context = build_request_context(patient_data, trained_path, settings, preprocessor, tnm_stage_medians)
+    processed_df = context.processed_df
+
+    if model is None:
+        model = load_model(trained_path)
+
+    X_base = processed_df.drop(columns=[c for c in [settings.event_col, settings.duration_col, "sourceId"] if c in processed_df.columns], errors="ignore")
+
+    if shap_explainer is None:
+        shap_explainer = build_shap_explainer(model, shap_samples_path, trained_path)
+
+    X_scenarios = build_treatment_scenarios(X_base, valid_treatment_combinations)
+    survival_probs = predict_scenario_survival(model, X_scenarios)
+    shap_values = get_shap_values(shap_explainer, X_scenarios)
+
+    survival_prediction = []
+    for idx, label in enumerate(X_scenarios.index):
         survival_prediction.append({
             "treatment": label,
-            "survivalProbs": sf.y.astype(float).tolist(),
-            "shapValues": get_shap_values(shap_explainer, X_base)
+            "survivalProbs": survival_probs[idx].astype(float).tolist(),
+            "shapValues": shap_values[idx]
         })
 
     return survival_prediction
 
 
+class PredictionService:
+    """
+    Holds the model, preprocessing state, SHAP explainer and patients-like-me model in memory so that
+    repeated predictions only pay for the per-patient work.
+    """
+    def __init__(self, trained_path: str, shap_samples_path: str, valid_treatment_combinations: dict, settings: Settings) -> None:
+        self.trained_path = trained_path
+        self.shap_samples_path = shap_samples_path
+        self.valid_treatment_combinations = valid_treatment_combinations
+        self.settings = settings
+
+        self.tnm_stage_medians = load_tnm_stage_medians(trained_path)
+        self.record_converter = PatientRecordConverter(self.tnm_stage_medians, settings)
+        self.preprocessor = load_preprocessor(trained_path, settings)
+        self.model = load_model(trained_path)
+        self.shap_explainer = build_shap_explainer(self.model, shap_samples_path, trained_path)
+        from models.patients_like_me import PatientsLikeMeModel
+        self.patients_like_me_model = PatientsLikeMeModel(settings)
+        logger.info(f"Prediction service ready with model from {trained_path}")
+
+    def predict(self, patient_data: dict) -> dict:
+        context = build_request_context(patient_data, self.trained_path, self.settings, self.preprocessor, self.tnm_stage_medians, self.record_converter)
+
+        personalized_result = {}
+        personalized_result["predictions"] = predict_treatment_scenarios(
+            patient_data=patient_data,
+            trained_path=self.trained_path,
+            shap_samples_path=self.shap_samples_path,
+            valid_treatment_combinations=self.valid_treatment_combinations,
+            settings=self.settings,
+            model=self.model,
+            shap_explainer=self.shap_explainer,
+            context=context
+        )
+        personalized_result["similarPatientsSummary"] = get_patient_like_me(
+            patient_data=patient_data,
+            trained_path=self.trained_path,
+            settings=self.settings,
+            model=self.patients_like_me_model,
+            context=context
+        )
+        return personalized_result
+
+
 def get_stage_median(tnm_stage_medians, stage_type: str, stage: str, key: str):
     stage_data = tnm_stage_medians.get(stage_type, {})
     norm_stage = str(stage).strip().upper()
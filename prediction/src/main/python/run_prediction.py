@@ -1,6 +1,9 @@
 import argparse
+import json
+import os
 
-from predictor import *
+from predictor import PredictionService, build_request_context, get_patient_like_me, predict_treatment_scenarios
+from utils.settings import Settings
 
 import logging
 
@@ -31,19 +34,109 @@ def failed_status(output_path: str):
     with open(output_path, 'w') as f:
         json.dump({}, f)
 
+def run_server(args, settings):
+    from prediction_server import serve
+
+    logger.info(f"Loading treatment configuration from {args.treatment_config}")
+    with open(args.treatment_config, 'r') as f:
+        treatment_config = json.load(f)
+
+    service = PredictionService(
+        trained_path=args.trained_path,
+        shap_samples_path=args.shap_samples_path,
+        valid_treatment_combinations=treatment_config,
+        settings=settings
+    )
+    serve(service, host=args.host, port=args.port)
+
+def iter_patient_records(input_path: str):
+    if os.path.isdir(input_path):
+        for file_name in sorted(os.listdir(input_path)):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(input_path, file_name), 'r') as f:
+                    yield file_name, json.load(f), None
+            except Exception as e:
+                yield file_name, None, e
+    else:
+        with open(input_path, 'r') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield f"line {line_number}", json.loads(line), None
+                except Exception as e:
+                    yield f"line {line_number}", None, e
+
+def run_batch(args, settings):
+    try:
+        logger.info(f"Loading treatment configuration from {args.treatment_config}")
+        with open(args.treatment_config, 'r') as f:
+            treatment_config = json.load(f)
+
+        service = PredictionService(
+            trained_path=args.trained_path,
+            shap_samples_path=args.shap_samples_path,
+            valid_treatment_combinations=treatment_config,
+            settings=settings
+        )
+    except Exception as e:
+        logger.error(f"Failed to initialize prediction service: {e}")
+        failed_status(args.output_path)
+        return
+
+    n_succeeded, n_failed = 0, 0
+    with open(args.output_path, 'w') as out:
+        for source, patient_data, load_error in iter_patient_records(args.input_path):
+            record = {"source": source, "patientId": patient_data.get("patientId") if isinstance(patient_data, dict) else None}
+            if load_error is not None:
+                logger.error(f"Failed to load patient record from {source}: {load_error}")
+                record["error"] = f"Failed to load input data: {load_error}"
+            else:
+                try:
+                    record["result"] = service.predict(patient_data)
+                except Exception as e:
+                    logger.error(f"Prediction failed for {source}: {e}")
+                    record["error"] = f"Prediction failed: {e}"
+
+            if "error" in record:
+                n_failed += 1
+            else:
+                n_succeeded += 1
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+
+    logger.info(f"Batch prediction completed: {n_succeeded} succeeded, {n_failed} failed, results saved to {args.output_path}")
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("input_path", help="Path to input JSON file")
-    parser.add_argument("output_path", help="Path to output JSON file")
+    parser.add_argument("input_path", nargs="?", help="Path to input JSON file (or JSONL file / directory of JSON files with --batch)")
+    parser.add_argument("output_path", nargs="?", help="Path to output JSON file (or JSONL file with --batch)")
     parser.add_argument("--trained_path", help= "Path to folder that contains trained model + preprocessors")
     parser.add_argument("--treatment_config", help="Path to treatment combination JSON")
     parser.add_argument("--patient_df_path", help="Path to patient database config file")
     parser.add_argument("--shap_samples_path", help="Path to SHAP samples CSV file")
+    parser.add_argument("--batch", action="store_true", help="Score every patient record in input_path and write one JSON line per patient")
+    parser.add_argument("--serve", action="store_true", help="Keep the model loaded and answer prediction requests over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind to in --serve mode")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on in --serve mode")
     args = parser.parse_args()
+
+    if not args.serve and (args.input_path is None or args.output_path is None):
+        parser.error("input_path and output_path are required unless --serve is given")
     
     logger.info("Starting treatment prediction script")
     settings = apply_settings_from_args(args)
 
+    if args.serve:
+        run_server(args, settings)
+        return
+
+    if args.batch:
+        run_batch(args, settings)
+        return
+
     try:
         logger.info(f"Loading patient data from {args.input_path}")
         with open(args.input_path, 'r') as f:
@@ -62,6 +155,13 @@ def main():
         failed_status(args.output_path)
         return
     
+    try:
+        context = build_request_context(patient_data, args.trained_path, settings)
+    except Exception as e:
+        logger.error(f"Failed to preprocess patient data: {e}")
+        failed_status(args.output_path)
+        return
+
     personalized_result = {}
     logger.info("Running predictions...")
     try:
@@ -70,7 +170,8 @@ def main():
             trained_path=args.trained_path,
             shap_samples_path=args.shap_samples_path,
             valid_treatment_combinations=treatment_config,
-            settings=settings
+            settings=settings,
+            context=context
         )
     except Exception as e:
         logger.error(f"Prediction failed: {e}")
@@ -82,7 +183,8 @@ def main():
         personalized_result["similarPatientsSummary"] = get_patient_like_me(
             patient_data=patient_data,
             trained_path=args.trained_path,
-            settings=settings
+            settings=settings,
+            context=context
         )
     except Exception as e:
         logger.error(f"Finding similar patients failed: {e}")
@@ -1,7 +1,18 @@
 # src/utils/__init__.py
-from .metrics import (
-    calculate_time_dependent_c_index, calculate_time_dependent_auc, calculate_brier_score,
-    calibration_assessment
-)
+import importlib
 
-from .settings import Settings
+_exports = {
+    "calculate_time_dependent_c_index": ".metrics",
+    "calculate_time_dependent_auc": ".metrics",
+    "calculate_brier_score": ".metrics",
+    "calibration_assessment": ".metrics",
+    "Settings": ".settings",
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name in _exports:
+        return getattr(importlib.import_module(_exports[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
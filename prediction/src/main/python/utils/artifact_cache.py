@@ -0,0 +1,38 @@
+import json
+import os
+import threading
+
+from typing import Any, Callable, Dict, Tuple
+
+_cache: Dict[Tuple[str, str], Tuple[Tuple[int, int], Any]] = {}
+_lock = threading.Lock()
+
+
+def load_artifact(path: str, loader: Callable[[str], Any]) -> Any:
+    """
+    `loader(path)`, served from a process-wide cache for as long as the file keeps the same modification time and size.
+    Cached values are shared between callers and must not be modified.
+    """
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    key = (os.path.abspath(path), f"{loader.__module__}.{loader.__qualname__}")
+
+    with _lock:
+        cached = _cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    value = loader(path)
+    with _lock:
+        _cache[key] = (version, value)
+    return value
+
+
+def read_json(path: str) -> Any:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def clear_artifact_cache() -> None:
+    with _lock:
+        _cache.clear()
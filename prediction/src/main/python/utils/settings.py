@@ -17,8 +17,16 @@ class Settings:
     view_name: str = 'knownPalliativeTreatedReference'
     db_config_path: str = '/home/jupyter/.my.cnf'
     patient_df_path: Optional[str] = None  # If None, data is loaded from the database.
+    cohort_cache_dir: Optional[str] = None  # Feather cache of the reference cohort (data/cohort_cache.py); None reads the source every time
+    reference_update_column: Optional[str] = None  # view column whose MAX, next to the row count, tells whether the cache is stale
     
     standardize: bool = True
+    compact_preprocessing: bool = False  # categorical, float32 and uint8 columns in preprocess_data (data/compact_preprocessing.py)
+    shap_background_size: int = 100  # rows kept in the persisted SHAP background; explanation cost grows linearly with it
+    patients_like_me_backend: str = 'brute'  # brute, kd_tree, ball_tree (exact) or projected (approximate), see models/neighbor_search.py
+    patients_like_me_n_neighbors: int = 25
+    patients_like_me_metric: str = 'euclidean'
+    cv_backend: str = 'threading'  # threading, or processes: folds in a process pool on memory-mapped X and y (models/model_trainer.py)
     #--------------------------------------------------------------------------------------------
     # Derived or computed settings:
     event_col: Optional[str] = None
@@ -30,6 +38,7 @@ class Settings:
     input_size: int = 101  # This is updated in data_processing.py once it has X_train.shape[1].
     use_gate: bool = True
     n_jobs: int = 4 # depends on how many CPU's you have available
+    cpu_budget: Optional[int] = None  # cores training may use, split over folds, forests, torch and BLAS (utils/thread_budget.py); None uses all
         
     def __post_init__(self):
         self.configure_data_settings()
@@ -0,0 +1,60 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from typing import List, Optional, Tuple
+
+SHAP_BACKGROUND_FILE = "shap_background.npz"
+SHAP_BACKGROUND_SUFFIX = "_shap_background.npz"
+
+
+def summarize_background(X: pd.DataFrame, n_samples: int, random_state: int = 42) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Summarize `X` into at most `n_samples` representative rows: the observed row closest to each k-means centroid,
+    weighted by the fraction of rows in its cluster. Using observed rows keeps binary and one-hot features valid.
+    """
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import pairwise_distances_argmin
+
+    X_values = X.astype(np.float64).fillna(0.0).values
+    if len(X_values) <= n_samples:
+        return X_values, np.full(len(X_values), 1.0 / len(X_values))
+
+    kmeans = KMeans(n_clusters=n_samples, n_init=10, random_state=random_state).fit(X_values)
+    medoids = pairwise_distances_argmin(kmeans.cluster_centers_, X_values)
+    weights = np.bincount(kmeans.labels_, minlength=n_samples).astype(np.float64)
+
+    return X_values[medoids], weights / weights.sum()
+
+
+def save_background(path: str, data: np.ndarray, weights: np.ndarray, feature_names: List[str]) -> None:
+    np.savez(path, data=data.astype(np.float64), weights=weights.astype(np.float64), feature_names=np.array(feature_names, dtype=str))
+
+
+def load_background(path: str) -> Tuple[pd.DataFrame, np.ndarray]:
+    with np.load(path, allow_pickle=False) as artifact:
+        background = pd.DataFrame(artifact["data"], columns=artifact["feature_names"].tolist())
+        weights = artifact["weights"]
+    return background, weights
+
+
+def find_background(trained_path: str, model_name: Optional[str] = None) -> Optional[str]:
+    """
+    The SHAP background file in `trained_path`: `shap_background.npz`, or else the `<outcome>_<model>_shap_background.npz`
+    `ModelTrainer.save_model` wrote, so a training output folder can be served as is. When the folder holds the
+    backgrounds of several models, the one of `model_name` is used; if that does not single one out, a ValueError is
+    raised.
+    """
+    path = os.path.join(trained_path, SHAP_BACKGROUND_FILE)
+    if os.path.exists(path):
+        return path
+
+    candidates = sorted(glob.glob(os.path.join(glob.escape(trained_path), "*" + SHAP_BACKGROUND_SUFFIX)))
+    if len(candidates) > 1 and model_name is not None:
+        candidates = [c for c in candidates if c.endswith(f"_{model_name}{SHAP_BACKGROUND_SUFFIX}")] or candidates
+    if len(candidates) > 1:
+        raise ValueError(f"Several SHAP backgrounds in {trained_path} and none only for model {model_name}: "
+                         f"{[os.path.basename(c) for c in candidates]}; copy the one of the served model to {SHAP_BACKGROUND_FILE}")
+    return candidates[0] if candidates else None
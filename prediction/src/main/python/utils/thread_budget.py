@@ -0,0 +1,53 @@
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+
+@dataclass(frozen=True)
+class ThreadBudget:
+    """
+    Split of the cores training may use (`Settings.cpu_budget`, all cores by default) between parallel fold workers
+    and the threads within each worker. Within a worker, forest estimators, torch intra-op threads and BLAS each get
+    `threads_per_worker`: a fold runs one model at a time, so at most one of them is busy at any moment.
+    """
+    cores: int
+    fold_workers: int
+    threads_per_worker: int
+
+    @classmethod
+    def from_settings(cls, settings, n_folds: int = 1) -> "ThreadBudget":
+        cores = max(1, settings.cpu_budget or os.cpu_count() or 1)
+        fold_workers = max(1, min(settings.n_jobs, n_folds, cores))
+        return cls(cores, fold_workers, max(1, cores // fold_workers))
+
+    def single_worker(self) -> "ThreadBudget":
+        """The budget of one model trained on its own, such as the final model after cross-validation."""
+        return ThreadBudget(self.cores, 1, self.cores)
+
+    @contextmanager
+    def limits(self) -> Iterator[None]:
+        """
+        Limit torch and BLAS in the calling process while the block runs, then restore the previous limits. Threads
+        share these limits, so enter it once per process, around all of its fold workers.
+        """
+        import torch
+        from threadpoolctl import threadpool_limits
+
+        torch_threads = torch.get_num_threads()
+        torch.set_num_threads(self.threads_per_worker)
+        try:
+            with threadpool_limits(limits=self.threads_per_worker):
+                yield
+        finally:
+            torch.set_num_threads(torch_threads)
+
+    def limit_model(self, model: Any) -> None:
+        """Give the estimator of `model` `threads_per_worker` jobs, if it parallelizes over estimators like a forest."""
+        estimator = getattr(model, "model", None)
+        if hasattr(estimator, "n_jobs") and hasattr(estimator, "set_params"):
+            estimator.set_params(n_jobs=self.threads_per_worker)
+
+    def __str__(self) -> str:
+        return (f"{self.cores} cores as {self.fold_workers} fold workers x {self.threads_per_worker} threads "
+                f"(forest jobs, torch intra-op and BLAS threads per worker)")
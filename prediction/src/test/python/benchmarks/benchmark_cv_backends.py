@@ -0,0 +1,71 @@
+"""
+Wall time of the cross-validation folds of `ModelTrainer` with `Settings.cv_backend` "threading" against "processes",
+for CoxPH, RSF, GBS and DeepSurv on the same folds of a synthetic cohort. The processes time includes writing the
+shared `.npy` files. Run it on a machine with at least `n_jobs` cores; with fewer, processes share the cores and the
+ratio shows mostly the worker start-up overhead.
+
+    python benchmark_cv_backends.py [--n_rows 2000] [--n_features 60] [--n_jobs 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from sksurv.util import Surv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "main", "python")))
+
+from models.model_trainer import ModelTrainer, SharedFoldData
+from models.survival_models import CoxPHModel, RandomSurvivalForestModel, GradientBoostingSurvivalModel, DeepSurv
+from utils.settings import Settings
+
+
+def synthetic_cohort(n_rows: int, n_features: int, settings: Settings, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n_rows, n_features)), columns=[f"x{i}" for i in range(n_features)])
+    durations = np.exp(6 + X.iloc[:, :5].to_numpy() @ rng.normal(0, 0.3, 5) + rng.normal(size=n_rows))
+    events = (rng.random(n_rows) < 0.7) | (durations < 200)
+    return X, Surv.from_arrays(events, durations, name_event=settings.event_col, name_time=settings.duration_col)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_rows", type=int, default=2000)
+    parser.add_argument("--n_features", type=int, default=60)
+    parser.add_argument("--n_jobs", type=int, default=5)
+    args = parser.parse_args()
+
+    settings = Settings(save_models=False, n_jobs=args.n_jobs)
+    X, y = synthetic_cohort(args.n_rows, args.n_features, settings)
+    models = {
+        "CoxPH": CoxPHModel(alpha=0.1),
+        "RSF": RandomSurvivalForestModel(n_estimators=50, min_samples_leaf=20, random_state=0),
+        "GBS": GradientBoostingSurvivalModel(n_estimators=100, random_state=0),
+        "DeepSurv": DeepSurv(input_size=X.shape[1], epochs=20),
+    }
+    trainer = ModelTrainer(models=models, settings=settings)
+    trainer.feature_names = X.columns.tolist()
+    folds = trainer.cross_validate(X, y, {})
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print(f"{args.n_rows} rows x {args.n_features} features, {len(folds)} folds, n_jobs={args.n_jobs}, {cores} cores")
+    if cores < min(args.n_jobs, len(folds)):
+        print(f"only {cores} cores for {min(args.n_jobs, len(folds))} fold workers: the speedup below is not a multi-core speedup")
+
+    for model_name, model in models.items():
+        start = time.perf_counter()
+        trainer._run_folds(model_name, model, folds, X, y, {})
+        threading = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as directory:
+            trainer._run_folds(model_name, model, folds, X, y, {}, SharedFoldData(X, y, directory))
+        processes = time.perf_counter() - start
+        print(f"{model_name:>9}: {threading:7.2f}s threads, {processes:7.2f}s processes ({threading / processes:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Peak RSS (Linux VmHWM) and wall time of loading the reference view with `pd.read_sql("SELECT * ...")` and with the streamed, projected
+and compacted `data.sql_loader.read_table`. A synthetic view with the reference columns plus `--n_extra_columns`
+unused ones is written to a SQLite file, which stands in for MySQL. Each loader runs in its own process.
+
+    python benchmark_db_loading.py [--n_rows 1000000] [--n_extra_columns 40] [--db_path /tmp/reference.db]
+"""
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+SOURCE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "main", "python"))
+sys.path.insert(0, SOURCE_DIR)
+
+from data.cohort_cache import OUTCOME_COLUMNS
+from data.lookups import lookup_manager
+
+VIEW = "palliativeReference"
+CATEGORICAL = ["sex", "primaryTumorType", "primaryTumorLocation", "sidedness", "extraMuralInvasionCategory",
+               "firstSystemicTreatmentAfterMetastaticDiagnosis"]
+
+LOADERS = {
+    "read_sql": f"df = pd.read_sql('SELECT * FROM {VIEW}', connection)",
+    "read_table": "df = read_table(connection, VIEW, columns)",
+    "read_table float32": "df = read_table(connection, VIEW, columns, float_dtype=np.float32)",
+}
+
+
+def write_view(path: str, n_rows: int, n_extra_columns: int, chunk_size: int = 100_000, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    with sqlite3.connect(path) as connection:
+        for start in range(0, n_rows, chunk_size):
+            n = min(chunk_size, n_rows - start)
+            chunk = {}
+            for feature in lookup_manager.features:
+                if feature in CATEGORICAL:
+                    chunk[feature] = rng.choice(np.array(["LEFT", "RIGHT", "RECTUM", "SIGMOID_COLON", None], dtype=object), n)
+                elif feature in lookup_manager.lookup_dictionary:
+                    chunk[feature] = rng.choice(np.array(list(lookup_manager.lookup_dictionary[feature]) + [None], dtype=object), n)
+                elif feature.startswith("has"):
+                    chunk[feature] = rng.choice(np.array([1, 0, None], dtype=object), n)
+                else:
+                    chunk[feature] = np.where(rng.random(n) < 0.1, np.nan, np.round(rng.normal(50, 15, n), 1))
+            for col in OUTCOME_COLUMNS:
+                chunk[col] = rng.integers(0, 2000, n)
+            chunk["sourceId"] = np.arange(start, start + n)
+            for i in range(n_extra_columns):
+                chunk[f"extra{i}"] = rng.choice(np.array(["some free text", "other text", None], dtype=object), n)
+            pd.DataFrame(chunk).to_sql(VIEW, connection, index=False, if_exists="append")
+
+
+def measure(loader: str, db_path: str) -> str:
+    # VmHWM rather than ru_maxrss, which Linux carries over from the parent process across exec
+    code = f"""
+import sqlite3, time
+import numpy as np
+import pandas as pd
+from data.cohort_cache import OUTCOME_COLUMNS
+from data.lookups import lookup_manager
+from data.sql_loader import read_table
+VIEW = {VIEW!r}
+columns = lookup_manager.features + OUTCOME_COLUMNS + ["sourceId"]
+connection = sqlite3.connect({db_path!r})
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) / 1024
+baseline = peak_rss_mb()
+start = time.perf_counter()
+{LOADERS[loader]}
+elapsed = time.perf_counter() - start
+peak = peak_rss_mb()
+print(f"{{peak:.0f}} MB peak RSS ({{peak - baseline:.0f}} MB above baseline), {{elapsed:.1f}}s, "
+      f"{{df.memory_usage(deep=True).sum() / 2**20:.0f}} MB frame of {{df.shape[0]}} x {{df.shape[1]}}")
+"""
+    result = subprocess.run([sys.executable, "-c", code], cwd=SOURCE_DIR, capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_rows", type=int, default=1_000_000)
+    parser.add_argument("--n_extra_columns", type=int, default=40)
+    parser.add_argument("--db_path", default=os.path.join("/tmp", "benchmark_reference_view.db"))
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db_path):
+        print(f"Writing {args.n_rows} x {len(lookup_manager.features) + len(OUTCOME_COLUMNS) + 1 + args.n_extra_columns} view to {args.db_path}")
+        write_view(args.db_path, args.n_rows, args.n_extra_columns)
+
+    for loader in LOADERS:
+        print(f"{loader:>18}: {measure(loader, args.db_path)}")
+
+
+if __name__ == "__main__":
+    main()
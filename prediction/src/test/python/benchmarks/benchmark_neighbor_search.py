@@ -0,0 +1,75 @@
+"""
+Recall and latency of the patients-like-me neighbor backends against exact brute-force search, on a synthetic
+standardized cohort with the shape of the reference view (binary and continuous features driven by a few latent factors).
+
+    python benchmark_neighbor_search.py [--n_rows 200000] [--n_features 90] [--n_queries 200] [--k 25]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "main", "python")))
+
+from models.neighbor_search import build_neighbor_index
+
+BACKENDS = [
+    ("brute", {}),
+    ("kd_tree", {}),
+    ("ball_tree", {}),
+    ("projected", {"n_components": None}),
+    ("projected", {}),
+    ("projected", {"n_components": 32, "candidate_factor": 8}),
+    ("projected", {"n_components": 16, "candidate_factor": 32}),
+]
+
+
+def synthetic_cohort(n_rows: int, n_features: int, n_factors: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    latent = rng.normal(size=(n_rows, n_factors))
+    X = latent @ rng.normal(size=(n_factors, n_features)) + 0.5 * rng.normal(size=(n_rows, n_features))
+    binary = rng.random(n_features) < 0.6
+    X[:, binary] = X[:, binary] > 0
+    return ((X - X.mean(axis=0)) / X.std(axis=0)).astype(np.float64)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_rows", type=int, default=200_000)
+    parser.add_argument("--n_features", type=int, default=90)
+    parser.add_argument("--n_queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=25)
+    args = parser.parse_args()
+
+    X = synthetic_cohort(args.n_rows + args.n_queries, args.n_features)
+    reference, queries = X[:args.n_rows], X[args.n_rows:]
+
+    exact = None
+    print(f"{args.n_rows} reference rows, {args.n_features} features, {args.n_queries} queries, k={args.k}")
+    print(f"{'backend':<55} {'build':>8} {'batch query':>12} {'single query':>13} {'recall':>7}")
+    for backend, kwargs in BACKENDS:
+        start = time.perf_counter()
+        index = build_neighbor_index(backend, n_neighbors=args.k, **kwargs).fit(reference)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, indices = index.kneighbors(queries)
+        batch_time = (time.perf_counter() - start) / len(queries)
+
+        start = time.perf_counter()
+        for row in queries[:20]:
+            index.kneighbors(row[None, :])
+        single_time = (time.perf_counter() - start) / 20
+
+        if exact is None:
+            exact = indices
+        recall = np.mean([len(np.intersect1d(a, b)) / args.k for a, b in zip(indices, exact)])
+
+        name = backend + (f" {kwargs}" if kwargs else "")
+        print(f"{name:<55} {build_time:>7.2f}s {batch_time * 1e3:>10.2f}ms {single_time * 1e3:>11.2f}ms {recall:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
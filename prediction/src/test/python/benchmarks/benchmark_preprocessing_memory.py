@@ -0,0 +1,88 @@
+"""
+Peak RSS (Linux VmHWM) and wall time of fitting `DataPreprocessor.preprocess_data` on a synthetic reference cohort
+with and without `Settings.compact_preprocessing`. The cohort has the dtypes `data.sql_loader.read_table` produces with
+`float_dtype=np.float32` (categorical strings, float32). Each mode runs in its own process.
+
+    python benchmark_preprocessing_memory.py [--n_rows 500000] [--experiment_type treatment_drug]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+SOURCE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "main", "python"))
+
+CODE = """
+import sys, time
+import numpy as np
+import pandas as pd
+from data.data_processing import DataPreprocessor
+from data.lookups import lookup_manager
+from utils.settings import Settings
+
+TREATMENTS = ["FOLFOX", "CAPOX-B", "FOLFIRI-P", "FOLFOXIRI-B", "CAPECITABINE", "pembrolizumab", "NIVOLUMAB", ""]
+STRINGS = {"sex": ["MALE", "FEMALE"], "sidedness": ["LEFT", "RIGHT"], "primaryTumorType": ["CRC_ADENOCARCINOMA", "CRC_MUCINOUS"],
+           "primaryTumorLocation": ["RECTUM", "SIGMOID_COLON", "COECUM", "ASCENDING_COLON", "TRANSVERSE_COLON"],
+           "extraMuralInvasionCategory": ["NONE", "ABOVE_FIVE_MM", "BELOW_FIVE_MM"]}
+
+def rss_mb(field):
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(field)) / 1024
+
+settings = Settings(experiment_type=sys.argv[2], save_models=False, compact_preprocessing=sys.argv[3] == "compact")
+rng = np.random.default_rng(0)
+n = int(sys.argv[1])
+df = {}
+for feature in lookup_manager.features:
+    if feature == "firstSystemicTreatmentAfterMetastaticDiagnosis":
+        categories = TREATMENTS
+    elif feature in STRINGS:
+        categories = STRINGS[feature]
+    elif feature in lookup_manager.lookup_dictionary:
+        categories = [key for key in lookup_manager.lookup_dictionary[feature]]
+    else:
+        categories = None
+    if categories is not None:
+        df[feature] = pd.Categorical.from_codes(rng.integers(-1, len(categories), n), categories)
+    elif feature.startswith("has"):
+        df[feature] = np.where(rng.random(n) < 0.1, np.nan, rng.random(n) < 0.3).astype(np.float32)
+    elif feature == "whoAssessmentAtMetastaticDiagnosis":
+        df[feature] = np.where(rng.random(n) < 0.1, np.nan, rng.integers(0, 5, n)).astype(np.float32)
+    else:
+        df[feature] = np.where(rng.random(n) < 0.1, np.nan, np.round(rng.normal(50, 15, n), 1)).astype(np.float32)
+df[settings.duration_col] = rng.integers(1, 2000, n).astype(np.int16)
+df[settings.event_col] = rng.integers(0, 2, n).astype(np.int8)
+df = pd.DataFrame(df)
+
+# resets VmHWM to the current RSS, so that building the cohort does not count towards the peak
+with open("/proc/self/clear_refs", "w") as f:
+    f.write("5")
+baseline = rss_mb("VmRSS")
+start = time.perf_counter()
+X, features, _ = DataPreprocessor(settings, fit=True).preprocess_data(df=df)
+elapsed = time.perf_counter() - start
+peak = rss_mb("VmHWM")
+print(f"{peak - baseline:.0f} MB above the loaded cohort, {elapsed:.1f}s, "
+      f"{X.memory_usage(deep=True).sum() / 2**20:.0f} MB matrix of {X.shape[0]} x {X.shape[1]}")
+"""
+
+
+def measure(n_rows: int, experiment_type: str, mode: str) -> str:
+    result = subprocess.run([sys.executable, "-c", CODE, str(n_rows), experiment_type, mode], cwd=SOURCE_DIR,
+                            capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_rows", type=int, default=500_000)
+    parser.add_argument("--experiment_type", default="treatment_drug")
+    args = parser.parse_args()
+
+    print(f"{args.n_rows} rows, {args.experiment_type}")
+    for mode in ["default", "compact"]:
+        print(f"{mode:>8}: {measure(args.n_rows, args.experiment_type, mode)}")
+
+
+if __name__ == "__main__":
+    main()
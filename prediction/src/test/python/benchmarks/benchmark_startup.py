@@ -0,0 +1,79 @@
+"""
+Wall time from process start to first prediction for run_prediction.py, plus the import cost of the entry point alone.
+
+    python benchmark_startup.py --trained_path ... --treatment_config ... --patient_df_path ... [--budget 8.0]
+
+Exits with status 1 when the median time to first prediction exceeds --budget seconds.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SOURCE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "main", "python"))
+HEAVY_MODULES = ["torch", "shap", "sksurv", "pycox", "sklearn", "matplotlib"]
+
+
+def time_import() -> float:
+    code = "import time; t = time.perf_counter(); import run_prediction; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=SOURCE_DIR, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip())
+
+
+def loaded_heavy_modules() -> str:
+    code = f"import sys, run_prediction; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=SOURCE_DIR, capture_output=True, text=True, check=True)
+    return result.stdout.strip() or "none"
+
+
+def time_first_prediction(args, output_path: str) -> float:
+    command = [
+        sys.executable, os.path.join(SOURCE_DIR, "run_prediction.py"), args.input_path, output_path,
+        "--trained_path", args.trained_path,
+        "--treatment_config", args.treatment_config,
+        "--patient_df_path", args.patient_df_path,
+    ]
+    if args.shap_samples_path:
+        command += ["--shap_samples_path", args.shap_samples_path]
+
+    start = time.perf_counter()
+    subprocess.run(command, cwd=SOURCE_DIR, capture_output=True, check=True)
+    elapsed = time.perf_counter() - start
+
+    with open(output_path) as f:
+        if not json.load(f).get("predictions"):
+            raise RuntimeError(f"run_prediction.py produced no predictions, see {output_path}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_path", required=True, help="ACTIN patient record JSON")
+    parser.add_argument("--trained_path", required=True)
+    parser.add_argument("--treatment_config", default=os.path.join(SOURCE_DIR, "..", "..", "test", "resources", "treatment_combinations.json"))
+    parser.add_argument("--patient_df_path", required=True)
+    parser.add_argument("--shap_samples_path")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget", type=float, help="Fail if the median time to first prediction exceeds this many seconds")
+    args = parser.parse_args()
+
+    import_times = [time_import() for _ in range(args.runs)]
+    print(f"import run_prediction: median {statistics.median(import_times):.2f}s (heavy modules loaded: {loaded_heavy_modules()})")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, "prediction.json")
+        prediction_times = [time_first_prediction(args, output_path) for _ in range(args.runs)]
+    median = statistics.median(prediction_times)
+    print(f"time to first prediction: median {median:.2f}s, min {min(prediction_times):.2f}s over {args.runs} runs")
+
+    if args.budget is not None and median > args.budget:
+        print(f"FAIL: exceeds startup budget of {args.budget:.2f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
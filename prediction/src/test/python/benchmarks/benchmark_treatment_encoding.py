@@ -0,0 +1,79 @@
+"""
+Wall time of `DataPreprocessor.add_treatment_drugs` and `encode_categorical` against the row-wise versions they replaced
+(`Series.apply(parse_treatment)`, and `pd.get_dummies` with a `pd.concat` per column), which
+`test_data_processing.py` keeps as references. Runs on a synthetic cohort of treatment and categorical columns.
+
+    python benchmark_treatment_encoding.py [--n_rows 2000000]
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+TEST_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.abspath(os.path.join(TEST_DIR, "..", "..", "main", "python")))
+
+from data.data_processing import DataPreprocessor
+from utils.settings import Settings
+
+TREATMENT_COL = "firstSystemicTreatmentAfterMetastaticDiagnosis"
+TREATMENTS = ["FOLFOX", "CAPOX-B", "FOLFIRI-P", "FOLFOXIRI-B", "CAPECITABINE", "5-FU", "pembrolizumab", "", None]
+CATEGORIES = {
+    "sex": ["MALE", "FEMALE"],
+    "sidedness": ["LEFT", "RIGHT", None],
+    "primaryTumorType": ["CRC_ADENOCARCINOMA", "CRC_MUCINOUS", "CRC_SIGNET_RING", None],
+    "primaryTumorLocation": ["RECTUM", "SIGMOID_COLON", "COECUM", "ASCENDING_COLON", "TRANSVERSE_COLON", None],
+    "extraMuralInvasionCategory": ["NONE", "ABOVE_FIVE_MM", "BELOW_FIVE_MM", None],
+    "hasMsi": [True, False, None],
+}
+
+
+def load_references():
+    spec = importlib.util.spec_from_file_location("test_data_processing", os.path.join(TEST_DIR, "data", "test_data_processing.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_cohort(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = {TREATMENT_COL: rng.choice(np.array(TREATMENTS, dtype=object), n_rows)}
+    df.update({col: rng.choice(np.array(values, dtype=object), n_rows) for col, values in CATEGORIES.items()})
+    df["ageAtMetastaticDiagnosis"] = rng.normal(60, 10, n_rows)
+    return pd.DataFrame(df)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_rows", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    references = load_references()
+    settings = Settings(save_models=False)
+    df = synthetic_cohort(args.n_rows)
+    print(f"{args.n_rows} rows")
+
+    dp = DataPreprocessor(settings, fit=True)
+    treated, vectorized = timed(lambda: dp.add_treatment_drugs(df.copy()))
+    expected, rowwise = timed(lambda: references.rowwise_add_treatment_drugs(dp, df.copy(), TREATMENT_COL))
+    assert treated.equals(expected)
+    print(f"{'add_treatment_drugs':>20}: {rowwise:6.2f}s row-wise, {vectorized:6.2f}s vectorized ({rowwise / vectorized:.0f}x)")
+
+    encoded, vectorized = timed(lambda: dp.encode_categorical(treated.copy()))
+    expected, rowwise = timed(lambda: references.rowwise_encode_categorical({}, treated.copy()))
+    assert encoded.equals(expected)
+    print(f"{'encode_categorical':>20}: {rowwise:6.2f}s row-wise, {vectorized:6.2f}s vectorized ({rowwise / vectorized:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
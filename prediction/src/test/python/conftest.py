@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sksurv.util import Surv
+
+from data.lookups import lookup_manager
+from utils.settings import Settings
+
+# sidedness is "LEFT" or missing in the cohort, so it is label encoded with a "None" class
+CATEGORIES = {
+    "firstSystemicTreatmentAfterMetastaticDiagnosis": ["FOLFOX", "CAPOX-B", "FOLFIRI-P", "pembrolizumab", ""],
+    "sex": ["MALE", "FEMALE"],
+    "primaryTumorType": ["CRC_ADENOCARCINOMA", "CRC_MUCINOUS", "CRC_SIGNET_RING"],
+    "primaryTumorLocation": ["RECTUM", "SIGMOID_COLON", "COECUM", "ASCENDING_COLON"],
+    "sidedness": ["LEFT"],
+    "extraMuralInvasionCategory": ["NONE", "ABOVE_FIVE_MM", "BELOW_FIVE_MM"],
+    "numberOfPriorTumors": ["0", "1", "2"],
+}
+
+
+@pytest.fixture(scope="session")
+def survival_data():
+    """
+    Factory of (X, y) for fitting survival models: features "a" to "d", with "d" binary so it can serve as a gate
+    column, and durations driven by "a", "d" and an "a" x "b" interaction.
+    """
+    def make(n_rows: int = 300, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        X = pd.DataFrame(rng.normal(size=(n_rows, 4)), columns=["a", "b", "c", "d"])
+        X["d"] = (X["d"] > 0).astype(float)
+        durations = 100 * np.exp(1 + 0.5 * X["a"] - 0.8 * X["d"] + 0.3 * X["a"] * X["b"] + 0.3 * rng.normal(size=n_rows))
+        y = Surv.from_arrays(rng.random(n_rows) < 0.7, durations, name_event="event", name_time="duration")
+        return X, y
+
+    return make
+
+
+@pytest.fixture(scope="session")
+def raw_cohort():
+    """
+    Factory of reference cohorts as loaded from the database, before preprocessing: every lookup feature with ~15%
+    missing values (except sex), and a survival outcome and `sourceId` per patient. Preprocessing keeps every row.
+    """
+    settings = Settings()
+
+    def make(n_rows: int, seed: int = 0, first_source_id: int = 0) -> pd.DataFrame:
+        rng = np.random.default_rng(seed)
+        missing = lambda: rng.random(n_rows) < 0.15
+        df = {}
+        for feature in lookup_manager.features:
+            if feature in CATEGORIES:
+                values = rng.choice(np.array(CATEGORIES[feature], dtype=object), n_rows)
+            elif feature in lookup_manager.lookup_dictionary:
+                values = rng.choice(np.array(list(lookup_manager.lookup_dictionary[feature]), dtype=object), n_rows)
+            elif feature.startswith("has"):
+                values = rng.choice(np.array([True, False], dtype=object), n_rows)
+            elif feature == "whoAssessmentAtMetastaticDiagnosis":
+                values = rng.integers(0, 5, n_rows).astype(float)
+            else:
+                values = np.round(rng.normal(50, 15, n_rows), 1)
+            df[feature] = np.where(missing() & (feature != "sex"), None if values.dtype == object else np.nan, values)
+        df = pd.DataFrame(df)
+        df[settings.duration_col] = rng.integers(1, 2000, n_rows)
+        df[settings.event_col] = rng.random(n_rows) < 0.7
+        df["sourceId"] = np.arange(first_source_id, first_source_id + n_rows)
+        return df
+
+    return make
@@ -0,0 +1,82 @@
+import os
+
+import pandas as pd
+
+from data.data_processing import DataPreprocessor
+from utils.settings import Settings
+
+
+class CountingPreprocessor(DataPreprocessor):
+    source_reads = 0
+
+    def _read_source(self) -> pd.DataFrame:
+        CountingPreprocessor.source_reads += 1
+        return super()._read_source()
+
+
+def test_cached_cohort_matches_source_and_follows_changes(tmp_path, raw_cohort):
+    pickle_path = str(tmp_path / "reference.pkl")
+    raw_cohort(500).assign(unusedViewColumn="x").to_pickle(pickle_path)
+    uncached = Settings(patient_df_path=pickle_path)
+    cached = Settings(patient_df_path=pickle_path, cohort_cache_dir=str(tmp_path / "cache"))
+
+    CountingPreprocessor.source_reads = 0
+    first = CountingPreprocessor(cached).load_data()
+    second = CountingPreprocessor(cached).load_data()
+
+    expected = DataPreprocessor(uncached).load_data()
+    assert CountingPreprocessor.source_reads == 1
+    assert "unusedViewColumn" not in first.columns
+    pd.testing.assert_frame_equal(first, expected[first.columns])
+    pd.testing.assert_frame_equal(second, first)
+
+    raw_cohort(600, seed=1).to_pickle(pickle_path)
+    refreshed = CountingPreprocessor(cached).load_data()
+
+    assert CountingPreprocessor.source_reads == 2
+    pd.testing.assert_frame_equal(refreshed, DataPreprocessor(uncached).load_data()[first.columns])
+
+
+class FakeView:
+    def __init__(self, df: pd.DataFrame) -> None:
+        self.df = df
+        self.queries = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, query: str) -> None:
+        self.queries.append(query)
+
+    def fetchone(self):
+        return len(self.df), self.df["sourceId"].max()
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+def test_view_cache_is_checked_with_fingerprint_query(tmp_path, monkeypatch, raw_cohort):
+    view = FakeView(raw_cohort(300))
+    monkeypatch.setattr(DataPreprocessor, "_connect", lambda self: view)
+    monkeypatch.setattr(DataPreprocessor, "_load_data_from_db", lambda self: view.df.copy())
+    settings = Settings(cohort_cache_dir=str(tmp_path), reference_update_column="sourceId")
+
+    CountingPreprocessor.source_reads = 0
+    first = CountingPreprocessor(settings).load_data()
+    CountingPreprocessor(settings).load_data()
+
+    assert CountingPreprocessor.source_reads == 1
+    assert view.queries[-1] == f"SELECT COUNT(*), MAX(sourceId) FROM {settings.view_name}"
+    assert os.listdir(tmp_path) == [f"{settings.db_name}.{settings.view_name}.feather"]
+
+    view.df = pd.concat([view.df, raw_cohort(1, first_source_id=300)], ignore_index=True)
+    refreshed = CountingPreprocessor(settings).load_data()
+
+    assert CountingPreprocessor.source_reads == 2
+    assert len(refreshed) == len(first) + 1
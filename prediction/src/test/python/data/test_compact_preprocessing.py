@@ -0,0 +1,105 @@
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.data_processing import DataPreprocessor
+from data.lookups import lookup_manager
+from utils.settings import Settings
+
+def compact_input(df: pd.DataFrame) -> pd.DataFrame:
+    """The dtypes of `read_table(float_dtype=np.float32)`: categorical strings and float32."""
+    return df.apply(lambda col: col.astype("category") if col.dtype == object and col.dropna().map(type).eq(str).all()
+                    else col.astype(np.float32) if col.dtype == np.float64 else col)
+
+
+def assert_same_matrix(compact: pd.DataFrame, expected: pd.DataFrame) -> None:
+    assert list(compact.columns) == list(expected.columns)
+    assert compact.index.equals(expected.index)
+    assert compact.memory_usage(deep=True).sum() < expected.memory_usage(deep=True).sum() / 1.8
+    np.testing.assert_allclose(compact.to_numpy(dtype=np.float64), expected.to_numpy(dtype=np.float64), rtol=1e-5, atol=1e-5)
+
+
+@pytest.mark.parametrize("experiment_type", ["treatment_drug", "treatment_vs_no"])
+def test_compact_preprocessing_matches_preprocess_data(experiment_type, raw_cohort):
+    default = Settings(experiment_type=experiment_type, save_models=False)
+    compact = Settings(experiment_type=experiment_type, save_models=False, compact_preprocessing=True)
+    cohort = raw_cohort(600)
+    # rows preprocessing drops: no features at all, a negative survival time and a nivolumab plan
+    cohort.loc[3, lookup_manager.features] = None
+    cohort.loc[4, default.duration_col] = -5
+    cohort.loc[5, "firstSystemicTreatmentAfterMetastaticDiagnosis"] = "NIVOLUMAB"
+
+    fitted = DataPreprocessor(default, fit=True)
+    expected, expected_features, _ = fitted.preprocess_data(df=cohort.copy())
+    compact_fitted = DataPreprocessor(compact, fit=True)
+    result, features, encoded_columns = compact_fitted.preprocess_data(df=cohort)
+
+    assert features == expected_features
+    assert encoded_columns == fitted.encoded_columns
+    assert compact_fitted.medians == fitted.medians
+    assert result[features].dtypes.map(lambda dtype: dtype.itemsize).max() == 4
+    assert_same_matrix(result, expected)
+
+    result, _, _ = DataPreprocessor(compact, fit=True).preprocess_data(df=compact_input(cohort))
+    assert_same_matrix(result, DataPreprocessor(default, fit=True).preprocess_data(df=compact_input(cohort))[0])
+
+    state = {"medians": fitted.medians, "encoded_columns": fitted.encoded_columns, "scaler": fitted.scaler, "imputers": fitted.imputers}
+    batch = raw_cohort(80, seed=1)
+    batch.loc[5, "primaryTumorLocation"] = "TRANSVERSE_COLON"
+    expected, _, _ = DataPreprocessor(default, fit=False, state=copy.deepcopy(state)).preprocess_data(df=batch.copy())
+    result, _, _ = DataPreprocessor(compact, fit=False, state=copy.deepcopy(state)).preprocess_data(df=compact_input(batch))
+    assert_same_matrix(result, expected)
+
+
+@pytest.mark.parametrize("compact_preprocessing", [False, True])
+def test_fitted_state_transforms_in_parallel_chunks(compact_preprocessing, tmp_path, raw_cohort):
+    settings = Settings(experiment_type="treatment_drug", save_path=str(tmp_path), compact_preprocessing=compact_preprocessing)
+    cohort = raw_cohort(600)
+
+    preprocessor = DataPreprocessor(settings, fit=True)
+    state = preprocessor.fit_state(cohort)
+    assert os.listdir(tmp_path) == []
+
+    trained = DataPreprocessor(Settings(experiment_type="treatment_drug", save_models=False, compact_preprocessing=compact_preprocessing))
+    trained.preprocess_data(df=cohort.copy())
+    assert state["medians"] == trained.medians
+    assert state["encoded_columns"] == trained.encoded_columns
+
+    batch = raw_cohort(301, seed=1)
+    batch.loc[5, "primaryTumorLocation"] = "TRANSVERSE_COLON"
+    snapshot = copy.deepcopy({"medians": state["medians"], "encoded_columns": state["encoded_columns"]})
+    expected, _, _ = DataPreprocessor(settings, fit=False, state=copy.deepcopy(state)).preprocess_data(df=batch.copy())
+
+    pd.testing.assert_frame_equal(preprocessor.transform(batch), expected)
+    pd.testing.assert_frame_equal(preprocessor.transform(batch, n_jobs=2, chunk_size=50), expected)
+    assert {"medians": state["medians"], "encoded_columns": state["encoded_columns"]} == snapshot
+    assert os.listdir(tmp_path) == []
+
+    os.makedirs(tmp_path / "OS_preprocessor")
+    preprocessor.save_state()
+    loaded = DataPreprocessor(settings, fit=False)
+    pd.testing.assert_frame_equal(loaded.transform(batch, n_jobs=2), expected)
+
+
+@pytest.mark.parametrize("compact_preprocessing", [False, True])
+def test_missing_label_column_in_chunk_keeps_its_encoding(compact_preprocessing, raw_cohort):
+    settings = Settings(experiment_type="treatment_drug", save_models=False, compact_preprocessing=compact_preprocessing)
+    preprocessor = DataPreprocessor(settings, fit=True)
+    state = preprocessor.fit_state(raw_cohort(600))
+    assert state["encoded_columns"]["sidedness"] == {"type": "label", "classes": ["LEFT", "None"]}
+
+    batch = raw_cohort(200, seed=1)
+    batch.loc[:99, "sidedness"] = None
+    expected = preprocessor.transform(batch)
+    chunked = preprocessor.transform(batch, chunk_size=100)
+
+    pd.testing.assert_frame_equal(chunked, expected)
+    assert (expected.loc[expected.index < 100, "sidedness"] == 1).all()
+
+    record = batch.iloc[[0]]
+    plan = preprocessor.compile_transform().transform_frame(record.iloc[0].to_dict())
+    single = preprocessor.transform(record)
+    np.testing.assert_allclose(plan.to_numpy(), single[plan.columns].to_numpy(dtype=np.float64), rtol=1e-5, atol=1e-5)
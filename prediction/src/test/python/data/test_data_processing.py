@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
 import pytest
+from sklearn.preprocessing import LabelEncoder
 from data.data_processing import DataPreprocessor
 from utils.settings import Settings
 
@@ -12,6 +13,34 @@ def dp() -> DataPreprocessor:
     return DataPreprocessor(settings=test_settings, fit=True)
 
 
+def rowwise_add_treatment_drugs(dp: DataPreprocessor, df: pd.DataFrame, treatment_col: str) -> pd.DataFrame:
+    components_df = pd.DataFrame(df[treatment_col].apply(dp.parse_treatment).tolist(), index=df.index)
+    components_df["hasTreatment"] = components_df.sum(axis=1).clip(upper=1)
+    return df.join(components_df).drop(columns=[treatment_col])
+
+
+def rowwise_encode_categorical(encoded_columns: dict, df: pd.DataFrame) -> pd.DataFrame:
+    for col in [col for col in df.select_dtypes(include=["object", "category"]).columns]:
+        if col in encoded_columns and encoded_columns[col]["type"] == "label":
+            mapping = {label: idx for idx, label in enumerate(encoded_columns[col]["classes"])}
+            df[col] = df[col].astype(str).map(mapping).fillna(0).astype(int)
+        elif col in encoded_columns:
+            if df[col].isnull().all():
+                dummies = pd.DataFrame({dummy_col: [0] * len(df) for dummy_col in encoded_columns[col]["columns"]}, index=df.index)
+            else:
+                dummies = pd.get_dummies(df[col], prefix=col, dummy_na=False)
+                for dummy_col in encoded_columns[col]["columns"]:
+                    if dummy_col not in dummies.columns:
+                        dummies[dummy_col] = 0
+                dummies = dummies[encoded_columns[col]["columns"]]
+            df = pd.concat([df.drop(columns=[col]), dummies], axis=1)
+        elif df[col].nunique(dropna=False) == 2:
+            df[col] = LabelEncoder().fit_transform(df[col].astype(str))
+        else:
+            df = pd.concat([df.drop(columns=[col]), pd.get_dummies(df[col], prefix=col, dummy_na=False)], axis=1)
+    return df
+
+
 class TestDataPreprocessor:
     @pytest.mark.parametrize("treatment,expected", [
         ("FOLFOX", {"systemicTreatmentPlan_5-FU": 1, "systemicTreatmentPlan_oxaliplatin": 1, "systemicTreatmentPlan_irinotecan": 0,
@@ -67,3 +96,36 @@ class TestDataPreprocessor:
         result = dp.auto_cast_object_columns(df)
         assert pd.api.types.is_numeric_dtype(result["hasDiabetesMellitus"])
         assert pd.api.types.is_numeric_dtype(result["lactateDehydrogenaseAtMetastaticDiagnosis"])
+
+    def test_vectorized_treatments_and_encoding_match_rowwise(self, dp: DataPreprocessor):
+        rng = np.random.default_rng(0)
+        n_rows = 500
+        treatment_col = "firstSystemicTreatmentAfterMetastaticDiagnosis"
+        df = pd.DataFrame({
+            treatment_col: rng.choice(np.array(["FOLFOX", "CAPOX-B", "FOLFIRI-P", "pembrolizumab", " ", "", None, np.nan], dtype=object), n_rows),
+            "sex": rng.choice(np.array(["MALE", "FEMALE"], dtype=object), n_rows),
+            "sidedness": rng.choice(np.array(["LEFT", None], dtype=object), n_rows),
+            "hasMsi": rng.choice(np.array([True, None, np.nan], dtype=object), n_rows),
+            "primaryTumorLocation": rng.choice(np.array(["RECTUM", "SIGMOID_COLON", "COECUM", None], dtype=object), n_rows),
+            "differentiationGrade": rng.choice(np.array([1.0, 2.0, 3.0, None], dtype=object), n_rows),
+            "ageAtMetastaticDiagnosis": rng.normal(60, 10, n_rows),
+        }, index=rng.permutation(n_rows) + 1000)
+
+        expected = rowwise_add_treatment_drugs(dp, df.copy(), treatment_col)
+        pd.testing.assert_frame_equal(dp.add_treatment_drugs(df.copy(), treatment_col), expected)
+
+        grouped = dp.group_treatments(df.copy(), treatment_col)
+        assert grouped["treatment"].tolist() == [1 if pd.notnull(x) and str(x).strip() != "" else 0 for x in df[treatment_col]]
+
+        encoded = dp.encode_categorical(expected.copy())
+        pd.testing.assert_frame_equal(encoded, rowwise_encode_categorical({}, expected.copy()))
+        assert dp.encoded_columns["sidedness"] == {"type": "label", "classes": ["LEFT", "None"]}
+        assert dp.encoded_columns["hasMsi"]["type"] == "onehot"
+
+        batch = expected.iloc[:50].copy()
+        batch.loc[batch.index[:5], "primaryTumorLocation"] = "TRANSVERSE_COLON"
+        batch["differentiationGrade"] = None
+        batch.loc[batch.index[:5], "sex"] = "UNKNOWN"
+        state = {"encoded_columns": dp.encoded_columns}
+        transformed = DataPreprocessor(settings=test_settings, fit=False, state=state).encode_categorical(batch.copy())
+        pd.testing.assert_frame_equal(transformed, rowwise_encode_categorical(dp.encoded_columns, batch.copy()))
@@ -0,0 +1,68 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from sklearn.impute import KNNImputer
+
+from data.data_processing import DataPreprocessor
+from data.imputation import NeighborImputer
+from data.lookups import lookup_manager
+from predictor import load_preprocessor
+from utils.settings import Settings
+
+WHO = "whoAssessmentAtMetastaticDiagnosis"
+
+
+def test_single_column_imputation_matches_knn_imputer():
+    rng = np.random.default_rng(0)
+    fit = pd.DataFrame({WHO: np.where(rng.random(2000) < 0.2, np.nan, rng.integers(0, 5, 2000))})
+    batch = pd.DataFrame({WHO: [np.nan, 3.0, np.nan]})
+
+    knn = KNNImputer(n_neighbors=7)
+    imputer = NeighborImputer([WHO], n_neighbors=7).fit(fit)
+
+    np.testing.assert_array_equal(imputer.transform(fit), knn.fit_transform(fit))
+    np.testing.assert_array_equal(imputer.transform(batch), knn.transform(batch))
+    restored = NeighborImputer.from_config(json.loads(json.dumps(imputer.to_config())))
+    np.testing.assert_array_equal(restored.transform(batch), imputer.transform(batch))
+
+
+def test_partially_missing_rows_take_their_nearest_complete_rows():
+    fit = pd.DataFrame({"a": [0.0, 0.1, 0.2, 10.0, 10.1, np.nan], "b": [1.0, 2.0, 3.0, 50.0, 60.0, 7.0]})
+    imputer = NeighborImputer(["a", "b"], n_neighbors=2).fit(fit)
+
+    imputed = imputer.transform(pd.DataFrame({"a": [0.05, 10.05, np.nan, 1.0], "b": [np.nan, np.nan, np.nan, 4.0]}))
+
+    np.testing.assert_allclose(imputed, [[0.05, 1.5], [10.05, 55.0], [fit["a"].mean(), fit["b"].mean()], [1.0, 4.0]])
+
+
+def test_fitted_imputer_is_persisted_and_applied_when_serving(tmp_path):
+    settings = Settings(save_path=str(tmp_path))
+    os.makedirs(tmp_path / f"{settings.outcome}_preprocessor")
+    rng = np.random.default_rng(1)
+    cohort = pd.DataFrame({
+        "firstSystemicTreatmentAfterMetastaticDiagnosis": rng.choice(["FOLFOX", "CAPOX", None], 300),
+        "ageAtMetastaticDiagnosis": rng.normal(60, 10, 300),
+        WHO: np.where(rng.random(300) < 0.3, np.nan, rng.integers(0, 2, 300)),
+        settings.duration_col: rng.integers(1, 2000, 300),
+        settings.event_col: rng.random(300) < 0.7,
+    })
+    cohort = cohort.assign(**{feature: rng.normal(size=300) for feature in lookup_manager.features if feature not in cohort})
+
+    fitted = DataPreprocessor(settings, fit=True)
+    fitted.preprocess_data(df=cohort)
+    fill_value = cohort[WHO].mean()
+    assert fitted.imputers[WHO].fill_values == {WHO: fill_value}
+    assert fill_value != cohort[WHO].median()
+
+    row = cohort.iloc[[0]].assign(**{WHO: np.nan})
+    expected = fitted.scaler.transform(pd.DataFrame({col: [0.0] for col in fitted.scaler.feature_names_in_}).assign(**{WHO: fill_value}))
+    who_position = list(fitted.scaler.feature_names_in_).index(WHO)
+
+    for preprocessor in [DataPreprocessor(settings, fit=False),
+                         load_preprocessor(str(tmp_path), Settings(save_path=str(tmp_path / f"{settings.outcome}_preprocessor")))]:
+        assert preprocessor.imputers[WHO].fill_values == {WHO: fill_value}
+        processed, _, _ = preprocessor.preprocess_data(df=row)
+        assert processed[WHO].iloc[0] == expected[0, who_position]
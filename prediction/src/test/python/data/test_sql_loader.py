@@ -0,0 +1,72 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.data_processing import DataPreprocessor
+from data.lookups import lookup_manager
+from data.sql_loader import read_table, widen_compact_dtypes
+from utils.settings import Settings
+
+
+@pytest.fixture
+def reference_view(tmp_path) -> str:
+    """
+    Path of a SQLite database with a 120-row `palliativeReference` view: string categories, nullable booleans, an
+    unused column, and albumine and sidedness NULL for the first 41 rows, a whole chunk when read 20 rows at a time.
+    """
+    rng = np.random.default_rng(0)
+    n_rows = 120
+    df = pd.DataFrame({feature: np.round(rng.normal(50, 15, n_rows), 1) for feature in lookup_manager.features})
+    for feature in ["sex", "primaryTumorLocation", "clinicalTnmT", "firstSystemicTreatmentAfterMetastaticDiagnosis"]:
+        df[feature] = rng.choice(np.array(["A", "B", "C", None], dtype=object), n_rows)
+    df["hasMsi"] = rng.choice(np.array([1, 0, None], dtype=object), n_rows)
+    df["numberOfPriorTumors"] = rng.integers(0, 3, n_rows)
+    df["ageAtMetastaticDiagnosis"] = np.where(rng.random(n_rows) < 0.1, np.nan, df["ageAtMetastaticDiagnosis"])
+    df.loc[:40, "albumineAtMetastaticDiagnosis"] = np.nan
+    df["sidedness"] = np.where(np.arange(n_rows) <= 40, None, "LEFT")
+    df["survivalDaysSinceMetastaticDiagnosis"] = rng.integers(1, 2000, n_rows)
+    df["hadSurvivalEvent"] = rng.integers(0, 2, n_rows)
+    df["sourceId"] = np.arange(n_rows)
+    df["unusedViewColumn"] = "x"
+
+    path = str(tmp_path / "reference.db")
+    with sqlite3.connect(path) as connection:
+        df.to_sql("palliativeReference", connection, index=False)
+    return path
+
+
+def test_streamed_table_matches_read_sql(reference_view):
+    connection = sqlite3.connect(reference_view)
+    columns = lookup_manager.features + ["survivalDaysSinceMetastaticDiagnosis", "hadSurvivalEvent", "sourceId", "notInView"]
+
+    compact = read_table(connection, "palliativeReference", columns, chunk_size=20)
+    expected = pd.read_sql("SELECT * FROM palliativeReference", connection)
+
+    assert list(compact.columns) == [col for col in columns if col != "notInView"]
+    assert isinstance(compact["sex"].dtype, pd.CategoricalDtype)
+    assert isinstance(compact["sidedness"].dtype, pd.CategoricalDtype)
+    assert compact["numberOfPriorTumors"].dtype == np.int8
+    assert compact["hasMsi"].dtype == np.float64
+    pd.testing.assert_frame_equal(widen_compact_dtypes(compact), expected[compact.columns])
+
+    float32 = read_table(connection, "palliativeReference", columns, chunk_size=20, float_dtype=np.float32)
+    assert float32["albumineAtMetastaticDiagnosis"].dtype == np.float32
+    np.testing.assert_allclose(float32["albumineAtMetastaticDiagnosis"], expected["albumineAtMetastaticDiagnosis"], rtol=1e-6)
+
+
+def test_preprocessing_is_unchanged_by_compact_loading(reference_view, monkeypatch):
+    monkeypatch.setattr(DataPreprocessor, "_connect", lambda self: sqlite3.connect(reference_view))
+    connection = sqlite3.connect(reference_view)
+    settings = Settings(save_models=False)
+
+    loaded = DataPreprocessor(settings, fit=True)._load_data_from_db()
+    assert "unusedViewColumn" not in loaded.columns
+    assert loaded["sex"].dtype == "category"
+    assert loaded["albumineAtMetastaticDiagnosis"].dtype == np.float64
+
+    expected, _, _ = DataPreprocessor(settings, fit=True).preprocess_data(df=pd.read_sql("SELECT * FROM palliativeReference", connection))
+    result, _, _ = DataPreprocessor(settings, fit=True).preprocess_data(df=loaded)
+
+    pd.testing.assert_frame_equal(result, expected)
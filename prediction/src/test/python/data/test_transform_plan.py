@@ -0,0 +1,102 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.data_processing import DataPreprocessor
+from data.lookups import lookup_manager
+from utils.settings import Settings
+
+CATEGORIES = {
+    "sex": ["MALE", "FEMALE"],
+    "primaryTumorType": ["CRC_ADENOCARCINOMA", "CRC_MUCINOUS", "CRC_SIGNET_RING"],
+    "primaryTumorLocation": ["RECTUM", "SIGMOID_COLON", "COECUM", "ASCENDING_COLON"],
+    "sidedness": ["LEFT", "RIGHT"],
+    "extraMuralInvasionCategory": ["NONE", "ABOVE_FIVE_MM", "BELOW_FIVE_MM"],
+}
+LABELS = ["sex", "sidedness"]
+
+
+@pytest.fixture(scope="module")
+def cohort_records():
+    """Factory of patient records as the predictor receives them: JSON scalars, ~15% missing except the label columns."""
+    def make(n_rows: int, seed: int):
+        rng = np.random.default_rng(seed)
+        records = []
+        for _ in range(n_rows):
+            record = {}
+            for feature in lookup_manager.features:
+                missing = rng.random() < 0.15 and feature not in LABELS
+                if feature == "firstSystemicTreatmentAfterMetastaticDiagnosis":
+                    record[feature] = rng.choice(["FOLFOX", "CAPOX-B", "FOLFIRI-P", "pembrolizumab", "", None])
+                elif feature in CATEGORIES:
+                    record[feature] = None if missing else str(rng.choice(CATEGORIES[feature]))
+                elif feature in lookup_manager.lookup_dictionary:
+                    record[feature] = None if missing else str(rng.choice(list(lookup_manager.lookup_dictionary[feature])))
+                elif feature.startswith("has"):
+                    record[feature] = None if missing else bool(rng.random() < 0.3)
+                elif feature == "whoAssessmentAtMetastaticDiagnosis":
+                    record[feature] = None if missing else int(rng.integers(0, 5))
+                else:
+                    record[feature] = None if missing else float(np.round(rng.normal(50, 15), 1))
+            records.append(record)
+        return records
+
+    return make
+
+
+@pytest.fixture(scope="module", params=["treatment_drug", "treatment_vs_no"])
+def fitted(request, cohort_records):
+    settings = Settings(experiment_type=request.param, save_models=False)
+    cohort = pd.DataFrame(cohort_records(400, seed=0))
+    rng = np.random.default_rng(1)
+    cohort[settings.duration_col] = rng.integers(1, 2000, len(cohort))
+    cohort[settings.event_col] = rng.random(len(cohort)) < 0.7
+
+    preprocessor = DataPreprocessor(settings, fit=True)
+    preprocessor.preprocess_data(df=cohort)
+    state = {
+        "medians": preprocessor.medians,
+        "encoded_columns": preprocessor.encoded_columns,
+        "scaler": preprocessor.scaler,
+        "imputers": preprocessor.imputers,
+    }
+    return settings, state
+
+
+def reference_transform(settings, state, record):
+    preprocessor = DataPreprocessor(settings, fit=False, preprocessor_path=False, state=copy.deepcopy(state))
+    df = pd.DataFrame([{**record, settings.duration_col: None, settings.event_col: None}])
+    processed, _, _ = preprocessor.preprocess_data(df=df)
+    return processed.drop(columns=[settings.duration_col, settings.event_col])
+
+
+def test_transform_plan_matches_preprocess_data(fitted, cohort_records):
+    settings, state = fitted
+    plan = DataPreprocessor(settings, fit=False, preprocessor_path=False, state=copy.deepcopy(state)).compile_transform()
+
+    records = cohort_records(50, seed=2)
+    records.append({feature: None for feature in lookup_manager.features} | {"ageAtMetastaticDiagnosis": 61})
+    records.append(records[0] | {"whoAssessmentAtMetastaticDiagnosis": None, "sex": None, "primaryTumorLocation": None})
+    records.append(records[1] | {"sex": "UNKNOWN", "primaryTumorLocation": "TRANSVERSE_COLON", "clinicalTnmT": "T9"})
+    records.append(records[2] | {"ageAtMetastaticDiagnosis": "64", "lactateDehydrogenaseAtMetastaticDiagnosis": "212.5"})
+
+    for record in records:
+        expected = reference_transform(settings, state, record)
+        vector = plan.transform(record)
+
+        assert plan.columns == list(expected.columns)
+        assert vector.dtype == np.float32
+        np.testing.assert_array_equal(vector, expected.values.astype(np.float32)[0])
+        np.testing.assert_array_equal(plan.transform(record, dtype=np.float64), expected.values.astype(np.float64)[0])
+
+
+def test_transform_plan_defers_rows_it_cannot_compile(fitted, cohort_records):
+    settings, state = fitted
+    plan = DataPreprocessor(settings, fit=False, preprocessor_path=False, state=copy.deepcopy(state)).compile_transform()
+    record = cohort_records(1, seed=3)[0]
+
+    assert plan.transform(record | {"firstSystemicTreatmentAfterMetastaticDiagnosis": "FOLFOX-NIVOLUMAB"}) is None
+    assert plan.transform({feature: None for feature in lookup_manager.features}) is None
+    assert plan.transform(record | {"ageAtMetastaticDiagnosis": "unknown"}) is None
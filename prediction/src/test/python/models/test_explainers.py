@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+import torch
+
+from models.explainers import (
+    BatchedPermutationExplainer, LinearExplainer, TreeEnsembleExplainer, IntegratedGradientsExplainer, build_explainer
+)
+from models.survival_models import (
+    CoxPHModel, RandomSurvivalForestModel, GradientBoostingSurvivalModel, DeepSurv, DeepHitModel, MTLRModel
+)
+
+
+def test_batched_permutation_is_exact_for_linear_model(survival_data):
+    background, _ = survival_data(50)
+    coefficients = np.array([0.5, -1.0, 2.0, 0.0])
+    explainer = BatchedPermutationExplainer(lambda X: X.values @ coefficients, background)
+
+    X, _ = survival_data(3)
+    explanation = explainer(X)
+
+    expected = (X.values - background.values.mean(axis=0)) * coefficients
+    np.testing.assert_allclose(explanation.values, expected, atol=1e-10)
+    assert explanation.feature_names == ["a", "b", "c", "d"]
+
+
+def test_batched_permutation_is_additive_with_weights(survival_data):
+    background, _ = survival_data(50)
+    weights = np.linspace(1.0, 2.0, len(background))
+    predict = lambda X: np.tanh(X["a"].values * X["b"].values) + X["c"].values ** 2
+    explainer = BatchedPermutationExplainer(predict, background, weights=weights)
+
+    X, _ = survival_data(5)
+    explanation = explainer(X)
+
+    np.testing.assert_allclose(explanation.values.sum(axis=1) + explanation.base_values, predict(X), atol=1e-10)
+    np.testing.assert_allclose(explanation.base_values, np.average(predict(background), weights=weights), atol=1e-10)
+
+
+def test_batched_permutation_aligns_columns_by_name(survival_data):
+    background, _ = survival_data(50)
+    coefficients = np.array([0.5, -1.0, 2.0, 0.0])
+    explainer = BatchedPermutationExplainer(lambda X: X.values @ coefficients, background)
+
+    X, _ = survival_data(3)
+    shuffled = explainer(X[["d", "c", "b", "a"]])
+
+    np.testing.assert_allclose(shuffled.values, explainer(X).values)
+
+
+def test_batched_permutation_bounds_batches_by_max_batch_rows(survival_data):
+    background, _ = survival_data(50)
+    predict = lambda X: np.tanh(X["a"].values * X["b"].values) + X["c"].values ** 2
+    batch_sizes = []
+
+    def recording_predict(X):
+        batch_sizes.append(len(X))
+        return predict(X)
+
+    X, _ = survival_data(5)
+    expected = BatchedPermutationExplainer(predict, background)(X)
+    explanation = BatchedPermutationExplainer(recording_predict, background, max_batch_rows=120)(X)
+
+    assert max(batch_sizes) <= 120
+    np.testing.assert_allclose(explanation.values, expected.values, atol=1e-12)
+
+
+def assert_agrees_with_permutation(model, X, expected_type, rtol: float, min_correlation: float = 0.99):
+    background, X_explain = X.iloc[:20], X.iloc[100:106]
+    weights = np.linspace(1.0, 2.0, len(background))
+
+    explainer = build_explainer(model, background, weights)
+    assert isinstance(explainer, expected_type)
+
+    fast = explainer(X_explain)
+    reference = BatchedPermutationExplainer(model.predict, background, weights, n_permutations=50)(X_explain)
+
+    scale = np.abs(reference.values).mean()
+    assert np.abs(fast.values - reference.values).mean() <= rtol * scale
+    assert np.corrcoef(fast.values.ravel(), reference.values.ravel())[0, 1] >= min_correlation
+    np.testing.assert_allclose(fast.base_values, reference.base_values, rtol=1e-2, atol=1e-5)
+
+
+def test_linear_explainer_matches_permutation_for_coxph(survival_data):
+    X, y = survival_data()
+    model = CoxPHModel()
+    model.fit(X, y)
+    assert_agrees_with_permutation(model, X, LinearExplainer, rtol=1e-8)
+
+
+@pytest.mark.parametrize("model_class, kwargs", [
+    (RandomSurvivalForestModel, {"n_estimators": 20, "min_samples_leaf": 10, "random_state": 0}),
+    (GradientBoostingSurvivalModel, {"n_estimators": 30, "random_state": 0}),
+])
+def test_tree_explainer_matches_permutation(model_class, kwargs, survival_data):
+    X, y = survival_data()
+    model = model_class(**kwargs)
+    model.fit(X, y)
+    assert_agrees_with_permutation(model, X, TreeEnsembleExplainer, rtol=0.03)
+
+
+@pytest.mark.parametrize("model_class", [DeepSurv, DeepHitModel, MTLRModel])
+def test_gradient_explainer_approximates_permutation(model_class, survival_data):
+    torch.manual_seed(0)
+    X, y = survival_data()
+    model = model_class(input_size=X.shape[1], epochs=10, use_attention=True, gate_msi_index=3, gate_immuno_index=[2])
+    model.fit(X, y)
+    # the approximation error IntegratedGradientsExplainer documents as accepted
+    assert_agrees_with_permutation(model, X, IntegratedGradientsExplainer, rtol=0.25, min_correlation=0.98)
+
+
+def test_gradient_explainer_bounds_batches_by_max_batch_rows(survival_data):
+    torch.manual_seed(0)
+    X, y = survival_data()
+    model = DeepSurv(input_size=X.shape[1], epochs=2)
+    model.fit(X, y)
+    background, X_explain = X.iloc[:20], X.iloc[100:106]
+
+    expected = build_explainer(model, background)(X_explain)
+    explainer = build_explainer(model, background)
+    explainer.max_batch_rows = 100
+    risk, batch_sizes = explainer._risk, []
+
+    def recording_risk(inputs):
+        batch_sizes.append(len(inputs))
+        return risk(inputs)
+
+    explainer._risk = recording_risk
+    explanation = explainer(X_explain)
+
+    assert max(batch_sizes) <= 100
+    np.testing.assert_allclose(explanation.values, expected.values, rtol=1e-5, atol=1e-6)
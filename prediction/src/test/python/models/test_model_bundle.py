@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sklearn.preprocessing import StandardScaler
+
+from models.model_bundle import ModelBundle, save_model_bundle
+from models.survival_models import DeepSurv, LogisticHazardModel
+
+
+@pytest.mark.parametrize("model_class", [DeepSurv, LogisticHazardModel])
+def test_model_bundle_round_trip(tmp_path, model_class, survival_data):
+    X, y = survival_data(200)
+    model = model_class(input_size=X.shape[1], epochs=2, use_attention=True, gate_msi_index=3, gate_immuno_index=[2])
+    model.fit(X, y)
+    scaler = StandardScaler().fit(X[["a", "b"]])
+
+    path = str(tmp_path / "model.bundle")
+    save_model_bundle(
+        path,
+        model,
+        medians={"a": 0.5},
+        encoded_columns={"sex": {"type": "label", "classes": ["FEMALE", "MALE"]}},
+        scaler=scaler,
+        tnm_stage_medians={"clinical": {}},
+        imputers={"a": {"columns": ["a"], "n_neighbors": 7, "fill_values": {"a": 0.1}, "donors": None}},
+        shap_background=(X.values[:10], np.full(10, 0.1), X.columns.tolist())
+    )
+
+    bundle = ModelBundle(path)
+    loaded = bundle.build_model()
+
+    np.testing.assert_allclose(loaded.predict(X), model.predict(X), rtol=1e-6)
+    assert loaded.net.attention.msi_index == 3 and loaded.net.attention.immuno_index == [2]
+    assert isinstance(bundle.array("net/mlp.net.0.linear.weight"), np.memmap)
+
+    loaded_scaler = bundle.build_scaler()
+    np.testing.assert_allclose(loaded_scaler.transform(X[["a", "b"]]), scaler.transform(X[["a", "b"]]))
+
+    background, weights = bundle.shap_background()
+    pd.testing.assert_frame_equal(background, X.iloc[:10].reset_index(drop=True))
+    np.testing.assert_allclose(weights, 0.1)
+    assert bundle.medians == {"a": 0.5}
+    assert bundle.encoded_columns["sex"]["classes"] == ["FEMALE", "MALE"]
+    assert bundle.tnm_stage_medians == {"clinical": {}}
+    assert bundle.imputers["a"]["fill_values"] == {"a": 0.1}
+
+
+def test_model_bundle_rejects_other_files(tmp_path):
+    path = tmp_path / "model.bundle"
+    path.write_bytes(b"not a bundle" * 4)
+
+    with pytest.raises(ValueError):
+        ModelBundle(str(path))
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sksurv.util import Surv
+
+from models.model_trainer import ModelTrainer
+from models.survival_models import CoxPHModel, GradientBoostingSurvivalModel
+from utils.settings import Settings
+
+
+@pytest.fixture
+def train_test_data():
+    """X_train, y_train, X_test, y_test for `ModelTrainer.train_and_evaluate` with the columns of the default Settings."""
+    settings = Settings()
+    n_rows = 300
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(n_rows, 5)), columns=["a", "b", "c", "d", "e"])
+    X["f"] = rng.random(n_rows) < 0.4
+    durations = np.exp(6 + 0.5 * X["a"] - 0.4 * X["f"] + rng.normal(size=n_rows))
+    # the concordance of each fold needs events before its first evaluation time
+    events = (rng.random(n_rows) < 0.7) | (durations < 200)
+    y = Surv.from_arrays(events, durations, name_event=settings.event_col, name_time=settings.duration_col)
+    return X.iloc[:250], y[:250], X.iloc[250:], y[250:]
+
+
+@pytest.mark.parametrize("model_class, kwargs", [
+    (CoxPHModel, {"alpha": 0.1}),
+    (GradientBoostingSurvivalModel, {"n_estimators": 20, "random_state": 0}),
+])
+def test_process_backend_matches_threading_backend(model_class, kwargs, train_test_data):
+    results = {}
+    for backend in ["threading", "processes"]:
+        settings = Settings(save_models=False, n_jobs=2, cross_val_n_splits=3, cv_backend=backend)
+        trainer = ModelTrainer(models={"model": model_class(**kwargs)}, settings=settings)
+        results[backend], _ = trainer.train_and_evaluate(*train_test_data, encoded_columns={})
+
+    assert results["processes"] == results["threading"]
+
+
+def test_process_backend_removes_shared_files_when_a_fold_fails(monkeypatch, train_test_data):
+    settings = Settings(save_models=False, n_jobs=2, cross_val_n_splits=3, cv_backend="processes")
+    trainer = ModelTrainer(models={"model": CoxPHModel(alpha=0.1)}, settings=settings)
+    directories = []
+
+    def failing_run_folds(model_name, model_template, folds, X, y, encoded_columns, shared_data, budget):
+        directories.append(os.path.dirname(shared_data.X_path))
+        raise RuntimeError("fold failed")
+
+    monkeypatch.setattr(trainer, "_run_folds", failing_run_folds)
+    # the traceback kept by excinfo keeps the frame of train_and_evaluate, so only explicit cleanup removes the files
+    with pytest.raises(RuntimeError, match="fold failed") as excinfo:
+        trainer.train_and_evaluate(*train_test_data, encoded_columns={})
+
+    assert len(directories) == 1 and not os.path.exists(directories[0])
+    assert excinfo.traceback
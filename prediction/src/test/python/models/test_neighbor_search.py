@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from models.neighbor_search import build_neighbor_index
+
+
+@pytest.fixture
+def low_rank_matrix() -> np.ndarray:
+    """2000 x 40 points near a 5-dimensional subspace, like the correlated features of the reference cohort."""
+    rng = np.random.default_rng(0)
+    latent = rng.normal(size=(2000, 5))
+    return latent @ rng.normal(size=(5, 40)) + 0.3 * rng.normal(size=(2000, 40))
+
+
+@pytest.mark.parametrize("backend, kwargs", [
+    ("kd_tree", {}),
+    ("ball_tree", {}),
+    ("projected", {"n_components": None, "block_size": 300}),
+])
+def test_exact_backends_match_brute_force(backend, kwargs, low_rank_matrix):
+    reference, queries = low_rank_matrix[:1900], low_rank_matrix[1900:]
+
+    expected_distances, expected_indices = build_neighbor_index("brute", n_neighbors=10).fit(reference).kneighbors(queries)
+    distances, indices = build_neighbor_index(backend, n_neighbors=10, **kwargs).fit(reference).kneighbors(queries)
+
+    np.testing.assert_array_equal(indices, expected_indices)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-4)
+
+
+def test_projected_backend_recall(low_rank_matrix):
+    reference, queries = low_rank_matrix[:1900], low_rank_matrix[1900:]
+
+    _, expected = build_neighbor_index("brute", n_neighbors=10).fit(reference).kneighbors(queries)
+    _, indices = build_neighbor_index("projected", n_neighbors=10, n_components=16, block_size=500).fit(reference).kneighbors(queries, n_neighbors=5)
+
+    assert indices.shape == (100, 5)
+    recall = np.mean([len(np.intersect1d(a, b[:5])) / 5 for a, b in zip(indices, expected)])
+    assert recall > 0.9
+
+
+def test_unknown_backend_and_metric_are_rejected():
+    with pytest.raises(ValueError):
+        build_neighbor_index("annoy")
+    with pytest.raises(ValueError):
+        build_neighbor_index("projected", metric="manhattan")
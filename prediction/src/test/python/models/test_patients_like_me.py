@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import StandardScaler
+
+from models.patients_like_me import PATIENTS_LIKE_ME_INDEX_FILE, PatientsLikeMeIndex, PatientsLikeMeModel
+from utils.settings import Settings
+from utils.treatment_combinations import treatment_combinations
+
+
+@pytest.fixture
+def treatment_cohort() -> pd.DataFrame:
+    """300 preprocessed patients with treatment plan columns, as `PatientsLikeMeModel.build_index` expects."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.normal(size=(300, 4)), columns=["ageAtMetastaticDiagnosis", "whoAssessmentAtMetastaticDiagnosis", "hasMsi", "sex"])
+    plans = pd.DataFrame([treatment_combinations[name] for name in rng.choice(["No Treatment", "5-FU", "5-FU + oxaliplatin"], 300)])
+    df = pd.concat([df, plans], axis=1)
+    df["hasTreatment"] = (plans.sum(axis=1) > 0).astype(int)
+    df["survivalDaysSinceMetastaticDiagnosis"] = rng.integers(1, 2000, 300)
+    df["hadSurvivalEvent"] = rng.integers(0, 2, 300)
+    return df
+
+
+def test_find_similar_patients_matches_refitted_neighbors(tmp_path, treatment_cohort):
+    df = treatment_cohort
+    patient = df.iloc[[7]].assign(tumorRegression=0.0)
+    model = PatientsLikeMeModel(Settings(save_path=str(tmp_path)), index=PatientsLikeMeModel(Settings()).build_index(df))
+
+    features = df.drop(columns=PatientsLikeMeModel.exclude)
+    scaler = StandardScaler().fit(features)
+    _, indices = NearestNeighbors(n_neighbors=25).fit(scaler.transform(features)).kneighbors(scaler.transform(features.iloc[[7]]))
+    treatments = model.merge_treatment_columns(df[PatientsLikeMeModel.exclude])
+
+    distribution = model.find_similar_patients(patient)
+    expected = treatments.loc[indices[0]].value_counts(normalize=True)
+    pd.testing.assert_series_equal(distribution["similarPatientsTreatmentProportion"][expected.index], expected, check_names=False)
+
+
+def test_saved_index_is_loaded_from_trained_path(tmp_path, treatment_cohort):
+    df = treatment_cohort
+    patient = df.iloc[[3]].assign(tumorRegression=0.0)
+    index = PatientsLikeMeModel(Settings()).build_index(df)
+    index.save(str(tmp_path / PATIENTS_LIKE_ME_INDEX_FILE))
+
+    model = PatientsLikeMeModel(Settings(save_path=str(tmp_path)))
+
+    assert isinstance(model.load_index(), PatientsLikeMeIndex)
+    pd.testing.assert_frame_equal(model.find_similar_patients(patient), PatientsLikeMeModel(Settings(), index=index).find_similar_patients(patient))
+
+
+def test_configured_backend_and_batch_queries(tmp_path, treatment_cohort):
+    df = treatment_cohort
+    settings = Settings(save_path=str(tmp_path), patients_like_me_backend="projected", patients_like_me_n_neighbors=10)
+    model = PatientsLikeMeModel(settings)
+    model.index = model.build_index(df)
+
+    distances, indices = model.find_neighbors(df.iloc[:5])
+    expected_distances, expected_indices = PatientsLikeMeModel(Settings(patients_like_me_n_neighbors=10), index=PatientsLikeMeModel(Settings()).build_index(df)).find_neighbors(df.iloc[:5])
+
+    assert indices.shape == (5, 10)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-4)
+
+
+def test_batch_treatment_distributions_match_per_patient_counts(treatment_cohort):
+    df = treatment_cohort
+    model = PatientsLikeMeModel(Settings(), index=PatientsLikeMeModel(Settings()).build_index(df))
+
+    distributions = model.treatment_distributions(df.iloc[:20])
+    _, indices = model.find_neighbors(df.iloc[:20])
+
+    assert distributions.shape == (20, len(model.index.treatment_names))
+    for row, neighbors in enumerate(indices):
+        expected = model.index.treatments.loc[neighbors].value_counts(normalize=True)
+        np.testing.assert_allclose(distributions.iloc[row][expected.index], expected.values)
+        assert np.isclose(distributions.iloc[row].sum(), 1.0)
+
+
+def test_incremental_refresh_matches_full_rebuild(tmp_path, raw_cohort):
+    settings = Settings(save_path=str(tmp_path), save_models=False)
+    cohort = raw_cohort(300)
+    model = PatientsLikeMeModel(settings)
+    model.index = model.build_index_from_cohort(cohort)
+
+    updated = cohort.drop(index=range(10)).reset_index(drop=True)
+    updated.loc[:4, "ageAtMetastaticDiagnosis"] = 99.0
+    updated = pd.concat([updated, raw_cohort(20, seed=1, first_source_id=1000)], ignore_index=True)
+
+    changes = model.refresh_index(updated)
+    report = model.check_index_consistency(updated)
+
+    assert changes == {"added": 20, "changed": 5, "removed": 10, "tombstoned": 15}
+    assert report["consistent"], report
+    assert set(model.index.source_ids[model.index.active]) == set(updated["sourceId"])
+
+    model.index.save(str(tmp_path / PATIENTS_LIKE_ME_INDEX_FILE))
+    patients = model.preprocess_rows(updated.iloc[:5], model.index.preprocessing_state)
+    pd.testing.assert_frame_equal(PatientsLikeMeModel(settings).treatment_distributions(patients), model.treatment_distributions(patients))
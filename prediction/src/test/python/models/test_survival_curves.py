@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from scipy.interpolate import interp1d
+
+from models.survival_curves import SurvivalCurveBatch
+from models.survival_models import CoxPHModel, RandomSurvivalForestModel, GradientBoostingSurvivalModel, DeepSurv
+
+
+def test_interpolation_matches_interp1d():
+    rng = np.random.default_rng(0)
+    times = np.sort(rng.uniform(0, 100, 20))
+    values = np.sort(rng.random((5, 20)), axis=1)[:, ::-1].astype(np.float32)
+    query = np.array([-10.0, times[0], 33.3, times[7], 99.0, 150.0])
+
+    curves = SurvivalCurveBatch(times, values)
+    expected = np.row_stack([interp1d(times, row, bounds_error=False, fill_value="extrapolate")(query) for row in values])
+
+    np.testing.assert_allclose(curves(query), expected, rtol=1e-5)
+    np.testing.assert_allclose(curves[2](query), expected[2], rtol=1e-5)
+    assert np.isclose(curves[2](33.3), expected[2, 2])
+
+
+@pytest.mark.parametrize("model_class", [CoxPHModel, RandomSurvivalForestModel, GradientBoostingSurvivalModel])
+def test_sksurv_models_match_step_functions(model_class, survival_data):
+    X, y = survival_data(100)
+    model = model_class()
+    model.fit(X, y)
+
+    curves = model.predict_survival_function(X.iloc[:5])
+    features = X[model.selected_features] if model_class is CoxPHModel else X
+    step_functions = model.model.predict_survival_function(features.iloc[:5])
+    query = np.linspace(0, curves.times[-1], 50)
+
+    assert curves.values.shape == (5, len(curves.times)) and curves.values.dtype == np.float32
+    np.testing.assert_allclose(curves(query), np.row_stack([fn(query) for fn in step_functions]), atol=1e-6)
+
+
+def test_nn_model_returns_batch_on_model_grid(survival_data):
+    X, y = survival_data(100)
+    model = DeepSurv(input_size=X.shape[1], epochs=2)
+    model.fit(X, y)
+
+    surv = model.model.predict_surv_df(X.values.astype("float32"))
+    curves = model.predict_survival_function(X)
+    np.testing.assert_allclose(curves.values, surv.values.T, rtol=1e-6)
+
+    times = np.array([30, 90, 180])
+    expected = surv.reindex(times, method="nearest").values.T
+    np.testing.assert_allclose(model.predict_survival_function(X, times=times).values, expected, rtol=1e-6)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+import torch
+
+from models.explainers import build_explainer
+from models.survival_models import DeepSurv, LogisticHazardModel, DeepHitModel, PCHazardModel, MTLRModel
+from models.torchscript_model import TorchScriptSurvivalModel, export_torchscript
+from utils.settings import Settings, config_settings
+
+
+@pytest.fixture(params=[DeepSurv, LogisticHazardModel, DeepHitModel, PCHazardModel, MTLRModel])
+def exported(request, tmp_path, survival_data):
+    torch.manual_seed(0)
+    X, y = survival_data(200)
+    model = request.param(input_size=X.shape[1], epochs=3, use_attention=True, gate_msi_index=3, gate_immuno_index=[2])
+    model.fit(X, y)
+
+    path = str(tmp_path / "model.torchscript")
+    export_torchscript(model, path)
+    return model, TorchScriptSurvivalModel(path), X
+
+
+def test_torchscript_reproduces_survival_curves(exported):
+    model, scripted, X = exported
+
+    expected = model.model.predict_surv_df(X.values.astype("float32"))
+    np.testing.assert_allclose(scripted.times, expected.index.values, rtol=1e-6)
+    np.testing.assert_allclose(scripted.survival(X.values), expected.values.T, atol=1e-5)
+    np.testing.assert_allclose(scripted.predict(X), model.predict(X), rtol=1e-4, atol=1e-5)
+
+    curves = scripted.predict_survival_function(X.iloc[:3])
+    np.testing.assert_allclose(curves[0](scripted.times), expected.values[:, 0], atol=1e-5)
+
+
+def test_torchscript_exports_input_gate(exported):
+    model, scripted, X = exported
+
+    with torch.no_grad():
+        expected = model.net.attention._apply_gate(torch.tensor(X.values, dtype=torch.float32)).numpy()
+    X_values = X.values.copy()
+
+    np.testing.assert_allclose(scripted.apply_gate(X_values), expected)
+    assert scripted.use_gate is True
+    np.testing.assert_array_equal(X_values, X.values)
+
+
+def test_gradient_explainer_matches_eager_model(exported):
+    model, scripted, X = exported
+    background, X_explain = X.iloc[:20], X.iloc[100:104]
+
+    eager = build_explainer(model, background)
+    model.predict(X_explain)
+
+    np.testing.assert_allclose(build_explainer(scripted, background)(X_explain).values, eager(X_explain).values, atol=1e-5)
+
+
+def test_export_takes_the_gate_from_the_exported_settings(tmp_path, monkeypatch, survival_data):
+    torch.manual_seed(0)
+    X, y = survival_data(200)
+    model = DeepSurv(input_size=X.shape[1], epochs=3, use_attention=True, gate_msi_index=3, gate_immuno_index=[2])
+    model.fit(X, y)
+
+    path = str(tmp_path / "model.torchscript")
+    export_torchscript(model, path, Settings(use_gate=False))
+    scripted = TorchScriptSurvivalModel(path)
+
+    assert config_settings.use_gate and model.net.attention.use_gate is None
+    assert scripted.use_gate is False
+    np.testing.assert_array_equal(scripted.apply_gate(X.values), X.values.astype(np.float32))
+
+    monkeypatch.setattr(config_settings, "use_gate", False)
+    expected = model.model.predict_surv_df(X.values.astype("float32"))
+    np.testing.assert_allclose(scripted.survival(X.values), expected.values.T, atol=1e-5)
@@ -0,0 +1,113 @@
+import argparse
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import prediction_server
+import predictor
+import run_prediction
+
+from predictor import PredictionService
+from utils.settings import Settings
+
+SCENARIOS = [
+    {"treatment": "FOLFOX", "survivalProbs": [0.9, 0.7, 0.5], "shapValues": {"Age": {"featureValue": 0.3, "shapValue": -0.02}}},
+    {"treatment": "No Treatment", "survivalProbs": [0.8, 0.4, 0.2], "shapValues": {"Age": {"featureValue": 0.3, "shapValue": 0.01}}},
+]
+SUMMARY = {
+    "overallTreatmentProportion": [{"treatment": "FOLFOX", "proportion": 0.6}, {"treatment": "No Treatment", "proportion": 0.4}],
+    "similarPatientsTreatmentProportion": [{"treatment": "FOLFOX", "proportion": 1.0}, {"treatment": "No Treatment", "proportion": 0.0}],
+}
+
+
+class StubService(PredictionService):
+    """`PredictionService.predict` without loading a trained model: the scenario and similar patient steps are stubbed."""
+    def __init__(self, trained_path: str, shap_samples_path: str, valid_treatment_combinations: dict, settings: Settings) -> None:
+        self.trained_path = trained_path
+        self.shap_samples_path = shap_samples_path
+        self.valid_treatment_combinations = valid_treatment_combinations
+        self.settings = settings
+        self.preprocessor = self.tnm_stage_medians = self.record_converter = None
+        self.model = self.shap_explainer = self.patients_like_me_model = None
+
+
+@pytest.fixture
+def start_server(monkeypatch):
+    """Runs a blocking call that ends in `serve` in a thread on an ephemeral port and returns its base URL; stopped after the test."""
+    def predict_treatment_scenarios(patient_data, **kwargs):
+        if patient_data.get("fail"):
+            raise RuntimeError("model failed")
+        assert kwargs["valid_treatment_combinations"] == {"FOLFOX": {}, "No Treatment": {}}
+        return SCENARIOS
+
+    monkeypatch.setattr(predictor, "build_request_context", lambda *args: None)
+    monkeypatch.setattr(predictor, "predict_treatment_scenarios", predict_treatment_scenarios)
+    monkeypatch.setattr(predictor, "get_patient_like_me", lambda patient_data, **kwargs: SUMMARY)
+
+    servers, threads = [], []
+    started = threading.Event()
+
+    class RecordedHTTPServer(prediction_server.HTTPServer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            servers.append(self)
+            started.set()
+
+    monkeypatch.setattr(prediction_server, "HTTPServer", RecordedHTTPServer)
+
+    def start(run) -> str:
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        threads.append(thread)
+        assert started.wait(timeout=10)
+        host, port = servers[0].server_address
+        return f"http://{host}:{port}"
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+    for thread in threads:
+        thread.join(timeout=10)
+        assert not thread.is_alive()
+
+
+def request(url: str, body: bytes = None):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=body), timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_serve_answers_health_and_predict(start_server):
+    service = StubService("trained", "samples.csv", {"FOLFOX": {}, "No Treatment": {}}, Settings(save_models=False))
+    url = start_server(lambda: prediction_server.serve(service, port=0))
+
+    assert request(url + "/health") == (200, {"status": "ok"})
+    assert request(url + "/predict", json.dumps({"patientId": "p1"}).encode()) == (200, {"predictions": SCENARIOS, "similarPatientsSummary": SUMMARY})
+    assert request(url + "/unknown") == (404, {})
+
+
+def test_serve_survives_bad_requests(start_server):
+    service = StubService("trained", "samples.csv", {"FOLFOX": {}, "No Treatment": {}}, Settings(save_models=False))
+    url = start_server(lambda: prediction_server.serve(service, port=0))
+
+    assert request(url + "/predict", b"{not json") == (400, {})
+    assert request(url + "/predict", json.dumps({"fail": True}).encode()) == (500, {})
+    assert request(url + "/health") == (200, {"status": "ok"})
+    assert request(url + "/predict", json.dumps({"patientId": "p1"}).encode())[0] == 200
+
+
+def test_run_server_serves_the_treatment_config(start_server, monkeypatch, tmp_path):
+    monkeypatch.setattr(run_prediction, "PredictionService", StubService)
+    treatment_config = tmp_path / "treatments.json"
+    treatment_config.write_text(json.dumps({"FOLFOX": {}, "No Treatment": {}}))
+    args = argparse.Namespace(treatment_config=str(treatment_config), trained_path="trained", shap_samples_path="samples.csv",
+                              host="127.0.0.1", port=0)
+    url = start_server(lambda: run_prediction.run_server(args, Settings(save_models=False)))
+
+    assert request(url + "/predict", json.dumps({"patientId": "p1"}).encode()) == (200, {"predictions": SCENARIOS, "similarPatientsSummary": SUMMARY})
@@ -1,5 +1,7 @@
 import pandas as pd
-from predictor import load_patient_df, MALIGNANCY_ICD_CODES
+import predictor
+
+from predictor import load_patient_df, load_patients_df, build_treatment_scenarios, get_patient_like_me, RequestContext, MALIGNANCY_ICD_CODES
 
 
 class TestPredictor:
@@ -128,3 +130,69 @@ class TestPredictor:
         assert df.iloc[0]['ageAtMetastaticDiagnosis'] == 0
         assert pd.isna(df.iloc[0]['clinicalTnmT'])
         assert pd.isna(df.iloc[0]['sex'])
+
+    def test_bulk_conversion_matches_load_patient_df(self):
+        tnm_medians = {
+            "clinical": {
+                **self.EXAMPLE_TNM_MEDIANS["clinical"],
+                "IIIA": {"clinicalTnmT": 3.0, "clinicalTnmN": 1.0, "clinicalTnmM": 0.0},
+                "iiib ": {"clinicalTnmT": 4.0, "clinicalTnmN": None, "clinicalTnmM": 0.0},
+                "II": {"clinicalTnmT": 2.0},
+                "IIA": {"clinicalTnmN": 0.5},
+            },
+            "pathological": self.EXAMPLE_TNM_MEDIANS["pathological"],
+        }
+        patients = []
+        for stage in ["IV", " iv", "III", "IIIB", "II", "IIA", "I", None]:
+            for comorbidities in [[], [{"icdCodes": [{"mainCode": "E11.21"}, {"mainCode": "I6"}]}], [{"icdCodes": [{"mainCode": "N18"}]}, {}]]:
+                patient = self.example_patient()
+                patient["tumor"]["stage"] = stage
+                patient["comorbidities"] = comorbidities
+                patients.append(patient)
+        patients.append({})
+
+        def with_none_for_missing(df):
+            return df.astype(object).where(df.notna(), None)
+
+        bulk = with_none_for_missing(load_patients_df(patients, tnm_medians, self.settings))
+
+        assert len(bulk) == len(patients)
+        for i, patient in enumerate(patients):
+            expected = with_none_for_missing(load_patient_df(patient, tnm_medians, self.settings))
+            pd.testing.assert_frame_equal(bulk.iloc[[i]].reset_index(drop=True), expected)
+
+    def test_build_treatment_scenarios(self):
+        X_base = pd.DataFrame([{
+            "ageAtMetastaticDiagnosis": 0.3,
+            "systemicTreatmentPlan_5-FU": 1,
+            "systemicTreatmentPlan_oxaliplatin": 1,
+            "hasTreatment": 1,
+        }])
+        combinations = {
+            "No Treatment": {"systemicTreatmentPlan_5-FU": 0, "systemicTreatmentPlan_oxaliplatin": 0},
+            "5-FU": {"systemicTreatmentPlan_5-FU": 1, "systemicTreatmentPlan_oxaliplatin": 0, "systemicTreatmentPlan_nivolumab": 0},
+        }
+        X_scenarios = build_treatment_scenarios(X_base, combinations)
+
+        assert X_scenarios.index.tolist() == ["No Treatment", "5-FU"]
+        assert X_scenarios.columns.tolist() == X_base.columns.tolist()
+        assert X_scenarios["ageAtMetastaticDiagnosis"].tolist() == [0.3, 0.3]
+        assert X_scenarios["systemicTreatmentPlan_5-FU"].tolist() == [0, 1]
+        assert X_scenarios["hasTreatment"].tolist() == [0, 1]
+        assert X_base["systemicTreatmentPlan_5-FU"].iloc[0] == 1
+
+    def test_get_patient_like_me_uses_request_context(self, monkeypatch):
+        processed_df = pd.DataFrame([{"ageAtMetastaticDiagnosis": 0.3}])
+        context = RequestContext(patient_data=self.example_patient(), processed_df=processed_df)
+
+        class SimilarPatients:
+            def find_similar_patients(self, df):
+                assert df is processed_df
+                return pd.DataFrame({"overallTreatmentProportion": [0.6, 0.4], "similarPatientsTreatmentProportion": [1.0, 0.0]}, index=["5-FU", "No Treatment"])
+
+        def fail(*args, **kwargs):
+            raise AssertionError("patient was preprocessed again")
+        monkeypatch.setattr(predictor, "convert_patient_dict_to_processed_df", fail)
+
+        summary = get_patient_like_me(context.patient_data, "unused", self.settings, model=SimilarPatients(), context=context)
+        assert summary["similarPatientsTreatmentProportion"] == [{"treatment": "5-FU", "proportion": 1.0}, {"treatment": "No Treatment", "proportion": 0.0}]
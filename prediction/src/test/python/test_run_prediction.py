@@ -0,0 +1,62 @@
+import argparse
+import json
+
+import pytest
+
+import run_prediction
+
+from utils.settings import Settings
+
+PATIENTS = [{"patientId": "p1"}, {"patientId": "p2", "fail": True}, {"patientId": "p3"}]
+
+
+class StubService:
+    def __init__(self, trained_path: str, shap_samples_path: str, valid_treatment_combinations: dict, settings: Settings) -> None:
+        self.valid_treatment_combinations = valid_treatment_combinations
+
+    def predict(self, patient_data: dict) -> dict:
+        if patient_data.get("fail"):
+            raise RuntimeError("model failed")
+        return {"predictions": [{"treatment": t} for t in self.valid_treatment_combinations], "similarPatientsSummary": {}}
+
+
+def write_jsonl(tmp_path) -> str:
+    path = tmp_path / "patients.jsonl"
+    lines = [json.dumps(PATIENTS[0]), json.dumps(PATIENTS[1]), "", "{not json", json.dumps(PATIENTS[2])]
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def write_directory(tmp_path) -> str:
+    directory = tmp_path / "patients"
+    directory.mkdir()
+    for name, patient in zip(["a.json", "b.json", "d.json"], PATIENTS):
+        (directory / name).write_text(json.dumps(patient))
+    (directory / "c.json").write_text("{not json")
+    (directory / "notes.txt").write_text("not a patient record")
+    return str(directory)
+
+
+@pytest.mark.parametrize("write_input, sources", [
+    (write_jsonl, ["line 1", "line 2", "line 4", "line 5"]),
+    (write_directory, ["a.json", "b.json", "c.json", "d.json"]),
+])
+def test_run_batch_writes_one_line_per_patient(write_input, sources, tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(run_prediction, "PredictionService", StubService)
+    treatment_config = tmp_path / "treatments.json"
+    treatment_config.write_text(json.dumps({"FOLFOX": {}, "No Treatment": {}}))
+    args = argparse.Namespace(input_path=write_input(tmp_path), output_path=str(tmp_path / "results.jsonl"),
+                              treatment_config=str(treatment_config), trained_path="trained", shap_samples_path="samples.csv")
+
+    with caplog.at_level("INFO", logger=run_prediction.__name__):
+        run_prediction.run_batch(args, Settings(save_models=False))
+
+    with open(args.output_path) as f:
+        records = [json.loads(line) for line in f]
+    assert [record["source"] for record in records] == sources
+    assert [record["patientId"] for record in records] == ["p1", "p2", None, "p3"]
+    assert records[0]["result"]["predictions"] == [{"treatment": "FOLFOX"}, {"treatment": "No Treatment"}]
+    assert records[1]["error"] == "Prediction failed: model failed"
+    assert records[2]["error"].startswith("Failed to load input data: ")
+    assert "error" not in records[3] and "result" in records[3]
+    assert "Batch prediction completed: 2 succeeded, 2 failed" in caplog.text
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+import predictor
+
+HEAVY_MODULES = ["torch", "shap", "sksurv", "pycox", "sklearn", "matplotlib"]
+
+
+def test_importing_entry_point_does_not_load_heavy_libraries():
+    source_dir = os.path.dirname(os.path.abspath(predictor.__file__))
+    code = (
+        "import sys, run_prediction; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=source_dir,
+        env={**os.environ, "PYTHONPATH": source_dir},
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    assert result.stdout.strip() == ""
@@ -0,0 +1,26 @@
+import json
+import os
+
+from utils.artifact_cache import clear_artifact_cache, load_artifact, read_json
+
+
+def test_artifact_is_reloaded_only_when_the_file_changes(tmp_path):
+    path = tmp_path / "tnm_stage_medians.json"
+    path.write_text(json.dumps({"clinical": {}}))
+    loads = []
+
+    def loader(p):
+        loads.append(p)
+        return read_json(p)
+
+    clear_artifact_cache()
+    first = load_artifact(str(path), loader)
+    assert load_artifact(str(path), loader) is first
+    assert len(loads) == 1
+
+    path.write_text(json.dumps({"clinical": {"IV": {}}}))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert load_artifact(str(path), loader) == {"clinical": {"IV": {}}}
+    assert len(loads) == 2
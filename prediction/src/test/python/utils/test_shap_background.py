@@ -0,0 +1,93 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from models.model_bundle import MODEL_BUNDLE_FILE
+from models.model_trainer import ModelTrainer
+from models.survival_models import CoxPHModel, DeepSurv
+from predictor import build_shap_explainer
+from utils.settings import Settings
+from utils.shap_background import summarize_background, save_background, load_background, find_background
+
+
+def test_summarize_background_returns_weighted_observed_rows(survival_data):
+    X, _ = survival_data(200)
+    data, weights = summarize_background(X, n_samples=10)
+
+    assert data.shape == (10, 4)
+    assert np.isclose(weights.sum(), 1.0)
+    observed_rows = {tuple(row) for row in X.values}
+    assert all(tuple(row) in observed_rows for row in data)
+
+
+def test_summarize_background_keeps_small_sets(survival_data):
+    X, _ = survival_data(5)
+    data, weights = summarize_background(X, n_samples=10)
+
+    np.testing.assert_array_equal(data, X.values)
+    np.testing.assert_allclose(weights, np.full(5, 0.2))
+
+
+def test_background_round_trip(tmp_path, survival_data):
+    X, _ = survival_data(200)
+    data, weights = summarize_background(X, n_samples=10)
+    path = tmp_path / "shap_background.npz"
+    save_background(str(path), data, weights, X.columns.tolist())
+
+    background, loaded_weights = load_background(str(path))
+
+    assert background.columns.tolist() == X.columns.tolist()
+    np.testing.assert_array_equal(background.values, data)
+    np.testing.assert_array_equal(loaded_weights, weights)
+
+
+def test_find_background_resolves_the_file_training_writes(tmp_path, survival_data):
+    X, _ = survival_data(20)
+    assert find_background(str(tmp_path)) is None
+
+    save_background(str(tmp_path / "OS_DeepSurv_shap_background.npz"), X.values, np.full(20, 0.05), X.columns.tolist())
+    assert find_background(str(tmp_path)) == str(tmp_path / "OS_DeepSurv_shap_background.npz")
+
+    save_background(str(tmp_path / "OS_DeepSurv_attention_shap_background.npz"), X.values, np.full(20, 0.05), X.columns.tolist())
+    assert find_background(str(tmp_path), "DeepSurv") == str(tmp_path / "OS_DeepSurv_shap_background.npz")
+    assert find_background(str(tmp_path), "DeepSurv_attention") == str(tmp_path / "OS_DeepSurv_attention_shap_background.npz")
+    with pytest.raises(ValueError):
+        find_background(str(tmp_path))
+
+    save_background(str(tmp_path / "shap_background.npz"), X.values, np.full(20, 0.05), X.columns.tolist())
+    assert find_background(str(tmp_path)) == str(tmp_path / "shap_background.npz")
+
+
+def test_predictor_serves_the_background_saved_by_training(tmp_path, survival_data):
+    X, y = survival_data(100)
+    model = CoxPHModel()
+    model.fit(X, y)
+    ModelTrainer(models={}, settings=Settings(save_path=str(tmp_path), shap_background_size=10)).save_model(model, "CoxPH", X_background=X)
+
+    explainer = build_shap_explainer(model, shap_samples_path=None, trained_path=str(tmp_path))
+
+    expected, weights = load_background(str(tmp_path / "OS_CoxPH_shap_background.npz"))
+    pd.testing.assert_frame_equal(explainer.background, expected)
+    np.testing.assert_allclose(explainer.weights, weights / weights.sum())
+
+
+def test_predictor_picks_the_background_of_the_served_model(tmp_path, survival_data):
+    X, y = survival_data(100)
+    trainer = ModelTrainer(models={}, settings=Settings(save_path=str(tmp_path), shap_background_size=10))
+    for model_name, use_attention in [("DeepSurv", False), ("DeepSurv_attention", True)]:
+        model = DeepSurv(input_size=X.shape[1], epochs=2, use_attention=use_attention)
+        model.fit(X, y)
+        trainer.save_model(model, model_name, X_background=X.iloc[:50] if use_attention else X.iloc[50:])
+    expected, weights = load_background(str(tmp_path / "OS_DeepSurv_attention_shap_background.npz"))
+
+    shutil.copy(tmp_path / "OS_DeepSurv_attention.bundle", tmp_path / MODEL_BUNDLE_FILE)
+    explainer = build_shap_explainer(model, shap_samples_path=None, trained_path=str(tmp_path))
+    pd.testing.assert_frame_equal(explainer.background, expected)
+
+    os.remove(tmp_path / MODEL_BUNDLE_FILE)
+    explainer = build_shap_explainer(model, shap_samples_path=None, trained_path=str(tmp_path))
+    pd.testing.assert_frame_equal(explainer.background, expected)
+    np.testing.assert_allclose(explainer.weights, weights / weights.sum())
@@ -0,0 +1,34 @@
+import torch
+
+from threadpoolctl import threadpool_info
+
+from models.survival_models import CoxPHModel, RandomSurvivalForestModel
+from utils.settings import Settings
+from utils.thread_budget import ThreadBudget
+
+
+def test_budget_splits_cores_between_fold_workers_and_threads():
+    budget = ThreadBudget.from_settings(Settings(n_jobs=4, cpu_budget=32), n_folds=5)
+    assert (budget.fold_workers, budget.threads_per_worker) == (4, 8)
+
+    assert ThreadBudget.from_settings(Settings(n_jobs=8, cpu_budget=32), n_folds=5).threads_per_worker == 6
+    assert ThreadBudget.from_settings(Settings(n_jobs=8, cpu_budget=2), n_folds=5).fold_workers == 2
+    assert ThreadBudget.from_settings(Settings(n_jobs=8, cpu_budget=2), n_folds=5).threads_per_worker == 1
+    assert budget.single_worker().threads_per_worker == 32
+
+
+def test_budget_limits_models_and_restores_torch_and_blas():
+    budget = ThreadBudget(cores=6, fold_workers=3, threads_per_worker=2)
+
+    forest = RandomSurvivalForestModel(n_estimators=10)
+    budget.limit_model(forest)
+    assert forest.model.n_jobs == 2
+    budget.limit_model(CoxPHModel())
+
+    torch_threads, blas_threads = torch.get_num_threads(), [pool["num_threads"] for pool in threadpool_info()]
+    with budget.limits():
+        assert torch.get_num_threads() == 2
+        assert all(pool["num_threads"] <= 2 for pool in threadpool_info())
+
+    assert torch.get_num_threads() == torch_threads
+    assert [pool["num_threads"] for pool in threadpool_info()] == blas_threads